@@ -1,78 +1,49 @@
 import streamlit as st
 import sqlite3
-from database import DATABASE_PATH, get_audit_logs, get_response_info, get_response_details, update_response_detail, get_user_by_username, update_user_allowed_surveys, add_governorate_admin, get_health_admins, update_user, update_survey, get_governorates_list, add_user,  save_survey, delete_survey
+from database import DATABASE_PATH, AUDIT_TABLES, set_audit_user, commit_audited, get_duplicate_response_groups, count_survey_responses, get_report_artifacts, get_responses_page, get_audit_logs, get_response_info, get_response_answers, apply_response_edits, preview_bulk_correction, apply_bulk_correction, get_user_by_username, update_user_allowed_surveys, add_governorate_admin, get_health_admins, update_user, update_survey, get_governorates_list, add_user,  save_survey, delete_survey
 import json
-import pandas as pd
-from datetime import datetime
+from export_views import display_export_panel, display_report_downloads, display_snapshot_panel, poll_pending_jobs
+from analytics_views import display_comparison_report, display_survey_analytics, display_submission_trend, select_survey_for_analytics
+from exports import export_audit_log_csv
+from grid_views import display_data_grid, display_grid_actions
+from validation import (RULE_TYPES, RULE_FIELD_TYPES, SEVERITIES, COMPARE_OPERATORS, OUTLIER_METHODS,
+                        add_validation_rule, delete_validation_rule, get_validation_rules,
+                        get_validation_summary, get_response_findings, run_validation)
+from lazy_imports import LazyModule
+
+pd = LazyModule("pandas")
 
 def show_admin_dashboard():
     st.title("لوحة تحكم النظام")
     
-    tab1, tab2, tab3, tab4, tab5 = st.tabs([
-        "إدارة المستخدمين",
-        "إدارة المحافظات", 
-        "إدارة الإدارات الصحية",     
-        "إدارة الاستبيانات", 
-        "عرض البيانات",
-       
-    ])
-    
-    with tab1:
-        manage_users()
-    
-    with tab2:
-        manage_governorates()
-    
-    with tab3:
-        manage_regions()
-    
-    with tab4:
-        manage_surveys()
-    
-    with tab5:
-        view_data()
-    
+    # قائمة أقسام بدلاً من st.tabs: التبويبات تنفذ محتوى كل الأقسام مع كل نقرة،
+    # أما هنا فيُنفذ القسم المختار فقط
+    sections = {
+        "إدارة المستخدمين": manage_users,
+        "إدارة المحافظات": manage_governorates,
+        "إدارة الإدارات الصحية": manage_regions,
+        "إدارة الاستبيانات": manage_surveys,
+        "عرض البيانات": view_data,
+        "تحليل الإجابات": view_analytics,
+        "سجل التعديلات": view_audit_log,
+    }
+    section = st.radio("القسم", list(sections), horizontal=True,
+                       key="admin_section", label_visibility="collapsed")
+    st.divider()
+    sections[section]()
+    poll_pending_jobs()
         
 def manage_users():
     st.header("إدارة المستخدمين")
     
-    # عرض المستخدمين الحاليين
-    conn = sqlite3.connect(DATABASE_PATH)
-    users = conn.execute('''
-    SELECT u.user_id, u.username, u.role, 
-           COALESCE(g.governorate_name, ga.governorate_name) as governorate_name, 
-           h.admin_name
-    FROM Users u
-    LEFT JOIN HealthAdministrations h ON u.assigned_region = h.admin_id
-    LEFT JOIN Governorates g ON h.governorate_id = g.governorate_id
-    LEFT JOIN (
-        SELECT ga.user_id, g.governorate_name 
-        FROM GovernorateAdmins ga
-        JOIN Governorates g ON ga.governorate_id = g.governorate_id
-    ) ga ON u.user_id = ga.user_id
-    ORDER BY u.user_id
-''').fetchall()
-    conn.close()
-    
-    # عرض جدول المستخدمين
-    for user in users:
-        col1, col2, col3, col4, col5, col6 = st.columns([2, 2, 2, 2, 1, 1])
-        with col1:
-            st.write(user[1])
-        with col2:
-            role = "مسؤول نظام" if user[2] == "admin" else "مسؤول محافظة" if user[2] == "governorate_admin" else "موظف"
-            st.write(role)
-        with col3:
-            st.write(user[3] if user[3] else "غير محدد")
-        with col4:
-            st.write(user[4] if user[4] else "غير محدد")
-        with col5:
-            if st.button("تعديل", key=f"edit_{user[0]}"):
-                st.session_state.editing_user = user[0]
-        with col6:
-            if st.button("حذف", key=f"delete_{user[0]}"):
-                delete_user(user[0])
-                st.rerun()
+    # جدول المستخدمين (بحث وترتيب وترقيم من قاعدة البيانات)
+    selected_user = display_data_grid('users', key="users_grid")
+    action = display_grid_actions(selected_user, key="users_grid")
+    if action == 'edit':
+        st.session_state.editing_user = selected_user
+    elif action == 'delete':
+        if delete_user(selected_user):
+            st.rerun()
     
     if 'editing_user' in st.session_state:
         edit_user_form(st.session_state.editing_user)
@@ -205,16 +176,19 @@ def add_user_form():
                 return
 
             # حفظ المستخدم في قاعدة البيانات
-            if add_user(username, password, role, st.session_state.add_user_form_data['admin_id']):
+            if add_user(username, password, role, st.session_state.add_user_form_data['admin_id'],
+                        acting_user_id=st.session_state.user_id):
                 user_id = get_user_by_username(username)['user_id']
 
                 # ربط مسؤول المحافظة بالمحافظة
                 if role == "governorate_admin":
-                    add_governorate_admin(user_id, st.session_state.add_user_form_data['governorate_id'])
+                    add_governorate_admin(user_id, st.session_state.add_user_form_data['governorate_id'],
+                                          st.session_state.user_id)
 
                 # حفظ الاستبيانات المسموح بها
                 if role != "admin" and st.session_state.add_user_form_data['allowed_surveys']:
-                    update_user_allowed_surveys(user_id, st.session_state.add_user_form_data['allowed_surveys'])
+                    update_user_allowed_surveys(user_id, st.session_state.add_user_form_data['allowed_surveys'],
+                                                st.session_state.user_id)
 
                 st.success(f"تمت إضافة المستخدم {username} بنجاح")
                 st.session_state.add_user_form_data = {
@@ -342,10 +316,11 @@ def edit_user_form(user_id):
             if st.form_submit_button("حفظ التعديلات"):
                 if new_role == "governorate_admin":
                     # تحديث بيانات مسؤول المحافظة
-                    update_user(user_id, new_username, new_role)
+                    update_user(user_id, new_username, new_role, st.session_state.user_id)
                     conn = sqlite3.connect(DATABASE_PATH)
                     try:
                         # حذف أي تعيينات سابقة
+                        set_audit_user(conn, st.session_state.user_id)
                         conn.execute("DELETE FROM GovernorateAdmins WHERE user_id=?", (user_id,))
                         # إضافة التعيين الجديد
                         conn.execute(
@@ -354,15 +329,16 @@ def edit_user_form(user_id):
                         )
                         # تحديث الاستبيانات المسموح بها
                         if new_role != "admin":
-                            update_user_allowed_surveys(user_id, selected_surveys)
-                        conn.commit()
+                            update_user_allowed_surveys(user_id, selected_surveys, st.session_state.user_id)
+                        commit_audited(conn)
                     finally:
                         conn.close()
                 else:
-                    update_user(user_id, new_username, new_role, selected_admin if new_role == "employee" else None)
+                    update_user(user_id, new_username, new_role, st.session_state.user_id,
+                                selected_admin if new_role == "employee" else None)
                     # تحديث الاستبيانات المسموح بها
                     if new_role != "admin":
-                        update_user_allowed_surveys(user_id, selected_surveys)
+                        update_user_allowed_surveys(user_id, selected_surveys, st.session_state.user_id)
                 del st.session_state.editing_user
                 st.rerun()
         with col2:
@@ -379,8 +355,9 @@ def delete_user(user_id):
             st.error("لا يمكن حذف المستخدم لأنه لديه إجابات مسجلة!")
             return False
         
+        set_audit_user(conn, st.session_state.user_id)
         conn.execute("DELETE FROM Users WHERE user_id=?", (user_id,))
-        conn.commit()
+        commit_audited(conn)
         st.success("تم حذف المستخدم بنجاح")
         return True
     except sqlite3.Error as e:
@@ -392,26 +369,14 @@ def delete_user(user_id):
 def manage_surveys():
     st.header("إدارة الاستبيانات")
     
-    # Display existing surveys
-    conn = sqlite3.connect(DATABASE_PATH)
-    surveys = conn.execute("SELECT survey_id, survey_name, created_at, is_active FROM Surveys").fetchall()
-    conn.close()
-    
     # عرض الاستبيانات مع أزرار الإدارة
-    for survey in surveys:
-        col1, col2, col3, col4 = st.columns([4, 2, 1, 1])
-        with col1:
-            st.write(f"**{survey[1]}** (تم الإنشاء في {survey[2]})")
-        with col2:
-            status = "نشط" if survey[3] else "غير نشط"
-            st.write(f"الحالة: {status}")
-        with col3:
-            if st.button("تعديل", key=f"edit_survey_{survey[0]}"):
-                st.session_state.editing_survey = survey[0]
-        with col4:
-            if st.button("حذف", key=f"delete_survey_{survey[0]}"):
-                delete_survey(survey[0])
-                st.rerun()
+    selected_survey = display_data_grid('surveys', key="surveys_grid")
+    action = display_grid_actions(selected_survey, key="surveys_grid")
+    if action == 'edit':
+        st.session_state.editing_survey = selected_survey
+    elif action == 'delete':
+        delete_survey(selected_survey, st.session_state.user_id)
+        st.rerun()
     
     # معالجة تعديل الاستبيان
     if 'editing_survey' in st.session_state:
@@ -536,7 +501,7 @@ def edit_survey(survey_id):
                 # دمج الحقول المعدلة مع الحقول الجديدة
                 all_fields = updated_fields + st.session_state.new_survey_fields
                 
-                if update_survey(survey_id, new_name, is_active, all_fields):
+                if update_survey(survey_id, new_name, is_active, all_fields, st.session_state.user_id):
                     st.success("تم تحديث الاستبيان بنجاح")
                     st.session_state.new_survey_fields = []
                     del st.session_state.editing_survey
@@ -604,9 +569,322 @@ def create_survey_form():
                 st.session_state.create_survey_fields.pop()
         with col3:
             if st.form_submit_button("حفظ الاستبيان") and survey_name:
-                save_survey(survey_name, st.session_state.create_survey_fields, selected_governorates)
+                save_survey(survey_name, st.session_state.create_survey_fields, st.session_state.user_id,
+                            selected_governorates)
                 st.session_state.create_survey_fields = []
                 st.rerun()
+def display_response_filters(conn, survey_id: int) -> dict:
+    """عرض فلاتر الإجابات (تُطبق في قاعدة البيانات) وإرجاعها كقاموس"""
+    governorates = conn.execute(
+        "SELECT governorate_id, governorate_name FROM Governorates ORDER BY governorate_name"
+    ).fetchall()
+    gov_names = dict(governorates)
+
+    with st.expander("🔎 تصفية الإجابات", expanded=False):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            governorate_id = st.selectbox(
+                "المحافظة",
+                options=[None] + [g[0] for g in governorates],
+                format_func=lambda x: "الكل" if x is None else gov_names[x],
+                key=f"filter_gov_{survey_id}"
+            )
+            admins = conn.execute(
+                "SELECT admin_id, admin_name FROM HealthAdministrations WHERE governorate_id = ? ORDER BY admin_name",
+                (governorate_id,)
+            ).fetchall() if governorate_id else []
+            admin_names = dict(admins)
+            admin_id = st.selectbox(
+                "الإدارة الصحية",
+                options=[None] + [a[0] for a in admins],
+                format_func=lambda x: "الكل" if x is None else admin_names[x],
+                key=f"filter_admin_{survey_id}_{governorate_id}"
+            )
+        with col2:
+            username = st.text_input("اسم المستخدم", key=f"filter_user_{survey_id}").strip()
+            status = st.selectbox(
+                "الحالة",
+                options=[None, 'completed', 'draft'],
+                format_func=lambda x: {None: "الكل", 'completed': "مكتملة", 'draft': "مسودة"}[x],
+                key=f"filter_status_{survey_id}"
+            )
+        with col3:
+            date_range = st.date_input("الفترة", value=(), key=f"filter_dates_{survey_id}")
+            finding = st.selectbox(
+                "ملاحظات الجودة",
+                options=[None, 'any'] + list(RULE_TYPES),
+                format_func=lambda x: {None: "الكل", 'any': "أي ملاحظة"}.get(x) or RULE_TYPES[x],
+                key=f"filter_finding_{survey_id}"
+            )
+
+    filters = {'governorate_id': governorate_id, 'admin_id': admin_id, 'status': status, 'finding': finding}
+    if username:
+        user = get_user_by_username(username)
+        # مستخدم غير موجود: معرف مستحيل حتى تكون النتيجة فارغة
+        filters['user_id'] = user['user_id'] if user else -1
+    if len(date_range) == 2:
+        filters['date_from'], filters['date_to'] = date_range
+    return {k: v for k, v in filters.items() if v is not None}
+
+def display_responses_page(survey_id: int, filters: dict, page_size_options=(25, 50, 100, 200)) -> list:
+    """
+    عرض صفحة واحدة من الإجابات مع أزرار التنقل (ترقيم بالمفتاح دون OFFSET)
+    وإرجاع صفوف الصفحة الحالية
+    """
+    cursors_key = f"browse_cursors_{survey_id}"
+    signature_key = f"browse_signature_{survey_id}"
+    page_size = st.selectbox("عدد الصفوف في الصفحة", page_size_options, index=1,
+                             key=f"page_size_{survey_id}")
+
+    # أي تغيير في الفلاتر أو حجم الصفحة يعيد التنقل إلى الصفحة الأولى
+    signature = json.dumps([filters, page_size], sort_keys=True, default=str)
+    if st.session_state.get(signature_key) != signature:
+        st.session_state[signature_key] = signature
+        st.session_state[cursors_key] = [None]
+    cursors = st.session_state[cursors_key]
+
+    rows = get_responses_page(survey_id, filters, after=cursors[-1], page_size=page_size + 1)
+    has_next = len(rows) > page_size
+    rows = rows[:page_size]
+
+    matching = count_survey_responses(survey_id, filters)['total'] if filters else None
+    caption = f"الصفحة {len(cursors)}"
+    if matching is not None:
+        caption += f" - عدد الإجابات المطابقة: {matching}"
+    st.caption(caption)
+
+    df = pd.DataFrame(
+        [(r[0], r[1], r[2], r[3], r[4], "مكتملة" if r[5] else "مسودة") for r in rows],
+        columns=["ID", "المستخدم", "الإدارة الصحية", "المحافظة", "تاريخ التقديم", "الحالة"]
+    )
+    st.dataframe(df, use_container_width=True, hide_index=True)
+
+    col1, col2, _ = st.columns([1, 1, 4])
+    with col1:
+        if st.button("→ السابق", key=f"prev_page_{survey_id}", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+    with col2:
+        if st.button("التالي ←", key=f"next_page_{survey_id}", disabled=not has_next):
+            cursors.append((rows[-1][4], rows[-1][0]))
+            st.rerun()
+    return rows
+
+def display_bulk_correction_panel(conn, survey_id: int):
+    """
+    تصحيح جماعي لقيم حقل واحد في إجابات الاستبيان (خيار أعيدت تسميته أو وحدة خاطئة) ضمن نطاق
+    محافظة وفترة: معاينة عدد الصفوف المتأثرة أولاً ثم التطبيق كعملية واحدة في سجل التعديلات.
+    """
+    preview_key = f"bulk_preview_{survey_id}"
+    fields = conn.execute(
+        "SELECT field_id, field_label, field_type, field_options FROM Survey_Fields WHERE survey_id = ? ORDER BY field_order",
+        (survey_id,)
+    ).fetchall()
+    governorates = conn.execute(
+        "SELECT governorate_id, governorate_name FROM Governorates ORDER BY governorate_name"
+    ).fetchall()
+    gov_names = dict(governorates)
+
+    with st.expander("🛠️ تصحيح جماعي للإجابات"):
+        col1, col2 = st.columns(2)
+        with col1:
+            field = st.selectbox("الحقل", fields, format_func=lambda f: f[1], key=f"bulk_field_{survey_id}")
+            operation = st.radio(
+                "نوع التصحيح",
+                ['replace', 'scale'] if field and field[2] == 'number' else ['replace'],
+                format_func=lambda x: {'replace': "استبدال قيمة", 'scale': "ضرب في معامل (تصحيح الوحدة)"}[x],
+                horizontal=True,
+                key=f"bulk_operation_{survey_id}"
+            )
+        with col2:
+            governorate_id = st.selectbox(
+                "المحافظة",
+                options=[None] + [g[0] for g in governorates],
+                format_func=lambda x: "الكل" if x is None else gov_names[x],
+                key=f"bulk_gov_{survey_id}"
+            )
+            date_range = st.date_input("الفترة", value=(), key=f"bulk_dates_{survey_id}")
+        if not field:
+            return
+
+        col1, col2 = st.columns(2)
+        match_value = None
+        if operation == 'replace':
+            with col1:
+                match_value = st.text_input("القيمة الحالية الخاطئة", key=f"bulk_match_{survey_id}_{field[0]}")
+            with col2:
+                if field[2] == 'dropdown':
+                    new_value = st.selectbox("القيمة الصحيحة", json.loads(field[3]) if field[3] else [],
+                                             key=f"bulk_new_{survey_id}_{field[0]}")
+                else:
+                    new_value = st.text_input("القيمة الصحيحة", key=f"bulk_new_{survey_id}_{field[0]}")
+        else:
+            with col1:
+                new_value = st.number_input("المعامل", value=1.0, format="%.6g", key=f"bulk_factor_{survey_id}_{field[0]}")
+
+        filters = {'governorate_id': governorate_id}
+        if len(date_range) == 2:
+            filters['date_from'], filters['date_to'] = date_range
+        filters = {k: v for k, v in filters.items() if v is not None}
+        signature = json.dumps([field[0], operation, match_value, new_value, filters], default=str)
+
+        if st.button("🔍 معاينة عدد الإجابات المتأثرة", key=f"bulk_preview_btn_{survey_id}"):
+            try:
+                st.session_state[preview_key] = (
+                    signature, preview_bulk_correction(survey_id, field[0], filters, operation, match_value))
+            except (ValueError, sqlite3.Error) as e:
+                st.error(str(e))
+
+        # التطبيق متاح فقط بعد معاينة نفس الإعدادات
+        preview = st.session_state.get(preview_key)
+        if not preview or preview[0] != signature:
+            return
+        result = preview[1]
+        if result['rows'] == 0:
+            st.info("لا توجد إجابات مطابقة")
+            return
+        st.warning(f"سيتم تعديل {result['rows']} قيمة في {result['responses']} إجابة")
+        confirmed = st.checkbox("أؤكد تطبيق التصحيح", key=f"bulk_confirm_{survey_id}")
+        if st.button("تطبيق التصحيح", key=f"bulk_apply_{survey_id}", disabled=not confirmed):
+            try:
+                applied = apply_bulk_correction(survey_id, field[0], filters, operation, match_value,
+                                                new_value, st.session_state.user_id)
+            except (ValueError, sqlite3.Error) as e:
+                st.error(f"تعذر تطبيق التصحيح: {str(e)}")
+            else:
+                del st.session_state[preview_key]
+                st.success(f"تم تعديل {applied['rows']} قيمة في {applied['responses']} إجابة")
+
+def describe_rule(rule: dict, field_labels: dict) -> str:
+    """وصف مختصر لمعاملات قاعدة الجودة"""
+    params = rule['params']
+    if rule['rule_type'] in ('range', 'date_range'):
+        return f"{params.get('min', '')} - {params.get('max', '')}"
+    if rule['rule_type'] == 'options':
+        return "، ".join(params['options'])
+    if rule['rule_type'] == 'compare':
+        return f"{params['op']} {field_labels.get(params['other_field_id'], params['other_field_id'])}"
+    return f"{params['method']} ({params['threshold']:g})"
+
+def display_validation_panel(conn, survey_id: int):
+    """
+    قواعد جودة البيانات للاستبيان: إضافة القواعد وحذفها، وتشغيل التحقق على كل الإجابات أو
+    الجديدة والمعدلة فقط، وملخص الملاحظات (تُستعرض الإجابات المخالفة من فلتر ملاحظات الجودة).
+    """
+    fields = conn.execute(
+        "SELECT field_id, field_label, field_type FROM Survey_Fields WHERE survey_id = ? ORDER BY field_order",
+        (survey_id,)
+    ).fetchall()
+    field_labels = {f[0]: f[1] for f in fields}
+
+    with st.expander("✅ جودة البيانات"):
+        rules = get_validation_rules(survey_id)
+        st.caption("يُتحقق تلقائياً من نوع القيم ومن خيارات القوائم المنسدلة، إضافة إلى القواعد التالية")
+        if rules:
+            st.dataframe(pd.DataFrame(
+                [(r['rule_id'], r['field_label'], RULE_TYPES[r['rule_type']], describe_rule(r, field_labels),
+                  SEVERITIES[r['severity']]) for r in rules],
+                columns=["ID", "الحقل", "القاعدة", "المعاملات", "الدرجة"]
+            ), use_container_width=True, hide_index=True)
+            col1, col2 = st.columns([3, 1])
+            with col1:
+                rule_id = st.selectbox("القاعدة", [r['rule_id'] for r in rules],
+                                       format_func=lambda x: f"قاعدة #{x}", key=f"rule_delete_select_{survey_id}")
+            with col2:
+                st.write("")
+                if st.button("حذف القاعدة", key=f"rule_delete_{survey_id}"):
+                    delete_validation_rule(rule_id)
+                    st.rerun()
+
+        st.markdown("**إضافة قاعدة**")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            field = st.selectbox("الحقل", fields, format_func=lambda f: f[1], key=f"rule_field_{survey_id}")
+        if not field:
+            return
+        rule_types = [t for t, field_types in RULE_FIELD_TYPES.items() if field[2] in field_types]
+        with col2:
+            rule_type = st.selectbox("القاعدة", rule_types, format_func=lambda x: RULE_TYPES[x],
+                                     key=f"rule_type_{survey_id}_{field[0]}")
+        with col3:
+            severity = st.selectbox("الدرجة", list(SEVERITIES), index=1, format_func=lambda x: SEVERITIES[x],
+                                    key=f"rule_severity_{survey_id}")
+
+        params = {}
+        col1, col2 = st.columns(2)
+        if rule_type in ('range', 'date_range'):
+            with col1:
+                params['min'] = st.text_input("الحد الأدنى", key=f"rule_min_{survey_id}_{rule_type}")
+            with col2:
+                params['max'] = st.text_input("الحد الأقصى" + (" (أو today)" if rule_type == 'date_range' else ""),
+                                              key=f"rule_max_{survey_id}_{rule_type}")
+        elif rule_type == 'options':
+            with col1:
+                params['options'] = st.text_area("الخيارات المسموحة (خيار في كل سطر)",
+                                                 key=f"rule_options_{survey_id}").splitlines()
+        elif rule_type == 'compare':
+            others = [f[0] for f in fields if f[2] == field[2] and f[0] != field[0]]
+            with col1:
+                params['op'] = st.selectbox("يجب أن تكون قيمة الحقل", list(COMPARE_OPERATORS),
+                                            key=f"rule_op_{survey_id}")
+            with col2:
+                params['other_field_id'] = st.selectbox("قيمة الحقل", others, format_func=field_labels.get,
+                                                        key=f"rule_other_{survey_id}_{field[0]}")
+        elif rule_type == 'outlier':
+            with col1:
+                params['method'] = st.selectbox(
+                    "الطريقة", list(OUTLIER_METHODS),
+                    format_func=lambda x: {'iqr': "المدى الربيعي (IQR)", 'zscore': "الانحراف المعياري (z)"}[x],
+                    key=f"rule_method_{survey_id}")
+            with col2:
+                params['threshold'] = st.number_input("المعامل", value=OUTLIER_METHODS[params['method']],
+                                                      min_value=0.1, key=f"rule_threshold_{survey_id}_{params['method']}")
+        if rule_type and st.button("➕ إضافة القاعدة", key=f"rule_add_{survey_id}"):
+            try:
+                add_validation_rule(survey_id, field[0], rule_type, params, severity)
+                st.rerun()
+            except (ValueError, TypeError, KeyError) as e:
+                st.error(f"قاعدة غير صالحة: {str(e)}")
+
+        st.markdown("**التحقق**")
+        col1, col2 = st.columns(2)
+        with col1:
+            run_full = st.button("تشغيل على كل الإجابات", key=f"validate_full_{survey_id}")
+        with col2:
+            run_new = st.button("تشغيل على الإجابات الجديدة والمعدلة فقط", key=f"validate_new_{survey_id}")
+        if run_full or run_new:
+            with st.spinner("جاري التحقق من الإجابات..."):
+                result = run_validation(survey_id, incremental=run_new)
+            st.success(f"تم فحص {result['answers']} قيمة في {result['seconds']:.1f} ثانية - "
+                       f"ملاحظات جديدة: {result['findings']}")
+
+        summary = get_validation_summary(survey_id)
+        if summary['run']:
+            st.caption(f"آخر تشغيل: {summary['run'][0]} - حتى الإجابة #{summary['run'][2]}")
+        if summary['counts']:
+            st.dataframe(pd.DataFrame(
+                [(label, RULE_TYPES[rule_type], SEVERITIES[severity], findings, responses)
+                 for label, rule_type, severity, findings, responses in summary['counts']],
+                columns=["الحقل", "القاعدة", "الدرجة", "الملاحظات", "الإجابات"]
+            ), use_container_width=True, hide_index=True)
+
+def display_duplicates_panel(survey_id: int):
+    """مجموعات الإجابات المكتملة المتطابقة المحتوى (نموذج ورقي أُدخل أكثر من مرة)"""
+    with st.expander("🧬 الإجابات المكررة"):
+        if not st.checkbox("البحث عن الإجابات المكررة", key=f"duplicates_{survey_id}"):
+            return
+        result = get_duplicate_response_groups(survey_id)
+        if not result['groups']:
+            st.info("لا توجد إجابات مكتملة متطابقة المحتوى")
+            return
+        st.caption(f"{result['extra']} إجابة زائدة في مجموعات متطابقة - "
+                   "افتح أي إجابة برقمها من 'الانتقال مباشرة إلى إجابة رقم' لمراجعتها")
+        st.dataframe(pd.DataFrame(
+            [(copies, "، ".join(f"#{i}" for i in ids), "، ".join(users), first, last)
+             for copies, ids, users, first, last in result['groups']],
+            columns=["عدد النسخ", "الإجابات", "المستخدمون", "أول تقديم", "آخر تقديم"]
+        ), use_container_width=True, hide_index=True)
+
 def display_survey_data(survey_id):
     """عرض بيانات استجابات الاستبيان وتصدير شامل لجميع البيانات"""
     conn = sqlite3.connect(DATABASE_PATH)
@@ -625,130 +903,59 @@ def display_survey_data(survey_id):
         survey_name = survey_name[0]
         st.subheader(f"بيانات الاستبيان: {survey_name}")
 
-        # الحصول على عدد الإجابات
-        total_responses = conn.execute(
-            "SELECT COUNT(*) FROM Responses WHERE survey_id = ?", 
-            (survey_id,)
-        ).fetchone()[0]
-
-        if total_responses == 0:
+        # الإحصائيات من جدول التجميع بدلاً من جلب جميع الإجابات
+        totals = count_survey_responses(survey_id)
+        if totals['total'] == 0:
             st.info("لا توجد بيانات متاحة لهذا الاستبيان بعد")
             return
 
-        # الحصول على جميع الإجابات
-        responses = conn.execute('''
-            SELECT r.response_id, u.username, h.admin_name, g.governorate_name,
-                   r.submission_date, r.is_completed
-            FROM Responses r
-            JOIN Users u ON r.user_id = u.user_id
-            JOIN HealthAdministrations h ON r.region_id = h.admin_id
-            JOIN Governorates g ON h.governorate_id = g.governorate_id
-            WHERE r.survey_id = ?
-            ORDER BY r.submission_date DESC
-        ''', (survey_id,)).fetchall()
-
-        # عرض الإحصائيات
-        completed_responses = sum(1 for r in responses if r[5])
-        regions_count = len(set(r[2] for r in responses))
-
         col1, col2, col3 = st.columns(3)
         with col1:
-            st.metric("إجمالي الإجابات", total_responses)
+            st.metric("إجمالي الإجابات", totals['total'])
         with col2:
-            st.metric("الإجابات المكتملة", completed_responses)
+            st.metric("الإجابات المكتملة", totals['completed'])
         with col3:
-            st.metric("عدد المناطق", regions_count)
+            st.metric("عدد المناطق", totals['regions'])
 
-        # تحضير البيانات للعرض في DataFrame
-        df = pd.DataFrame(
-            [(r[0], r[1], r[2], r[3], r[4], "مكتملة" if r[5] else "مسودة") for r in responses],
-            columns=["ID", "المستخدم", "الإدارة الصحية", "المحافظة", "تاريخ التقديم", "الحالة"]
-        )
+        filters = display_response_filters(conn, survey_id)
+        responses = display_responses_page(survey_id, filters)
         
-        # عرض البيانات
-        st.dataframe(df)
-        
-        # زر تصدير شامل لجميع البيانات
-        if st.button("تصدير شامل لجميع البيانات إلى Excel", key=f"export_excel_{survey_id}"):
-            # إنشاء اسم ملف مناسب
-            import re
-            from io import BytesIO
-            
-            filename = re.sub(r'[^\w\-_]', '_', survey_name) + "_كامل_" + datetime.now().strftime("%Y%m%d_%H%M") + ".xlsx"
-            
-            # إنشاء ملف Excel متعدد الأوراق
-            with pd.ExcelWriter(filename, engine='openpyxl') as writer:
-                # 1. ورقة ملخص الإجابات
-                df.to_excel(writer, sheet_name='ملخص_الإجابات', index=False)
-                
-                # 2. ورقة تفاصيل جميع الإجابات
-                all_details = []
-                for response in responses:
-                    details = conn.execute('''
-                        SELECT sf.field_label, rd.answer_value, 
-                               u.username as entered_by, 
-                               r.submission_date as entry_date,
-                               r.is_completed
-                        FROM Response_Details rd
-                        JOIN Survey_Fields sf ON rd.field_id = sf.field_id
-                        JOIN Responses r ON rd.response_id = r.response_id
-                        JOIN Users u ON r.user_id = u.user_id
-                        WHERE rd.response_id = ?
-                        ORDER BY sf.field_order
-                    ''', (response[0],)).fetchall()
-                    
-                    for detail in details:
-                        all_details.append({
-                            "ID الإجابة": response[0],
-                            "الحقل": detail[0],
-                            "القيمة": detail[1],
-                            "أدخلها": detail[2],
-                            "تاريخ الإدخال": detail[3],
-                            "حالة الإجابة": "مكتملة" if detail[4] else "مسودة"
-                        })
-                
-                if all_details:
-                    details_df = pd.DataFrame(all_details)
-                    details_df.to_excel(writer, sheet_name='تفاصيل_الإجابات', index=False)
-                
-                # 3. ورقة حقول الاستبيان
-                fields = conn.execute('''
-                    SELECT field_label, field_type, field_options, is_required
-                    FROM Survey_Fields
-                    WHERE survey_id = ?
-                    ORDER BY field_order
-                ''', (survey_id,)).fetchall()
-                
-                fields_df = pd.DataFrame(
-                    [(f[0], f[1], json.loads(f[2]) if f[2] else None, "نعم" if f[3] else "لا") for f in fields],
-                    columns=["اسم الحقل", "نوع الحقل", "الخيارات", "مطلوب"]
-                )
-                fields_df.to_excel(writer, sheet_name='حقول_الاستبيان', index=False)
-                
-                # 4. ورقة المستخدمين الذين أدخلوا بيانات
-                users_df = pd.DataFrame(
-                    [(r[1], r[2], r[3], r[4], "مكتملة" if r[5] else "مسودة") for r in responses],
-                    columns=["المستخدم", "الإدارة الصحية", "المحافظة", "تاريخ التقديم", "الحالة"]
-                )
-                users_df.drop_duplicates().to_excel(writer, sheet_name='المستخدمين', index=False)
-   
-            # تقديم ملف للتنزيل
-            with open(filename, "rb") as f:
-                st.download_button(
-                    label="تنزيل ملف Excel الكامل",
-                    data=f,
-                    file_name=filename,
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    key=f"download_excel_{survey_id}"
-                )
-            st.success("تم إنشاء ملف Excel الشامل بنجاح")
+        # تصدير شامل للبيانات المطابقة للفلاتر في الخلفية
+        display_export_panel(survey_id, survey_name, filters)
+        display_snapshot_panel(survey_id)
+        display_bulk_correction_panel(conn, survey_id)
+        display_validation_panel(conn, survey_id)
+        display_duplicates_panel(survey_id)
 
-        # عرض تفاصيل إجابة محددة
+        # عرض تفاصيل إجابة محددة (من الصفحة الحالية أو بالانتقال المباشر إلى رقمها)
+        selected_key = f"jump_response_{survey_id}"
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            jump_id = st.number_input("الانتقال مباشرة إلى إجابة رقم", min_value=0, step=1,
+                                      key=f"jump_input_{survey_id}")
+        with col2:
+            st.write("")
+            if st.button("فتح الإجابة", key=f"jump_btn_{survey_id}") and jump_id:
+                exists = conn.execute(
+                    "SELECT 1 FROM Responses WHERE response_id = ? AND survey_id = ?",
+                    (int(jump_id), survey_id)
+                ).fetchone()
+                if exists:
+                    st.session_state[selected_key] = int(jump_id)
+                else:
+                    st.error("لا توجد إجابة بهذا الرقم في هذا الاستبيان")
+
+        page_ids = [r[0] for r in responses]
+        jumped_id = st.session_state.get(selected_key)
+        options = ([jumped_id] if jumped_id and jumped_id not in page_ids else []) + page_ids
+        if not options:
+            return
         selected_response_id = st.selectbox(
             "اختر إجابة لعرض وتعديل تفاصيلها",
-            options=[r[0] for r in responses],
+            options=options,
+            index=options.index(jumped_id) if jumped_id in options else 0,
             format_func=lambda x: f"إجابة #{x}",
-            key=f"select_response_{survey_id}"
+            key=f"select_response_{survey_id}_{jumped_id}"
         )
 
         if selected_response_id:
@@ -762,36 +969,43 @@ def display_survey_data(survey_id):
                 **المحافظة:** {response_info[4]}  
                 **تاريخ التقديم:** {response_info[5]}
                 """)
+                findings = get_response_findings([selected_response_id]).get(selected_response_id, [])
+                for label, _, severity, message, value in findings:
+                    if severity == 'error':
+                        st.error(f"{label}: {message} - القيمة: {value}")
+                    else:
+                        st.warning(f"{label}: {message} - القيمة: {value}")
                 
-                details = get_response_details(selected_response_id)
-                updates = {}  # لتخزين التعديلات
+                version_key = f"response_version_{selected_response_id}"
+                version, fields = get_response_answers(selected_response_id)
+                # الإصدار المحفوظ عند فتح الإجابة هو أساس التحقق من التعديل المتزامن
+                expected_version = st.session_state.setdefault(version_key, version)
+                updates = {}  # {field_id: القيمة الجديدة أو None للحذف}
                 
-                # استخدم نموذج لتجميع التعديلات
+                # استخدم نموذج لتجميع التعديلات وحفظها دفعة واحدة
                 with st.form(key=f"edit_response_form_{selected_response_id}"):
-                    for detail in details:
-                        detail_id, field_id, label, field_type, options, answer = detail
-                        
+                    for field_id, label, field_type, options, answer in fields:
                         col1, col2 = st.columns([1, 3])
                         with col1:
                             st.markdown(f"**{label}**")
                         with col2:
                             if field_type == 'dropdown':
-                                options_list = json.loads(options) if options else []
+                                options_list = [""] + (json.loads(options) if options else [])
                                 new_value = st.selectbox(
                                     label,
                                     options_list,
                                     index=options_list.index(answer) if answer in options_list else 0,
-                                    key=f"dropdown_{detail_id}_{selected_response_id}"
+                                    key=f"dropdown_{field_id}_{selected_response_id}"
                                 )
                             else:
                                 new_value = st.text_input(
                                     label,
-                                    value=answer,
-                                    key=f"input_{detail_id}_{selected_response_id}"
+                                    value=answer or "",
+                                    key=f"input_{field_id}_{selected_response_id}"
                                 )
                             
-                            if new_value != answer:
-                                updates[detail_id] = new_value
+                            if new_value != (answer or ""):
+                                updates[field_id] = new_value or None
                     
                     # زر حفظ التعديلات
                     col1, col2 = st.columns(2)
@@ -799,21 +1013,22 @@ def display_survey_data(survey_id):
                         save_clicked = st.form_submit_button("💾 حفظ جميع التعديلات")
                         if save_clicked:
                             if updates:
-                                success_count = 0
-                                for detail_id, new_value in updates.items():
-                                    if update_response_detail(detail_id, new_value):
-                                        success_count += 1
-                                
-                                if success_count == len(updates):
-                                    st.success("تم تحديث جميع التعديلات بنجاح")
+                                new_version, error = apply_response_edits(
+                                    selected_response_id, updates, st.session_state.user_id, expected_version
+                                )
+                                if error:
+                                    st.session_state.pop(version_key, None)
+                                    st.error(error)
                                 else:
-                                    st.error(f"تم تحديث {success_count} من أصل {len(updates)} تعديلات")
-                                st.rerun()
+                                    st.session_state[version_key] = new_version
+                                    st.success(f"تم حفظ {len(updates)} تعديل بنجاح")
+                                    st.rerun()
                             else:
                                 st.info("لم تقم بإجراء أي تعديلات")
                     with col2:
                         cancel_clicked = st.form_submit_button("❌ إلغاء التعديلات")
                         if cancel_clicked:
+                            st.session_state.pop(version_key, None)
                             st.rerun()
     except sqlite3.Error as e:
         st.error(f"حدث خطأ في قاعدة البيانات: {str(e)}")
@@ -832,6 +1047,12 @@ def view_data():
         if not surveys:
             st.warning("لا توجد استبيانات متاحة")
             return
+
+        with st.expander("📊 تقرير مقارنة المحافظات"):
+            display_comparison_report(surveys)
+
+        with st.expander("📁 التقارير الجاهزة على مستوى الجمهورية (تُحدَّث ليلاً)"):
+            display_report_downloads(get_report_artifacts(), dict(surveys), key_prefix="national_reports")
             
         selected_survey = st.selectbox(
             "اختر استبيان",
@@ -847,25 +1068,35 @@ def view_data():
     finally:
         conn.close()
 
+def view_analytics():
+    st.header("تحليل الإجابات")
+
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        surveys = conn.execute(
+            "SELECT survey_id, survey_name FROM Surveys ORDER BY survey_name"
+        ).fetchall()
+    except sqlite3.Error as e:
+        st.error(f"حدث خطأ في قاعدة البيانات: {str(e)}")
+        return
+    finally:
+        conn.close()
+
+    survey_id = select_survey_for_analytics(surveys, key="analytics_survey_select")
+    if survey_id:
+        st.subheader("حجم الإجابات عبر الزمن")
+        display_submission_trend(survey_id)
+        display_survey_analytics(survey_id)
+
 def manage_governorates():
     st.header("إدارة المحافظات")
-    conn = sqlite3.connect(DATABASE_PATH)
-    governorates = conn.execute("SELECT governorate_id, governorate_name, description FROM Governorates").fetchall()
-    conn.close()
-    
-    for gov in governorates:
-        col1, col2, col3, col4 = st.columns([4, 3, 1, 1])
-        with col1:
-            st.write(f"**{gov[1]}**")
-        with col2:
-            st.write(gov[2] if gov[2] else "لا يوجد وصف")
-        with col3:
-            if st.button("تعديل", key=f"edit_gov_{gov[0]}"):
-                st.session_state.editing_gov = gov[0]
-        with col4:
-            if st.button("حذف", key=f"delete_gov_{gov[0]}"):
-                delete_governorate(gov[0])
-                st.rerun()
+    selected_gov = display_data_grid('governorates', key="governorates_grid")
+    action = display_grid_actions(selected_gov, key="governorates_grid")
+    if action == 'edit':
+        st.session_state.editing_gov = selected_gov
+    elif action == 'delete':
+        if delete_governorate(selected_gov):
+            st.rerun()
     
     if 'editing_gov' in st.session_state:
         edit_governorate(st.session_state.editing_gov)
@@ -886,11 +1117,12 @@ def manage_governorates():
                         if existing:
                             st.error("هذه المحافظة موجودة بالفعل!")
                         else:
+                            set_audit_user(conn, st.session_state.user_id)
                             conn.execute(
                                 "INSERT INTO Governorates (governorate_name, description) VALUES (?, ?)",
                                 (governorate_name, description)
                             )
-                            conn.commit()
+                            commit_audited(conn)
                             st.success("تمت إضافة المحافظة بنجاح")
                             st.rerun()
                     except sqlite3.Error as e:
@@ -920,11 +1152,12 @@ def edit_governorate(gov_id):
                     if existing:
                         st.error("هذا الاسم مستخدم بالفعل لمحافظة أخرى!")
                     else:
+                        set_audit_user(conn, st.session_state.user_id)
                         conn.execute(
                             "UPDATE Governorates SET governorate_name=?, description=? WHERE governorate_id=?",
                             (new_name, new_desc, gov_id)
                         )
-                        conn.commit()
+                        commit_audited(conn)
                         st.success("تم تحديث المحافظة بنجاح")
                         del st.session_state.editing_gov
                         st.rerun()
@@ -946,8 +1179,9 @@ def delete_governorate(gov_id):
             st.error("لا يمكن حذف المحافظة لأنها تحتوي على إدارات صحية!")
             return False
         
+        set_audit_user(conn, st.session_state.user_id)
         conn.execute("DELETE FROM Governorates WHERE governorate_id=?", (gov_id,))
-        conn.commit()
+        commit_audited(conn)
         st.success("تم حذف المحافظة بنجاح")
         return True
     except sqlite3.Error as e:
@@ -959,28 +1193,13 @@ def delete_governorate(gov_id):
 def manage_regions():
     st.header("إدارة الإدارات الصحية")
     
-    conn = sqlite3.connect(DATABASE_PATH)
-    regions = conn.execute('''
-        SELECT h.admin_id, h.admin_name, h.description, g.governorate_name 
-        FROM HealthAdministrations h
-        JOIN Governorates g ON h.governorate_id = g.governorate_id
-    ''').fetchall()
-    conn.close()
-    for reg in regions:
-        col1, col2, col3, col4, col5 = st.columns([3, 3, 2, 1, 1])
-        with col1:
-            st.write(f"**{reg[1]}**")
-        with col2:
-            st.write(reg[2] if reg[2] else "لا يوجد وصف")
-        with col3:
-            st.write(reg[3])
-        with col4:
-            if st.button("تعديل", key=f"edit_reg_{reg[0]}"):
-                st.session_state.editing_reg = reg[0]
-        with col5:
-            if st.button("حذف", key=f"delete_reg_{reg[0]}"):
-                delete_health_admin(reg[0])
-                st.rerun()
+    selected_reg = display_data_grid('regions', key="regions_grid")
+    action = display_grid_actions(selected_reg, key="regions_grid")
+    if action == 'edit':
+        st.session_state.editing_reg = selected_reg
+    elif action == 'delete':
+        if delete_health_admin(selected_reg):
+            st.rerun()
     if 'editing_reg' in st.session_state:
         edit_health_admin(st.session_state.editing_reg)
     
@@ -1015,11 +1234,12 @@ def manage_regions():
                         if existing:
                             st.error("هذه الإدارة الصحية موجودة بالفعل في هذه المحافظة!")
                         else:
+                            set_audit_user(conn, st.session_state.user_id)
                             conn.execute(
                                 "INSERT INTO HealthAdministrations (admin_name, description, governorate_id) VALUES (?, ?, ?)",
                                 (admin_name, description, governorate_id)
                             )
-                            conn.commit()
+                            commit_audited(conn)
                             st.success("تمت إضافة الإدارة الصحية بنجاح")
                             st.rerun()
                     except sqlite3.Error as e:
@@ -1069,11 +1289,12 @@ def edit_health_admin(admin_id):
                     if existing:
                         st.error("هذا الاسم مستخدم بالفعل لإدارة صحية أخرى في هذه المحافظة!")
                     else:
+                        set_audit_user(conn, st.session_state.user_id)
                         conn.execute(
                             "UPDATE HealthAdministrations SET admin_name=?, description=?, governorate_id=? WHERE admin_id=?",
                             (new_name, new_desc, new_gov, admin_id)
                         )
-                        conn.commit()
+                        commit_audited(conn)
                         st.success("تم تحديث الإدارة الصحية بنجاح")
                         del st.session_state.editing_reg
                         st.rerun()
@@ -1095,8 +1316,9 @@ def delete_health_admin(admin_id):
             st.error("لا يمكن حذف الإدارة الصحية لأنها مرتبطة بمستخدمين!")
             return False
         
+        set_audit_user(conn, st.session_state.user_id)
         conn.execute("DELETE FROM HealthAdministrations WHERE admin_id=?", (admin_id,))
-        conn.commit()
+        commit_audited(conn)
         st.success("تم حذف الإدارة الصحية بنجاح")
         return True
     except sqlite3.Error as e:
@@ -1142,25 +1364,81 @@ def export_to_excel(data):
     
     st.success("تم إنشاء ملف التصدير بنجاح")
 
-def export_to_csv(data):
-    """تصدير البيانات إلى ملف CSV"""
+AUDIT_ACTIONS = {None: "الكل", 'INSERT': "إضافة", 'UPDATE': "تعديل", 'DELETE': "حذف", 'BULK_UPDATE': "تصحيح جماعي"}
+
+def view_audit_log(page_size: int = 50):
+    """سجل التعديلات بفلاتر وصفحات (ترقيم بالمفتاح) وتصدير CSV بنفس الفلاتر"""
+    st.header("سجل التعديلات")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        table_name = st.selectbox("الجدول", [None] + list(AUDIT_TABLES),
+                                  format_func=lambda x: "الكل" if x is None else x, key="audit_table")
+        action_type = st.selectbox("الإجراء", list(AUDIT_ACTIONS), format_func=AUDIT_ACTIONS.get,
+                                   key="audit_action")
+    with col2:
+        username = st.text_input("اسم المستخدم", key="audit_username").strip()
+        search_query = st.text_input("🔍 بحث في القيم", key="audit_search").strip()
+    with col3:
+        date_range = st.date_input("الفترة", value=(), key="audit_dates")
+
+    filters = {'table_name': table_name, 'action_type': action_type, 'username': username or None,
+               'date_range': tuple(date_range) if len(date_range) == 2 else None,
+               'search_query': search_query or None}
+    signature = json.dumps(filters, sort_keys=True, default=str)
+    if st.session_state.get("audit_signature") != signature:
+        st.session_state.audit_signature = signature
+        st.session_state.audit_cursors = [None]
+    cursors = st.session_state.audit_cursors
+
+    logs = get_audit_logs(**filters, before_id=cursors[-1], limit=page_size + 1)
+    has_next = len(logs) > page_size
+    logs = logs[:page_size]
+    if not logs:
+        st.info("لا توجد سجلات مطابقة")
+        return
+    st.dataframe(pd.DataFrame(
+        logs, columns=["ID", "المستخدم", "الإجراء", "الجدول", "رقم السجل", "القيمة القديمة", "القيمة الجديدة", "الوقت"]
+    ), use_container_width=True, hide_index=True)
+
+    col1, col2, col3 = st.columns([1, 1, 2])
+    with col1:
+        if st.button("→ السابق", key="audit_prev", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+    with col2:
+        if st.button("التالي ←", key="audit_next", disabled=not has_next):
+            cursors.append(logs[-1][0])
+            st.rerun()
+    with col3:
+        st.caption(f"الصفحة {len(cursors)}")
+
+    if st.button("📥 تجهيز ملف CSV للسجلات المطابقة", key="audit_export"):
+        export_to_csv(filters)
+
+def export_to_csv(filters=None):
+    """
+    تصدير سجل التعديلات إلى ملف CSV (يُكتب صفحة بصفحة على القرص بنفس فلاتر get_audit_logs).
+    زر التنزيل في Streamlit يقرأ الملف الناتج كاملاً في الذاكرة، فالتصدير الكبير جداً من سطر الأوامر.
+    """
+    import os
     import time
-    
-    df = pd.DataFrame(
-        [(log[0], log[1], log[2], log[3], log[4], 
-         log[5], log[6], log[7]) for log in data],
-        columns=["ID", "المستخدم", "الإجراء", "الجدول", "رقم السجل", 
-                 "القيمة القديمة", "القيمة الجديدة", "الوقت"]
-    )
+    import tempfile
     
     timestamp = time.strftime("%Y%m%d_%H%M%S")
     filename = f"audit_logs_export_{timestamp}.csv"
     
-    st.download_button(
-        label="⬇️ تنزيل ملف CSV",
-        data=df.to_csv(index=False, encoding='utf-8-sig'),
-        file_name=filename,
-        mime="text/csv"
-    )
+    fd, path = tempfile.mkstemp(suffix=".csv")
+    os.close(fd)
+    try:
+        export_audit_log_csv(path, filters)
+        with open(path, "rb") as f:
+            st.download_button(
+                label="⬇️ تنزيل ملف CSV",
+                data=f,
+                file_name=filename,
+                mime="text/csv"
+            )
+    finally:
+        os.remove(path)
     
     st.success("تم إنشاء ملف التصدير بنجاح")
@@ -0,0 +1,112 @@
+from __future__ import annotations
+import sqlite3
+from typing import Dict, Optional
+from lazy_imports import LazyModule
+from database import DATABASE_PATH, build_response_filters
+
+# pandas و numpy يُحمّلان عند أول تحليل فقط وليس عند فتح الصفحات
+np = LazyModule("numpy")
+pd = LazyModule("pandas")
+
+# مستويات التجميع المتاحة: اسم العمود في إطار البيانات وعنوانه للعرض
+GROUP_BY_COLUMNS = {
+    'governorate': ("governorate_name", "المحافظة"),
+    'admin': ("admin_name", "الإدارة الصحية"),
+}
+HISTOGRAM_BINS = 20
+
+ANSWERS_QUERY = '''
+    SELECT rd.response_id, rd.field_id, sf.field_label, sf.field_type, rd.answer_value,
+           rd.answer_number, rd.answer_date, rd.answer_bool, ha.admin_name, g.governorate_name
+    FROM Response_Details rd
+    JOIN Responses r ON rd.response_id = r.response_id
+    JOIN Survey_Fields sf ON rd.field_id = sf.field_id
+    JOIN HealthAdministrations ha ON r.region_id = ha.admin_id
+    JOIN Governorates g ON ha.governorate_id = g.governorate_id
+    WHERE r.survey_id = ? AND sf.field_type IN ('dropdown', 'checkbox', 'number', 'date'){filters}
+'''
+
+def load_survey_answers(survey_id: int, filters: Optional[Dict] = None) -> pd.DataFrame:
+    """جلب إجابات الحقول القابلة للتحليل في استعلام واحد بصيغة عمودية"""
+    filter_sql, params = build_response_filters(filters)
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        df = pd.read_sql_query(ANSWERS_QUERY.format(filters=filter_sql), conn,
+                               params=[survey_id] + params)
+    finally:
+        conn.close()
+
+    # الأعمدة المتكررة كفئات لتقليل الذاكرة وتسريع التجميع
+    for column in ("field_label", "field_type", "admin_name", "governorate_name"):
+        df[column] = df[column].astype("category")
+    return df
+
+def frequency_tables(df: pd.DataFrame, group_by: str = 'governorate') -> Dict[str, pd.DataFrame]:
+    """جداول تكرار القوائم المنسدلة ومربعات الاختيار لكل حقل موزعة حسب مستوى التجميع"""
+    group_column, _ = GROUP_BY_COLUMNS[group_by]
+    choices = df[df["field_type"].isin(['dropdown', 'checkbox'])].copy()
+    if choices.empty:
+        return {}
+
+    # مربعات الاختيار من العمود المنطقي مباشرة بدلاً من مقارنة النصوص
+    is_checkbox = (choices["field_type"] == 'checkbox').to_numpy()
+    choices["answer_value"] = np.where(
+        is_checkbox, np.where(choices["answer_bool"] == 1, "نعم", "لا"), choices["answer_value"]
+    )
+    choices = choices[~is_checkbox | choices["answer_bool"].notna().to_numpy()]
+    counts = (choices.groupby(["field_label", "answer_value", group_column], observed=True)
+              .size().unstack(group_column, fill_value=0))
+    counts["الإجمالي"] = counts.sum(axis=1)
+
+    return {label: table.droplevel("field_label").sort_values("الإجمالي", ascending=False)
+            for label, table in counts.groupby(level="field_label", observed=True)}
+
+def numeric_summaries(df: pd.DataFrame, group_by: str = 'governorate') -> Dict[str, dict]:
+    """الحد الأدنى والأقصى والمتوسط والربيعات ومدرج تكراري لكل حقل رقمي"""
+    group_column, _ = GROUP_BY_COLUMNS[group_by]
+    numbers = df[(df["field_type"] == 'number') & df["answer_number"].notna()]
+    numbers = numbers.rename(columns={"answer_number": "value"})
+
+    results = {}
+    for label, values in numbers.groupby("field_label", observed=True):
+        stats = values.groupby(group_column, observed=True)["value"].describe()
+        stats.loc["الإجمالي"] = values["value"].describe()
+        counts, edges = np.histogram(values["value"].to_numpy(), bins=HISTOGRAM_BINS)
+        histogram = pd.DataFrame(
+            {"العدد": counts},
+            index=[f"{low:g} - {high:g}" for low, high in zip(edges[:-1], edges[1:])]
+        )
+        results[label] = {
+            'stats': stats.rename(columns={
+                'count': "العدد", 'mean': "المتوسط", 'std': "الانحراف المعياري",
+                'min': "الأدنى", '25%': "الربيع الأول", '50%': "الوسيط",
+                '75%': "الربيع الثالث", 'max': "الأقصى"
+            }),
+            'histogram': histogram,
+        }
+    return results
+
+def date_distributions(df: pd.DataFrame, group_by: str = 'governorate') -> Dict[str, pd.DataFrame]:
+    """توزيع إجابات حقول التاريخ شهرياً حسب مستوى التجميع"""
+    group_column, _ = GROUP_BY_COLUMNS[group_by]
+    dates = df[(df["field_type"] == 'date') & df["answer_date"].notna()].copy()
+    dates["month"] = pd.to_datetime(dates["answer_date"], format="%Y-%m-%d").dt.to_period("M")
+
+    results = {}
+    for label, values in dates.groupby("field_label", observed=True):
+        table = (values.groupby(["month", group_column], observed=True)
+                 .size().unstack(group_column, fill_value=0))
+        table.index = table.index.astype(str)
+        results[label] = table
+    return results
+
+def compute_survey_analytics(survey_id: int, filters: Optional[Dict] = None,
+                             group_by: str = 'governorate') -> Dict:
+    """حساب جميع إحصائيات الاستبيان من جلب واحد للبيانات"""
+    df = load_survey_answers(survey_id, filters)
+    return {
+        'responses': int(df["response_id"].nunique()),
+        'frequencies': frequency_tables(df, group_by),
+        'numeric': numeric_summaries(df, group_by),
+        'dates': date_distributions(df, group_by),
+    }
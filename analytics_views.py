@@ -0,0 +1,141 @@
+import json
+import streamlit as st
+from typing import Dict, List, Optional, Tuple
+from database import get_survey_data_watermark, get_submission_trend
+from analytics import GROUP_BY_COLUMNS, compute_survey_analytics
+from reports import build_comparison_report
+from lazy_imports import LazyModule
+
+pd = LazyModule("pandas")
+
+@st.cache_data(max_entries=64, show_spinner="جاري حساب الإحصائيات...")
+def _cached_survey_analytics(survey_id: int, filters_json: str, group_by: str, watermark: int) -> Dict:
+    """
+    النتائج مخزنة حسب إصدار بيانات الاستبيان (watermark)،
+    فلا تُعاد الحسابات إلا عند وصول إجابات جديدة أو تعديلها
+    """
+    return compute_survey_analytics(survey_id, json.loads(filters_json), group_by)
+
+def display_survey_analytics(survey_id: int, filters: Optional[Dict] = None,
+                             group_by_options: Tuple[str, ...] = ('governorate', 'admin'),
+                             key_prefix: str = "analytics"):
+    """عرض إحصائيات إجابات الاستبيان لكل حقل"""
+    group_by = st.radio(
+        "توزيع النتائج حسب",
+        group_by_options,
+        format_func=lambda x: GROUP_BY_COLUMNS[x][1],
+        horizontal=True,
+        key=f"{key_prefix}_group_by_{survey_id}"
+    )
+
+    analytics = _cached_survey_analytics(
+        survey_id,
+        json.dumps(filters or {}, sort_keys=True, default=str),
+        group_by,
+        get_survey_data_watermark(survey_id)
+    )
+
+    if not analytics['responses']:
+        st.info("لا توجد إجابات قابلة للتحليل لهذا الاستبيان بعد")
+        return
+
+    st.caption(f"عدد الإجابات المحللة: {analytics['responses']}")
+
+    if analytics['frequencies']:
+        st.subheader("الحقول الاختيارية")
+        for label, table in analytics['frequencies'].items():
+            with st.expander(f"📊 {label}", expanded=True):
+                st.bar_chart(table.drop(columns="الإجمالي"))
+                st.dataframe(table, use_container_width=True)
+
+    if analytics['numeric']:
+        st.subheader("الحقول الرقمية")
+        for label, result in analytics['numeric'].items():
+            with st.expander(f"🔢 {label}", expanded=True):
+                st.dataframe(result['stats'].round(2), use_container_width=True)
+                st.bar_chart(result['histogram'])
+
+    if analytics['dates']:
+        st.subheader("حقول التاريخ")
+        for label, table in analytics['dates'].items():
+            with st.expander(f"📅 {label}", expanded=True):
+                st.bar_chart(table)
+
+TREND_RESOLUTION_LABELS = {'hour': "ساعة", 'day': "يوم", 'week': "أسبوع", 'month': "شهر"}
+
+def display_submission_trend(survey_id: int, filters: Optional[Dict] = None,
+                             split_options: Tuple[Optional[str], ...] = (None, 'governorate', 'admin'),
+                             key_prefix: str = "trend"):
+    """عرض منحنى عدد الإجابات عبر الزمن (يُقرأ من جداول التجميع فقط)"""
+    col1, col2 = st.columns(2)
+    with col1:
+        resolution = st.selectbox(
+            "الدقة الزمنية",
+            list(TREND_RESOLUTION_LABELS),
+            index=1,
+            format_func=lambda x: TREND_RESOLUTION_LABELS[x],
+            key=f"{key_prefix}_resolution_{survey_id}"
+        )
+    with col2:
+        split_by = st.selectbox(
+            "تقسيم المنحنى حسب",
+            split_options,
+            format_func=lambda x: "بدون تقسيم" if x is None else GROUP_BY_COLUMNS[x][1],
+            key=f"{key_prefix}_split_{survey_id}"
+        )
+
+    trend = get_submission_trend(survey_id, filters, resolution, split_by)
+    if not trend['rows']:
+        st.info("لا توجد إجابات لعرض المنحنى الزمني")
+        return
+    if trend['resolution'] != resolution:
+        st.caption(f"تم تجميع الفترة الطويلة حسب {TREND_RESOLUTION_LABELS[trend['resolution']]} لتقليل عدد النقاط")
+
+    df = pd.DataFrame(trend['rows'], columns=["الفترة", "series", "الإجابات", "المكتملة"])
+    st.line_chart(df.pivot(index="الفترة", columns="series", values="الإجابات").fillna(0))
+    totals = df.groupby("الفترة")[["الإجابات", "المكتملة"]].sum()
+    st.caption(f"إجمالي الإجابات في الفترة: {int(totals['الإجابات'].sum())}"
+               f" - المكتملة: {int(totals['المكتملة'].sum())}")
+
+@st.cache_data(max_entries=16, show_spinner="جاري إعداد تقرير المقارنة...")
+def _cached_comparison_report(survey_ids: Tuple[int, ...], watermarks: Tuple[int, ...]) -> Dict:
+    return build_comparison_report(list(survey_ids))
+
+def display_comparison_report(surveys: List[Tuple], key_prefix: str = "comparison"):
+    """تقرير مقارنة المحافظات عبر عدة استبيانات (يُحسب على عدة عمليات)"""
+    survey_names = dict(surveys)
+    selected = st.multiselect(
+        "الاستبيانات المطلوب مقارنتها",
+        list(survey_names),
+        format_func=lambda x: survey_names[x],
+        key=f"{key_prefix}_surveys"
+    )
+    if not selected:
+        st.info("اختر استبياناً واحداً على الأقل لإعداد التقرير")
+        return
+    if not st.button("إعداد تقرير المقارنة", key=f"{key_prefix}_build") \
+            and st.session_state.get(f"{key_prefix}_built") != selected:
+        return
+    st.session_state[f"{key_prefix}_built"] = selected
+
+    survey_ids = tuple(sorted(selected))
+    report = _cached_comparison_report(
+        survey_ids, tuple(get_survey_data_watermark(survey_id) for survey_id in survey_ids)
+    )
+
+    st.markdown("**عدد الإجابات ونسبة الإكمال**")
+    st.dataframe(report['summary'], use_container_width=True)
+    if not report['numeric'].empty:
+        st.markdown("**متوسط الحقول الرقمية**")
+        st.dataframe(report['numeric'], use_container_width=True)
+    for (survey_name, label), table in report['distributions'].items():
+        st.markdown(f"**توزيع إجابات {label} ({survey_name}) %**")
+        st.dataframe(table, use_container_width=True)
+
+def select_survey_for_analytics(surveys: List[Tuple], key: str) -> Optional[int]:
+    """اختيار استبيان من القائمة وإرجاع معرفه"""
+    if not surveys:
+        st.info("لا توجد استبيانات متاحة")
+        return None
+    selected = st.selectbox("اختر استبيان", surveys, format_func=lambda x: x[1], key=key)
+    return selected[0] if selected else None
@@ -0,0 +1,271 @@
+"""
+واجهة JSON خفيفة (ASGI) لإرسال الاستبيانات من فرق الميدان دون إعادة تشغيل صفحات Streamlit.
+
+التشغيل:
+    python api.py --port 8000
+    (أو) uvicorn api:app --workers 4   (الجلسات في قاعدة البيانات فيقبلها أي عامل)
+
+المسارات:
+    POST /api/login                          {"username": "...", "password": "..."}
+    GET  /api/surveys                        الاستبيانات المسموح بها للمستخدم
+    GET  /api/surveys/{id}/form              تعريف النموذج (يدعم ETag)
+    POST /api/surveys/{id}/submissions       {"submissions": [{"answers": {"field_id": value}, "is_completed": true,
+                                                               "client_token": "..."}]}
+    client_token اختياري وفريد لكل إجابة: إعادة إرسالها بنفس الرمز ترجع response_id الأصلي دون تكرار.
+"""
+import re
+import json
+import logging
+import time
+import hashlib
+import asyncio
+import secrets
+from functools import partial
+from typing import Dict, Optional, Tuple
+from auth import verify_credentials
+from database import (
+    init_db,
+    get_survey_fields,
+    get_user_allowed_surveys,
+    save_survey_submission,
+    normalize_answer,
+    create_api_session,
+    get_api_session
+)
+
+TOKEN_TTL_SECONDS = 3600  # نفس مدة جلسة Streamlit
+MAX_BATCH_SIZE = 100
+MAX_CLIENT_TOKEN_LENGTH = 128
+MAX_BODY_BYTES = 1024 * 1024
+
+logger = logging.getLogger(__name__)
+# تعريفات النماذج المجمعة حسب بصمة حقولها
+_form_cache: Dict[int, Tuple[str, bytes]] = {}
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+def token_hash(token: str) -> str:
+    """تُخزن بصمة الرمز فقط، فلا يكفي الاطلاع على قاعدة البيانات لانتحال جلسة"""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+def issue_token(user: dict) -> str:
+    token = secrets.token_urlsafe(32)
+    create_api_session(token_hash(token), user, time.time() + TOKEN_TTL_SECONDS)
+    return token
+
+def session_from_headers(headers: Dict[str, str]) -> dict:
+    authorization = headers.get('authorization', '')
+    if not authorization.startswith('Bearer '):
+        raise ApiError(401, "يجب تسجيل الدخول أولاً")
+    session = get_api_session(token_hash(authorization[len('Bearer '):]))
+    if not session:
+        raise ApiError(401, "انتهت صلاحية الجلسة، يرجى تسجيل الدخول مرة أخرى")
+    return session
+
+def require_allowed_survey(session: dict, survey_id: int):
+    if survey_id not in {s[0] for s in get_user_allowed_surveys(session['user_id'])}:
+        raise ApiError(403, "غير مصرح لك بهذا الاستبيان")
+
+def compile_form(survey_id: int) -> Tuple[str, bytes]:
+    """
+    تعريف النموذج بصيغة JSON جاهزة. الإصدار بصمة لتعريف الحقول فقط
+    (إصدار بيانات الاستبيان يتغير مع كل إجابة فلا يصلح لتخزين النموذج)
+    """
+    fields = get_survey_fields(survey_id)
+    if not fields:
+        raise ApiError(404, "الاستبيان غير موجود أو ليس له حقول")
+    version = hashlib.sha1(repr(fields).encode('utf-8')).hexdigest()[:16]
+    cached = _form_cache.get(survey_id)
+    if cached and cached[0] == version:
+        return cached
+
+    definition = [
+        {
+            'field_id': field_id,
+            'label': label,
+            'type': field_type,
+            'options': json.loads(options) if options else None,
+            'required': bool(is_required),
+            'order': order,
+        }
+        for field_id, label, field_type, options, is_required, order in fields
+    ]
+    body = json_body({'survey_id': survey_id, 'version': version, 'fields': definition})
+    _form_cache[survey_id] = (version, body)
+    return version, body
+
+def handle_login(payload: dict) -> dict:
+    user = verify_credentials(str(payload.get('username', '')), str(payload.get('password', '')))
+    if not user:
+        raise ApiError(401, "اسم المستخدم أو كلمة المرور غير صحيحة")
+    return {'token': issue_token(user), 'expires_in': TOKEN_TTL_SECONDS,
+            'user': {'user_id': user['user_id'], 'username': user['username'], 'role': user['role']}}
+
+def handle_list_surveys(session: dict) -> dict:
+    return {'surveys': [{'survey_id': survey_id, 'survey_name': name}
+                        for survey_id, name in get_user_allowed_surveys(session['user_id'])]}
+
+def handle_submissions(session: dict, survey_id: int, payload: dict) -> dict:
+    """حفظ دفعة من الإجابات، كل إجابة في معاملتها الخاصة مع نتيجة مستقلة لكل عنصر"""
+    if not session['region_id']:
+        raise ApiError(403, "حسابك غير مرتبط بأي منطقة")
+    require_allowed_survey(session, survey_id)
+
+    submissions = payload.get('submissions')
+    if not isinstance(submissions, list) or not submissions:
+        raise ApiError(400, "يجب إرسال قائمة submissions غير فارغة")
+    if len(submissions) > MAX_BATCH_SIZE:
+        raise ApiError(413, f"الحد الأقصى {MAX_BATCH_SIZE} إجابة في الطلب الواحد")
+
+    # الرفض قبل حفظ أي عنصر: القيمة النصية "false" كانت ستُحفظ إجابة مكتملة
+    for index, submission in enumerate(submissions):
+        if not isinstance(submission, dict):
+            raise ApiError(400, f"العنصر {index} يجب أن يكون كائن JSON")
+        if not isinstance(submission.get('is_completed', True), bool):
+            raise ApiError(400, f"is_completed في العنصر {index} يجب أن تكون true أو false")
+
+    fields = {field_id: (field_type, options)
+              for field_id, _, field_type, options, _, _ in get_survey_fields(survey_id)}
+    results = []
+    for index, submission in enumerate(submissions):
+        try:
+            answers = {int(field_id): value for field_id, value in (submission.get('answers') or {}).items()}
+        except (AttributeError, ValueError):
+            results.append({'index': index, 'error': "صيغة الإجابات غير صحيحة"})
+            continue
+        errors = []
+        for field_id, value in answers.items():
+            if field_id not in fields:
+                continue  # يرفضها save_survey_submission برسالة الحقول غير الموجودة
+            if isinstance(value, (dict, list)):
+                errors.append(f"الحقل {field_id}: القيمة يجب أن تكون نصاً أو رقماً")
+                continue
+            answers[field_id], error = normalize_answer(*fields[field_id], value)
+            if error:
+                errors.append(f"الحقل {field_id}: {error}")
+        if errors:
+            results.append({'index': index, 'error': "، ".join(errors)})
+            continue
+        token = submission.get('client_token')
+        if token is not None and (not isinstance(token, str) or not 0 < len(token) <= MAX_CLIENT_TOKEN_LENGTH):
+            results.append({'index': index, 'error': "client_token يجب أن يكون نصاً غير فارغ"})
+            continue
+        response_id, error, duplicate_of = save_survey_submission(
+            survey_id, session['user_id'], session['region_id'], answers,
+            submission.get('is_completed', True), token
+        )
+        if not response_id:
+            results.append({'index': index, 'error': error})
+        elif duplicate_of:
+            results.append({'index': index, 'response_id': response_id, 'duplicate_of': duplicate_of})
+        else:
+            results.append({'index': index, 'response_id': response_id})
+    return {'saved': sum(1 for r in results if 'response_id' in r), 'results': results}
+
+ROUTES = [
+    ('POST', re.compile(r'^/api/login$'), 'login'),
+    ('GET', re.compile(r'^/api/surveys$'), 'surveys'),
+    ('GET', re.compile(r'^/api/surveys/(\d+)/form$'), 'form'),
+    ('POST', re.compile(r'^/api/surveys/(\d+)/submissions$'), 'submissions'),
+]
+
+def dispatch(method: str, path: str, headers: Dict[str, str], body: bytes) -> Tuple[int, bytes, Dict[str, str]]:
+    """تنفيذ الطلب (متزامن، يعمل في مجمع الخيوط) وإرجاع (الحالة، المحتوى، ترويسات إضافية)"""
+    for route_method, pattern, name in ROUTES:
+        match = pattern.match(path)
+        if not match:
+            continue
+        if method != route_method:
+            raise ApiError(405, "الطريقة غير مدعومة")
+
+        payload = {}
+        if method == 'POST':
+            try:
+                payload = json.loads(body or b'{}')
+            except ValueError:
+                raise ApiError(400, "محتوى JSON غير صالح")
+            if not isinstance(payload, dict):
+                raise ApiError(400, "محتوى JSON غير صالح")
+
+        if name == 'login':
+            return 200, json_body(handle_login(payload)), {}
+        session = session_from_headers(headers)
+        if name == 'surveys':
+            return 200, json_body(handle_list_surveys(session)), {}
+        survey_id = int(match.group(1))
+        if name == 'form':
+            require_allowed_survey(session, survey_id)
+            version, form = compile_form(survey_id)
+            etag = f'"{version}"'
+            if headers.get('if-none-match') == etag:
+                return 304, b'', {'etag': etag}
+            return 200, form, {'etag': etag}
+        return 200, json_body(handle_submissions(session, survey_id, payload)), {}
+    raise ApiError(404, "المسار غير موجود")
+
+def json_body(data: dict) -> bytes:
+    return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+async def read_body(receive) -> bytes:
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            raise ApiError(413, "حجم الطلب أكبر من المسموح")
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+async def app(scope, receive, send):
+    """تطبيق ASGI: قاعدة البيانات متزامنة، فيُنفذ كل طلب في مجمع الخيوط الافتراضي"""
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                init_db()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+
+    headers = {key.decode('latin-1').lower(): value.decode('latin-1') for key, value in scope['headers']}
+    extra_headers: Dict[str, str] = {}
+    try:
+        body = await read_body(receive)
+        status, content, extra_headers = await asyncio.get_running_loop().run_in_executor(
+            None, partial(dispatch, scope['method'], scope['path'], headers, body)
+        )
+    except ApiError as e:
+        status, content = e.status, json_body({'error': e.message})
+    except Exception:
+        # التفاصيل في سجل الخادم فقط، والعميل يتلقى رسالة عامة
+        logger.exception("خطأ غير متوقع في %s %s", scope['method'], scope['path'])
+        status, content = 500, json_body({'error': "خطأ غير متوقع في الخادم"})
+
+    response_headers = [(b'content-type', b'application/json; charset=utf-8'),
+                        (b'content-length', str(len(content)).encode())]
+    response_headers += [(key.encode(), value.encode()) for key, value in extra_headers.items()]
+    await send({'type': 'http.response.start', 'status': status, 'headers': response_headers})
+    await send({'type': 'http.response.body', 'body': content})
+
+def main(argv: Optional[list] = None):
+    import argparse
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="واجهة JSON لإرسال الاستبيانات")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args(argv)
+    uvicorn.run("api:app", host=args.host, port=args.port, workers=args.workers)
+
+if __name__ == "__main__":
+    main()
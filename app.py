@@ -1,13 +1,10 @@
 import streamlit as st
 from datetime import datetime, timedelta 
 from auth import authenticate, logout
-from admin_views import show_admin_dashboard
-from employee_views import show_employee_dashboard
 from database import init_db, get_user_role
-from governorate_admin_views import show_governorate_admin_dashboard
 import os
 port = int(os.environ.get("PORT", 8501))
-# تهيئة قاعدة البيانات
+# تهيئة قاعدة البيانات (تُنفذ فعلياً مرة واحدة لكل عملية، وإعادة التشغيل لا تكلف شيئاً)
 init_db()
 
 def main():
@@ -24,11 +21,15 @@ def main():
         # زر تسجيل الخروج
         st.sidebar.button("تسجيل الخروج", on_click=logout)
         
+        # تُستورد لوحة الدور الحالي فقط (لوحات المسؤولين تحمل وحدات التصدير والتحليل)
         if user_role == 'admin':
+            from admin_views import show_admin_dashboard
             show_admin_dashboard()
         elif user_role == 'governorate_admin':
+            from governorate_admin_views import show_governorate_admin_dashboard
             show_governorate_admin_dashboard()
         else:
+            from employee_views import show_employee_dashboard
             show_employee_dashboard()
 
 if __name__ == "__main__":
@@ -1,8 +1,10 @@
-import streamlit as st
+from lazy_imports import LazyModule
 import hashlib
 from datetime import datetime, timedelta
 from database import get_user_by_username, update_last_login, init_db, update_user_activity
 
+st = LazyModule("streamlit")
+
 def authenticate():
     # التحقق من وجود بيانات الجلسة وانتهاء المدة
     if 'authenticated' in st.session_state and st.session_state.authenticated:
@@ -41,6 +43,13 @@ def authenticate():
                 st.error("اسم المستخدم أو كلمة المرور غير صحيحة")
     return False
 
+def verify_credentials(username: str, password: str):
+    """التحقق من اسم المستخدم وكلمة المرور دون جلسة Streamlit (لواجهة API)"""
+    user = get_user_by_username(username)
+    if user and check_password(user['password_hash'], password):
+        return user
+    return None
+
 def check_password(hashed_password, user_password):
     return hashed_password == hash_password(user_password)
 
@@ -0,0 +1,416 @@
+"""
+واجهة سطر الأوامر للعمليات المجمعة والصيانة دون تشغيل Streamlit.
+
+أمثلة:
+    python cli.py export 3 --format csv --output survey3.csv --completed-only
+    python cli.py import-users users.csv
+    python cli.py import-responses 3 responses.csv
+    python cli.py rebuild-rollups --typed-answers --content-hashes
+    python cli.py vacuum
+    python cli.py init-db --force        # إعادة تطبيق المخطط بعد تعديل يدوي لقاعدة البيانات
+    python cli.py audit-tables --enable Response_Details --disable Responses
+    python cli.py benchmark 3 --repeat 5
+    python cli.py benchmark-api 3 --requests 200 --concurrency 8   # على نسخة مؤقتة من قاعدة البيانات
+    python cli.py reports run            # مناسب لـ cron: 0 2 * * * python cli.py reports run
+    python cli.py reports daemon --at 02:00
+    python cli.py validate 3 --incremental   # التحقق من جودة الإجابات الجديدة والمعدلة فقط
+"""
+import sys
+import time
+import argparse
+import statistics
+from contextlib import contextmanager
+from typing import List, Tuple
+from database import (
+    AUDIT_TABLES,
+    init_db,
+    rebuild_rollups,
+    backfill_typed_answers,
+    backfill_content_hashes,
+    vacuum_database,
+    count_survey_responses,
+    get_responses_page,
+    get_submission_trend,
+    get_audit_settings,
+    set_audit_table_enabled
+)
+
+def report_progress(fraction: float, message: str):
+    """طباعة التقدم على سطر واحد في stderr حتى لا يختلط بمخرجات الأوامر"""
+    sys.stderr.write(f"\r[{fraction * 100:5.1f}%] {message}\033[K")
+    sys.stderr.flush()
+
+def report_count(done: int, message: str):
+    sys.stderr.write(f"\r{message}\033[K")
+    sys.stderr.flush()
+
+@contextmanager
+def timed(label: str):
+    started = time.perf_counter()
+    yield
+    sys.stderr.write("\n")
+    print(f"{label}: {time.perf_counter() - started:.2f} ث")
+
+def build_filters(args) -> dict:
+    filters = {
+        'governorate_id': args.governorate_id,
+        'admin_id': args.admin_id,
+        'completed_only': args.completed_only,
+        'date_from': args.date_from,
+        'date_to': args.date_to,
+    }
+    return {k: v for k, v in filters.items() if v}
+
+def print_import_result(result: dict):
+    print(f"تم استيراد {result['imported']} - تم تجاوز {result['skipped']} - أخطاء {len(result['errors'])}")
+    for error in result['errors'][:20]:
+        print(f"  {error}")
+    if len(result['errors']) > 20:
+        print(f"  ... و{len(result['errors']) - 20} أخطاء أخرى")
+
+def cmd_export(args) -> int:
+    from export_jobs import EXPORT_FORMATS
+
+    with timed("مدة التصدير"):
+        EXPORT_FORMATS[args.format]['builder'](args.survey_id, build_filters(args), args.output, report_progress)
+    print(f"تم حفظ الملف: {args.output}")
+    return 0
+
+def cmd_export_audit(args) -> int:
+    from exports import export_audit_log_csv, export_audit_log_parquet, export_audit_log_arrow
+
+    exporter = {'csv': export_audit_log_csv, 'parquet': export_audit_log_parquet,
+                'arrow': export_audit_log_arrow}[args.format]
+    with timed("مدة التصدير"):
+        exporter(args.output, {'table_name': args.table, 'action_type': args.action})
+    print(f"تم حفظ الملف: {args.output}")
+    return 0
+
+def cmd_import_users(args) -> int:
+    from imports import import_users_csv
+
+    with timed("مدة الاستيراد"):
+        result = import_users_csv(args.path, report_count)
+    print_import_result(result)
+    return 1 if result['errors'] else 0
+
+def cmd_import_responses(args) -> int:
+    from imports import import_responses_csv
+
+    with timed("مدة الاستيراد"):
+        result = import_responses_csv(args.path, args.survey_id, report_count)
+    print_import_result(result)
+    return 1 if result['errors'] else 0
+
+def cmd_rebuild_rollups(args) -> int:
+    with timed("مدة إعادة البناء"):
+        counts = rebuild_rollups()
+        if args.typed_answers:
+            processed = backfill_typed_answers()
+        if args.content_hashes:
+            hashed = backfill_content_hashes()
+    for table_name, rows in counts.items():
+        print(f"{table_name}: {rows} صف")
+    if args.typed_answers:
+        print(f"القيم المكتوبة: تمت معالجة {processed} إجابة")
+    if args.content_hashes:
+        print(f"بصمات المحتوى: تمت معالجة {hashed} إجابة")
+    return 0
+
+def cmd_vacuum(args) -> int:
+    with timed("مدة الضغط"):
+        sizes = vacuum_database()
+    print(f"الحجم قبل: {sizes['before'] / 1024 / 1024:.1f} MB - بعد: {sizes['after'] / 1024 / 1024:.1f} MB")
+    return 0
+
+def cmd_init_db(args) -> int:
+    init_db(force=args.force)
+    print("تمت تهيئة مخطط قاعدة البيانات")
+    return 0
+
+def cmd_audit_tables(args) -> int:
+    for table_name in args.enable or []:
+        set_audit_table_enabled(table_name, True)
+    for table_name in args.disable or []:
+        set_audit_table_enabled(table_name, False)
+    for table_name, enabled in get_audit_settings().items():
+        print(f"{table_name:<24}{'مفعل' if enabled else 'معطل'}")
+    return 0
+
+def cmd_benchmark(args) -> int:
+    """قياس زمن الاستعلامات الأساسية (الوسيط والأقصى لعدة تكرارات)"""
+    import os
+    import tempfile
+    from analytics import compute_survey_analytics
+    from reports import build_comparison_report
+    from exports import build_survey_csv
+
+    survey_id = args.survey_id
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cases = [
+            ("count_survey_responses", lambda: count_survey_responses(survey_id)),
+            ("get_responses_page (أول صفحة)", lambda: get_responses_page(survey_id, page_size=50)),
+            ("get_submission_trend (يومي)", lambda: get_submission_trend(survey_id, resolution='day')),
+            ("compute_survey_analytics", lambda: compute_survey_analytics(survey_id)),
+            ("build_comparison_report", lambda: build_comparison_report([survey_id])),
+            ("build_survey_csv", lambda: build_survey_csv(survey_id, None, os.path.join(tmp_dir, "b.csv"))),
+        ]
+        print(f"{'العملية':<40}{'الوسيط (ث)':>12}{'الأقصى (ث)':>12}")
+        for label, run in cases:
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                run()
+                timings.append(time.perf_counter() - started)
+            print(f"{label:<40}{statistics.median(timings):>12.3f}{max(timings):>12.3f}")
+    return 0
+
+def create_benchmark_users(db_path: str, survey_id: int, count: int) -> List[Tuple[str, str]]:
+    """
+    إنشاء مستخدمين مؤقتين للقياس في نسخة قاعدة البيانات، مسموح لهم بالاستبيان ومرتبطين
+    بإدارة صحية من محافظاته. يرجع [(اسم المستخدم، كلمة المرور)].
+    """
+    import secrets
+    import sqlite3
+    from auth import hash_password
+
+    conn = sqlite3.connect(db_path)
+    try:
+        region = conn.execute('''
+            SELECT ha.admin_id FROM HealthAdministrations ha
+            LEFT JOIN SurveyGovernorate sg ON sg.governorate_id = ha.governorate_id AND sg.survey_id = ?
+            ORDER BY sg.survey_id IS NULL, ha.admin_id
+            LIMIT 1
+        ''', (survey_id,)).fetchone()
+        if not region:
+            raise ValueError("لا توجد إدارة صحية لربط مستخدمي القياس بها")
+        users = [(f"benchmark_{index}_{secrets.token_hex(4)}", secrets.token_urlsafe(12)) for index in range(count)]
+        with conn:
+            for username, password in users:
+                user_id = conn.execute(
+                    "INSERT INTO Users (username, password_hash, role, assigned_region) VALUES (?, ?, 'employee', ?)",
+                    (username, hash_password(password), region[0])
+                ).lastrowid
+                conn.execute("INSERT INTO UserSurveys (user_id, survey_id) VALUES (?, ?)", (user_id, survey_id))
+        return users
+    finally:
+        conn.close()
+
+def cmd_benchmark_api(args) -> int:
+    """
+    قياس أداء واجهة api.py: تشغيل خادم مؤقت على نسخة من قاعدة البيانات، ثم إرسال إجابات
+    مكتملة بالتوازي، كل طلب من مستخدم قياس مختلف حتى لا تتنافس الطلبات على صف واحد أو
+    تصطدم بقاعدة الإكمال مرة واحدة يومياً. قاعدة البيانات الأصلية لا تُعدل.
+    """
+    import os
+    import json
+    import socket
+    import sqlite3
+    import subprocess
+    import tempfile
+    import urllib.error
+    import urllib.request
+    from concurrent.futures import ThreadPoolExecutor
+    from database import DATABASE_PATH
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    base_url = f"http://127.0.0.1:{port}"
+
+    def call(method: str, path: str, payload: dict = None, token: str = None) -> dict:
+        request = urllib.request.Request(base_url + path, method=method,
+                                         data=json.dumps(payload).encode() if payload is not None else None)
+        request.add_header("Content-Type", "application/json")
+        if token:
+            request.add_header("Authorization", f"Bearer {token}")
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read() or b"{}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "benchmark.db")
+        source, target = sqlite3.connect(DATABASE_PATH), sqlite3.connect(db_path)
+        try:
+            source.backup(target)
+        finally:
+            source.close()
+            target.close()
+        users = create_benchmark_users(db_path, args.survey_id, args.requests)
+
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "api.py"),
+             "--port", str(port), "--workers", str(args.workers)],
+            env=dict(os.environ, SURVEY_DB_PATH=db_path)
+        )
+        try:
+            deadline = time.monotonic() + 30
+            while True:
+                try:
+                    call("GET", "/api/surveys")
+                except urllib.error.HTTPError:
+                    break  # 401: الخادم جاهز
+                except OSError:
+                    if server.poll() is not None or time.monotonic() > deadline:
+                        print("تعذر تشغيل خادم القياس", file=sys.stderr)
+                        return 1
+                    time.sleep(0.2)
+
+            # تسجيل الدخول خارج القياس
+            tokens = [call("POST", "/api/login", {"username": username, "password": password})["token"]
+                      for username, password in users]
+            form = call("GET", f"/api/surveys/{args.survey_id}/form", token=tokens[0])
+            sample = {"text": "benchmark", "number": 1, "checkbox": True, "date": "2024-01-01"}
+            answers = {str(f["field_id"]): (f["options"][0] if f["options"] else sample.get(f["type"], "benchmark"))
+                       for f in form["fields"]}
+            batch = {"submissions": [{"answers": answers, "is_completed": True}]}
+
+            def submit(token: str) -> Tuple[float, int]:
+                started = time.perf_counter()
+                result = call("POST", f"/api/surveys/{args.survey_id}/submissions", batch, token)
+                return time.perf_counter() - started, result["saved"]
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                results = list(pool.map(submit, tokens))
+            elapsed = time.perf_counter() - started
+        finally:
+            server.terminate()
+            server.wait()
+
+    timings = sorted(timing for timing, _ in results)
+    saved = sum(count for _, count in results)
+    print(f"الطلبات: {args.requests} (مستخدم مختلف لكل طلب) - التوازي: {args.concurrency}"
+          f" - عمليات الخادم: {args.workers} - المحفوظ: {saved}")
+    print(f"الوسيط: {statistics.median(timings) * 1000:.1f} مث - p95: "
+          f"{timings[int(len(timings) * 0.95) - 1] * 1000:.1f} مث - الأقصى: {timings[-1] * 1000:.1f} مث")
+    print(f"الإنتاجية: {saved / elapsed:.1f} إجابة/ث")
+    return 0 if saved == args.requests else 1
+
+def print_reports_result(result: dict):
+    print(f"تقارير جديدة: {result['generated']} - بدون تغيير: {result['unchanged']}"
+          f" - إصدارات محذوفة: {result['removed']} - فشل: {len(result['failed'])}")
+    for error in result['failed']:
+        print(f"  {error}")
+
+def cmd_reports(args) -> int:
+    from scheduler import run_scheduled_reports, run_daemon
+
+    def progress(done: int, total: int, message: str):
+        report_progress(done / max(total, 1), message)
+
+    def finished(result: dict):
+        sys.stderr.write("\n")
+        print_reports_result(result)
+
+    if args.action == 'daemon':
+        print(f"خدمة التقارير تعمل يومياً في {args.at} (Ctrl+C للإيقاف)")
+        try:
+            run_daemon(args.at, progress, on_finished=finished)
+        except KeyboardInterrupt:
+            return 0
+
+    with timed("مدة إعداد التقارير"):
+        result = run_scheduled_reports(args.force, progress)
+    print_reports_result(result)
+    return 1 if result['failed'] else 0
+
+def cmd_validate(args) -> int:
+    from validation import RULE_TYPES, SEVERITIES, run_validation, get_validation_summary
+
+    with timed("مدة التحقق"):
+        result = run_validation(args.survey_id, incremental=args.incremental)
+    print(f"الإجابات المفحوصة: {result['answers']} - الملاحظات الجديدة: {result['findings']}"
+          f"{' (الإجابات الجديدة والمعدلة فقط)' if result['incremental'] else ''}")
+    for label, rule_type, severity, findings, responses in get_validation_summary(args.survey_id)['counts']:
+        print(f"  {label} - {RULE_TYPES[rule_type]} ({SEVERITIES[severity]}): {findings} ملاحظة في {responses} إجابة")
+    return 0
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="أدوات سطر الأوامر لنظام إدارة الاستبيانات")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="تصدير إجابات استبيان إلى ملف")
+    export.add_argument("survey_id", type=int)
+    export.add_argument("--format", choices=["xlsx", "csv", "parquet", "arrow"], default="csv")
+    export.add_argument("--output", required=True)
+    export.add_argument("--governorate-id", type=int)
+    export.add_argument("--admin-id", type=int)
+    export.add_argument("--completed-only", action="store_true")
+    export.add_argument("--date-from", help="YYYY-MM-DD")
+    export.add_argument("--date-to", help="YYYY-MM-DD")
+    export.set_defaults(handler=cmd_export)
+
+    audit = commands.add_parser("export-audit", help="تصدير سجل التعديلات")
+    audit.add_argument("--format", choices=["csv", "parquet", "arrow"], default="csv")
+    audit.add_argument("--output", required=True)
+    audit.add_argument("--table")
+    audit.add_argument("--action")
+    audit.set_defaults(handler=cmd_export_audit)
+
+    users = commands.add_parser("import-users", help="استيراد مستخدمين من CSV")
+    users.add_argument("path")
+    users.set_defaults(handler=cmd_import_users)
+
+    responses = commands.add_parser("import-responses", help="استيراد إجابات استبيان من CSV")
+    responses.add_argument("survey_id", type=int)
+    responses.add_argument("path")
+    responses.set_defaults(handler=cmd_import_responses)
+
+    rollups = commands.add_parser("rebuild-rollups", help="إعادة بناء جداول التجميع")
+    rollups.add_argument("--typed-answers", action="store_true",
+                         help="إعادة حساب القيم المكتوبة للإجابات أيضاً")
+    rollups.add_argument("--content-hashes", action="store_true",
+                         help="إعادة حساب بصمات محتوى الإجابات (كشف التكرار) أيضاً")
+    rollups.set_defaults(handler=cmd_rebuild_rollups)
+
+    vacuum = commands.add_parser("vacuum", help="ضغط قاعدة البيانات وتحديث الإحصائيات")
+    vacuum.set_defaults(handler=cmd_vacuum)
+
+    schema = commands.add_parser("init-db", help="تهيئة مخطط قاعدة البيانات والتحقق من بصمته")
+    schema.add_argument("--force", action="store_true",
+                        help="إعادة تطبيق المخطط وتخزين البصمة الحالية حتى لو لم تتطابق")
+    schema.set_defaults(handler=cmd_init_db)
+
+    audit_tables = commands.add_parser("audit-tables", help="عرض وتحديد الجداول المسجلة في سجل التعديلات")
+    audit_tables.add_argument("--enable", nargs="+", choices=list(AUDIT_TABLES), metavar="TABLE")
+    audit_tables.add_argument("--disable", nargs="+", choices=list(AUDIT_TABLES), metavar="TABLE")
+    audit_tables.set_defaults(handler=cmd_audit_tables)
+
+    benchmark = commands.add_parser("benchmark", help="قياس أداء الاستعلامات الأساسية")
+    benchmark.add_argument("survey_id", type=int)
+    benchmark.add_argument("--repeat", type=int, default=3)
+    benchmark.set_defaults(handler=cmd_benchmark)
+
+    api = commands.add_parser(
+        "benchmark-api",
+        help="قياس أداء واجهة JSON على خادم مؤقت",
+        description="يشغل api.py على نسخة مؤقتة من قاعدة البيانات ويضيف إليها مستخدمي قياس وإجابات مكتملة؛"
+                    " النسخة تُحذف بعد القياس ولا تُعدل قاعدة البيانات الأصلية"
+    )
+    api.add_argument("survey_id", type=int)
+    api.add_argument("--requests", type=int, default=100, help="عدد الطلبات (ومستخدمي القياس)")
+    api.add_argument("--concurrency", type=int, default=4)
+    api.add_argument("--workers", type=int, default=1, help="عدد عمليات خادم api.py")
+    api.set_defaults(handler=cmd_benchmark_api)
+
+    reports = commands.add_parser("reports", help="إعداد التقارير الليلية المجدولة")
+    reports.add_argument("action", choices=["run", "daemon"])
+    reports.add_argument("--force", action="store_true", help="إعادة الإنشاء حتى لو لم تتغير البيانات")
+    reports.add_argument("--at", default="02:00", help="موعد التشغيل اليومي للخدمة HH:MM")
+    reports.set_defaults(handler=cmd_reports)
+
+    validate = commands.add_parser("validate", help="تنفيذ قواعد جودة البيانات على إجابات استبيان")
+    validate.add_argument("survey_id", type=int)
+    validate.add_argument("--incremental", action="store_true",
+                          help="فحص الإجابات الجديدة والمعدلة منذ آخر تشغيل فقط")
+    validate.set_defaults(handler=cmd_validate)
+    return parser
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.handler is not cmd_init_db:
+        init_db()
+    return args.handler(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,18 +1,96 @@
+import os
 import sqlite3
-import streamlit as st
+from lazy_imports import LazyModule
 import json
+import math
+import hashlib
+import threading
+import time
 from typing import Optional, List, Tuple, Dict
-from datetime import datetime
+from datetime import datetime, date
 from pathlib import Path
+
+# Streamlit يُستورد عند أول رسالة فقط، فتعمل الدوال من سطر الأوامر دون تحميله
+st = LazyModule("streamlit")
+
 BASE_DIR = Path(__file__).parent
 DATABASE_DIR = BASE_DIR / "data"
 DATABASE_DIR.mkdir(exist_ok=True)  
-DATABASE_PATH = str(DATABASE_DIR / "survey_app.db")
+# SURVEY_DB_PATH يسمح بتشغيل الواجهة على نسخة أخرى (مثل قياس الأداء في cli.py)
+DATABASE_PATH = os.environ.get("SURVEY_DB_PATH", str(DATABASE_DIR / "survey_app.db"))
 
-def init_db():
-    conn = sqlite3.connect(DATABASE_PATH)
-    c = conn.cursor()
-    
+# يُرفع عند أي تغيير في تعريف الجداول أو المشغلات أو الفهارس داخل create_schema
+SCHEMA_VERSION = 10
+
+# مسار قاعدة البيانات التي تمت تهيئتها في هذه العملية
+_schema_ready_path: Optional[str] = None
+_schema_lock = threading.Lock()
+
+class SchemaMismatchError(RuntimeError):
+    """مخطط قاعدة البيانات على القرص لا يطابق ما يتوقعه الكود"""
+
+def schema_fingerprint(c) -> str:
+    """بصمة تعريف الجداول والفهارس والمشغلات (دون جداول SQLite الداخلية مثل إحصائيات ANALYZE)"""
+    rows = c.execute('''
+        SELECT type, name, sql FROM sqlite_master
+        WHERE name NOT LIKE 'sqlite_%' AND sql IS NOT NULL
+        ORDER BY type, name
+    ''').fetchall()
+    return hashlib.sha256(repr(rows).encode('utf-8')).hexdigest()
+
+def init_db(force: bool = False):
+    """
+    تهيئة قاعدة البيانات مرة واحدة لكل عملية (Streamlit يعيد تنفيذ app.py مع كل تفاعل).
+    إذا كان إصدار المخطط المخزن مطابقاً يُكتفى بمقارنة البصمة، وعند اختلافها يتوقف التشغيل فوراً
+    بدلاً من العمل على مخطط غير متوقع. force يعيد إنشاء المخطط وتخزين بصمته (إصلاح يدوي).
+    """
+    global _schema_ready_path
+    if _schema_ready_path == DATABASE_PATH and not force:
+        return
+    with _schema_lock:
+        if _schema_ready_path == DATABASE_PATH and not force:
+            return
+        conn = sqlite3.connect(DATABASE_PATH)
+        try:
+            c = conn.cursor()
+            c.execute('''CREATE TABLE IF NOT EXISTS SchemaInfo
+                         (id INTEGER PRIMARY KEY CHECK (id = 1),
+                          schema_version INTEGER NOT NULL,
+                          fingerprint TEXT NOT NULL,
+                          updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+            stored = c.execute("SELECT schema_version, fingerprint FROM SchemaInfo WHERE id = 1").fetchone()
+            if stored and stored[0] > SCHEMA_VERSION:
+                raise SchemaMismatchError(
+                    f"إصدار مخطط قاعدة البيانات ({stored[0]}) أحدث من إصدار التطبيق ({SCHEMA_VERSION})")
+            if stored and stored[0] == SCHEMA_VERSION and not force:
+                if stored[1] != schema_fingerprint(c):
+                    raise SchemaMismatchError(
+                        "مخطط قاعدة البيانات تغير خارج التطبيق. راجع التغييرات ثم شغّل: python cli.py init-db --force")
+            else:
+                create_schema(c)
+                c.execute('''
+                    INSERT INTO SchemaInfo (id, schema_version, fingerprint) VALUES (1, ?, ?)
+                    ON CONFLICT(id) DO UPDATE SET schema_version = excluded.schema_version,
+                        fingerprint = excluded.fingerprint, updated_at = CURRENT_TIMESTAMP
+                ''', (SCHEMA_VERSION, schema_fingerprint(c)))
+
+            ensure_default_admin(c)
+            conn.commit()
+            _schema_ready_path = DATABASE_PATH
+        finally:
+            conn.close()
+
+def ensure_default_admin(c):
+    """إضافة مستخدم المدير الافتراضي إذا لم يوجد أي مدير"""
+    c.execute("SELECT COUNT(*) FROM Users WHERE role='admin'")
+    if c.fetchone()[0] == 0:
+        from auth import hash_password
+        admin_password = hash_password("admin123")
+        c.execute("INSERT INTO Users (username, password_hash, role) VALUES (?, ?, ?)",
+                  ("admin", admin_password, "admin"))
+
+def create_schema(c):
+    """إنشاء الجداول والمشغلات والفهارس الناقصة وترحيل المخطط القديم (آمن للتكرار)"""
     # Create Users table
     c.execute('''CREATE TABLE IF NOT EXISTS Users
                  (user_id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -71,6 +149,9 @@ def init_db():
                   FOREIGN KEY(user_id) REFERENCES Users(user_id),
                   FOREIGN KEY(region_id) REFERENCES Regions(region_id))''')
     
+    # رقم إصدار الإجابة يزداد مع كل تعديل (للتحقق من التعديل المتزامن)
+    add_missing_columns(c, 'Responses', {'version': 'INTEGER NOT NULL DEFAULT 1'})
+
     # Create Response_Details table
     c.execute('''CREATE TABLE IF NOT EXISTS Response_Details
                  (detail_id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -79,6 +160,14 @@ def init_db():
                   answer_value TEXT,
                   FOREIGN KEY(response_id) REFERENCES Responses(response_id),
                   FOREIGN KEY(field_id) REFERENCES Survey_Fields(field_id))''')
+
+    # القيم المكتوبة بنوعها الأصلي بجانب النص (للحقول الرقمية والتاريخ ومربعات الاختيار)
+    if add_missing_columns(c, 'Response_Details', TYPED_ANSWER_COLUMNS):
+        fill_typed_answers(c)
+
+    # بصمة محتوى الإجابة لكشف النماذج الورقية المدخلة أكثر من مرة
+    if add_missing_columns(c, 'Responses', {'content_hash': 'TEXT'}):
+        fill_content_hashes(c)
                  
     c.execute('''CREATE TABLE IF NOT EXISTS GovernorateAdmins
              (admin_id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -115,17 +204,673 @@ def init_db():
               old_value TEXT,
               new_value TEXT,
               action_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-              FOREIGN KEY(user_id) REFERENCES Users(user_id))''')             
-    # Add default admin user if none exists
-    c.execute("SELECT COUNT(*) FROM Users WHERE role='admin'")
-    if c.fetchone()[0] == 0:
-        from auth import hash_password
-        admin_password = hash_password("admin123")
-        c.execute("INSERT INTO Users (username, password_hash, role) VALUES (?, ?, ?)",
-                  ("admin", admin_password, "admin"))
-    
+              FOREIGN KEY(user_id) REFERENCES Users(user_id))''')
+
+    # المستخدم المنفذ للتعديلات الجارية (تقرؤه مشغلات سجل التعديلات) والجداول المسجلة
+    c.execute('''CREATE TABLE IF NOT EXISTS AuditContext
+             (id INTEGER PRIMARY KEY CHECK (id = 1),
+              user_id INTEGER)''')
+    # قواعد البيانات السابقة قد تحتفظ بآخر مستخدم كتب فيها
+    c.execute("UPDATE AuditContext SET user_id = NULL WHERE id = 1")
+    c.execute('''CREATE TABLE IF NOT EXISTS AuditSettings
+             (table_name TEXT PRIMARY KEY,
+              enabled INTEGER NOT NULL DEFAULT 1)''')
+    c.executemany(
+        "INSERT OR IGNORE INTO AuditSettings (table_name, enabled) VALUES (?, ?)",
+        [(table_name, int(spec['enabled'])) for table_name, spec in AUDIT_TABLES.items()]
+    )
+    c.execute("CREATE INDEX IF NOT EXISTS idx_audit_log_record ON AuditLog(table_name, record_id)")
+    create_audit_triggers(c)
+
+    # إصدار بيانات كل استبيان (يزداد مع كل تغيير في الإجابات أو الحقول)
+    c.execute('''CREATE TABLE IF NOT EXISTS SurveyDataVersions
+             (survey_id INTEGER PRIMARY KEY,
+              version INTEGER NOT NULL DEFAULT 0,
+              updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+              FOREIGN KEY(survey_id) REFERENCES Surveys(survey_id))''')
+    create_data_version_triggers(c)
+
+    # تجميع يومي وبالساعة لعدد الإجابات لكل استبيان وإدارة صحية وحالة (يُحدَّث بالمشغلات)
+    for table_name in ROLLUP_TABLES:
+        c.execute(f'''CREATE TABLE IF NOT EXISTS {table_name}
+                 (survey_id INTEGER NOT NULL,
+                  region_id INTEGER NOT NULL,
+                  bucket TEXT NOT NULL,
+                  is_completed INTEGER NOT NULL,
+                  response_count INTEGER NOT NULL DEFAULT 0,
+                  PRIMARY KEY(survey_id, bucket, region_id, is_completed)) WITHOUT ROWID''')
+        create_rollup_triggers(c, table_name)
+        if not c.execute(f"SELECT EXISTS(SELECT 1 FROM {table_name})").fetchone()[0]:
+            rebuild_rollup_table(c, table_name)
+
+    # ملفات التقارير المُعدة مسبقاً (كل تشغيل ينشئ إصداراً جديداً إذا تغيرت البيانات)
+    c.execute('''CREATE TABLE IF NOT EXISTS ReportArtifacts
+             (artifact_id INTEGER PRIMARY KEY AUTOINCREMENT,
+              report_type TEXT NOT NULL,
+              survey_id INTEGER,
+              governorate_id INTEGER,
+              version INTEGER NOT NULL,
+              file_path TEXT NOT NULL,
+              file_size INTEGER NOT NULL,
+              data_version TEXT NOT NULL,
+              created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+              FOREIGN KEY(survey_id) REFERENCES Surveys(survey_id),
+              FOREIGN KEY(governorate_id) REFERENCES Governorates(governorate_id))''')
+    c.execute("""CREATE INDEX IF NOT EXISTS idx_report_artifacts_scope
+                 ON ReportArtifacts(report_type, survey_id, governorate_id, version)""")
+
+    # قواعد جودة البيانات لكل حقل، وملاحظات آخر تشغيل لمحرك التحقق (validation.py)
+    c.execute('''CREATE TABLE IF NOT EXISTS ValidationRules
+             (rule_id INTEGER PRIMARY KEY AUTOINCREMENT,
+              survey_id INTEGER NOT NULL,
+              field_id INTEGER NOT NULL,
+              rule_type TEXT NOT NULL,
+              params TEXT NOT NULL DEFAULT '{}',
+              severity TEXT NOT NULL DEFAULT 'warning',
+              is_active BOOLEAN DEFAULT TRUE,
+              created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+              FOREIGN KEY(survey_id) REFERENCES Surveys(survey_id),
+              FOREIGN KEY(field_id) REFERENCES Survey_Fields(field_id))''')
+    c.execute('''CREATE TABLE IF NOT EXISTS ValidationFindings
+             (finding_id INTEGER PRIMARY KEY AUTOINCREMENT,
+              survey_id INTEGER NOT NULL,
+              response_id INTEGER NOT NULL,
+              field_id INTEGER NOT NULL,
+              rule_type TEXT NOT NULL,
+              rule_id INTEGER,
+              severity TEXT NOT NULL,
+              message TEXT NOT NULL,
+              value TEXT,
+              FOREIGN KEY(response_id) REFERENCES Responses(response_id))''')
+    c.execute('''CREATE TABLE IF NOT EXISTS ValidationRuns
+             (survey_id INTEGER PRIMARY KEY,
+              last_response_id INTEGER NOT NULL DEFAULT 0,
+              answers_checked INTEGER NOT NULL DEFAULT 0,
+              findings INTEGER NOT NULL DEFAULT 0,
+              run_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+              FOREIGN KEY(survey_id) REFERENCES Surveys(survey_id))''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_validation_rules_survey ON ValidationRules(survey_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_validation_findings_survey ON ValidationFindings(survey_id, rule_type)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_validation_findings_response ON ValidationFindings(response_id)")
+    # إجابات سبق التحقق منها ثم تغيرت تفاصيلها (مسودة أو تعديل أو تصحيح جماعي) لإعادة فحصها
+    # في التشغيل التالي، وكل إعادة إدراج تأخذ رقماً تسلسلياً جديداً
+    c.execute('''CREATE TABLE IF NOT EXISTS ValidationQueue
+             (seq INTEGER PRIMARY KEY AUTOINCREMENT,
+              response_id INTEGER NOT NULL UNIQUE,
+              survey_id INTEGER NOT NULL)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_validation_queue_survey ON ValidationQueue(survey_id, seq)")
+    create_validation_queue_triggers(c)
+
+    # آخر إجابة مضمنة في لقطة Parquet لكل استبيان، والإجابات المضمنة التي تغيرت بعدها
+    # (تُعاد كتابة أجزائها عند التحديث التالي). تغيير الحقول يتطلب إعادة بناء اللقطة كاملة.
+    c.execute('''CREATE TABLE IF NOT EXISTS SnapshotRuns
+             (survey_id INTEGER PRIMARY KEY,
+              last_response_id INTEGER NOT NULL DEFAULT 0,
+              field_changes INTEGER NOT NULL DEFAULT 0,
+              FOREIGN KEY(survey_id) REFERENCES Surveys(survey_id))''')
+    c.execute('''CREATE TABLE IF NOT EXISTS SnapshotQueue
+             (seq INTEGER PRIMARY KEY AUTOINCREMENT,
+              response_id INTEGER NOT NULL UNIQUE,
+              survey_id INTEGER NOT NULL)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_snapshot_queue_survey ON SnapshotQueue(survey_id, seq)")
+    create_snapshot_queue_triggers(c)
+
+    # رموز منع التكرار: رمز لكل عرض للنموذج، وتكرار الإرسال بنفس الرمز يرجع الإجابة الأصلية
+    c.execute('''CREATE TABLE IF NOT EXISTS SubmissionTokens
+             (user_id INTEGER NOT NULL,
+              token TEXT NOT NULL,
+              survey_id INTEGER NOT NULL,
+              response_id INTEGER NOT NULL,
+              created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+              PRIMARY KEY(user_id, token),
+              FOREIGN KEY(response_id) REFERENCES Responses(response_id))''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_submission_tokens_created ON SubmissionTokens(created_at)")
+
+    # جلسات واجهة JSON (بصمة الرمز فقط) مشتركة بين كل عمليات الخادم
+    c.execute('''CREATE TABLE IF NOT EXISTS ApiSessions
+             (token_hash TEXT PRIMARY KEY,
+              user_id INTEGER NOT NULL,
+              username TEXT NOT NULL,
+              role TEXT NOT NULL,
+              region_id INTEGER,
+              expires_at REAL NOT NULL,
+              FOREIGN KEY(user_id) REFERENCES Users(user_id))''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_api_sessions_expires ON ApiSessions(expires_at)")
+
+    c.execute("CREATE INDEX IF NOT EXISTS idx_responses_survey_date ON Responses(survey_id, submission_date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_responses_survey_user ON Responses(survey_id, user_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_responses_region_survey ON Responses(region_id, survey_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_responses_user_date ON Responses(user_id, submission_date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_responses_content_hash ON Responses(survey_id, content_hash)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_health_admins_governorate ON HealthAdministrations(governorate_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_response_details_response ON Response_Details(response_id)")
+    c.execute("""CREATE INDEX IF NOT EXISTS idx_response_details_number
+                 ON Response_Details(field_id, answer_number) WHERE answer_number IS NOT NULL""")
+    c.execute("""CREATE INDEX IF NOT EXISTS idx_response_details_date
+                 ON Response_Details(field_id, answer_date) WHERE answer_date IS NOT NULL""")
+    c.execute("""CREATE INDEX IF NOT EXISTS idx_response_details_bool
+                 ON Response_Details(field_id, answer_bool) WHERE answer_bool IS NOT NULL""")
+
+def add_missing_columns(c, table_name: str, columns: Dict[str, str]) -> List[str]:
+    """إضافة الأعمدة غير الموجودة إلى جدول قائم وإرجاع أسماء الأعمدة المضافة"""
+    existing = {row[1] for row in c.execute(f"PRAGMA table_info({table_name})")}
+    added = []
+    for column, definition in columns.items():
+        if column not in existing:
+            c.execute(f"ALTER TABLE {table_name} ADD COLUMN {column} {definition}")
+            added.append(column)
+    return added
+
+# مصدر معرف الاستبيان في كل جدول يؤثر على بيانات التصدير
+DATA_VERSION_SOURCES = {
+    'Responses': '{row}.survey_id',
+    'Survey_Fields': '{row}.survey_id',
+    'Response_Details': '(SELECT survey_id FROM Responses WHERE response_id = {row}.response_id)',
+}
+
+def create_validation_queue_triggers(c):
+    """مشغلات تضيف الإجابة إلى ValidationQueue عند تغير تفاصيلها بعد آخر تشغيل للتحقق من استبيانها"""
+    for event, row, condition in (('INSERT', 'NEW', ''), ('DELETE', 'OLD', ''),
+                                  ('UPDATE', 'NEW', 'WHEN OLD.answer_value IS NOT NEW.answer_value')):
+        c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_validation_queue_{event.lower()}
+            AFTER {event} ON Response_Details {condition}
+            BEGIN
+                INSERT OR REPLACE INTO ValidationQueue (response_id, survey_id)
+                SELECT r.response_id, r.survey_id
+                FROM Responses r
+                JOIN ValidationRuns vr ON vr.survey_id = r.survey_id
+                WHERE r.response_id = {row}.response_id AND r.response_id <= vr.last_response_id;
+            END''')
+
+def create_snapshot_queue_triggers(c):
+    """مشغلات تضيف الإجابة إلى SnapshotQueue عند تغير بياناتها بعد تضمينها في لقطة استبيانها"""
+    queue_sql = '''
+        INSERT OR REPLACE INTO SnapshotQueue (response_id, survey_id)
+        SELECT {response}, sr.survey_id FROM SnapshotRuns sr
+        WHERE sr.survey_id = {survey} AND {response} <= sr.last_response_id;'''
+    details_survey = "(SELECT survey_id FROM Responses WHERE response_id = {row}.response_id)"
+    sources = (
+        ('details_insert', 'INSERT', 'Response_Details', '', 'NEW.response_id', details_survey.format(row='NEW')),
+        ('details_delete', 'DELETE', 'Response_Details', '', 'OLD.response_id', details_survey.format(row='OLD')),
+        ('details_update', 'UPDATE', 'Response_Details', 'WHEN OLD.answer_value IS NOT NEW.answer_value',
+         'NEW.response_id', details_survey.format(row='NEW')),
+        ('responses_update', 'UPDATE', 'Responses',
+         'WHEN OLD.is_completed IS NOT NEW.is_completed OR OLD.submission_date IS NOT NEW.submission_date'
+         ' OR OLD.region_id IS NOT NEW.region_id OR OLD.user_id IS NOT NEW.user_id',
+         'NEW.response_id', 'NEW.survey_id'),
+        ('responses_delete', 'DELETE', 'Responses', '', 'OLD.response_id', 'OLD.survey_id'),
+    )
+    for name, event, table_name, condition, response, survey in sources:
+        c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_snapshot_queue_{name}
+            AFTER {event} ON {table_name} {condition}
+            BEGIN
+                {queue_sql.format(response=response, survey=survey)}
+            END''')
+    for event, row, condition in (('UPDATE', 'NEW', 'WHEN OLD.field_label IS NOT NEW.field_label'
+                                                   ' OR OLD.field_type IS NOT NEW.field_type'
+                                                   ' OR OLD.field_order IS NOT NEW.field_order'),
+                                  ('DELETE', 'OLD', '')):
+        c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_snapshot_fields_{event.lower()}
+            AFTER {event} ON Survey_Fields {condition}
+            BEGIN
+                UPDATE SnapshotRuns SET field_changes = field_changes + 1 WHERE survey_id = {row}.survey_id;
+            END''')
+
+def create_data_version_triggers(c):
+    """إنشاء المشغلات التي ترفع إصدار بيانات الاستبيان عند أي إضافة أو تعديل أو حذف"""
+    for table_name, survey_expr in DATA_VERSION_SOURCES.items():
+        for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+            c.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table_name.lower()}_version_{event.lower()}
+                AFTER {event} ON {table_name}
+                BEGIN
+                    INSERT INTO SurveyDataVersions (survey_id, version)
+                    VALUES ({survey_expr.format(row=row)}, 1)
+                    ON CONFLICT(survey_id) DO UPDATE
+                    SET version = version + 1, updated_at = CURRENT_TIMESTAMP;
+                END''')
+
+def get_survey_data_watermark(survey_id: int) -> int:
+    """الحصول على إصدار بيانات الاستبيان الحالي (صفر إذا لم تتغير بياناته بعد)"""
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        row = conn.execute(
+            "SELECT version FROM SurveyDataVersions WHERE survey_id = ?",
+            (survey_id,)
+        ).fetchone()
+        return row[0] if row else 0
+    finally:
+        conn.close()
+
+# الجداول التي يسجل تعديلاتها مشغل في سجل التعديلات: المفتاح، والأعمدة المستبعدة (تتغير تلقائياً
+# أو مشتقة)، والأعمدة المخفية (يُسجل تغيرها دون قيمتها)، والأحداث، وحالة التسجيل الافتراضية.
+# إضافة الإجابات لا تُسجل (الإجابة نفسها هي السجل)، وتفاصيل الإجابات معطلة افتراضياً لأن
+# apply_response_edits يكتب سجلاً واحداً مجمعاً لكل تعديل.
+AUDIT_TABLES = {
+    'Users': {'key': 'user_id', 'exclude': ('created_at', 'last_login', 'last_activity'),
+              'masked': ('password_hash',), 'events': ('INSERT', 'UPDATE', 'DELETE'), 'enabled': True},
+    'Governorates': {'key': 'governorate_id', 'events': ('INSERT', 'UPDATE', 'DELETE'), 'enabled': True},
+    'HealthAdministrations': {'key': 'admin_id', 'events': ('INSERT', 'UPDATE', 'DELETE'), 'enabled': True},
+    'Surveys': {'key': 'survey_id', 'exclude': ('created_at',),
+                'events': ('INSERT', 'UPDATE', 'DELETE'), 'enabled': True},
+    'Survey_Fields': {'key': 'field_id', 'events': ('INSERT', 'UPDATE', 'DELETE'), 'enabled': True},
+    'Responses': {'key': 'response_id', 'exclude': ('version', 'content_hash'),
+                  'events': ('UPDATE', 'DELETE'), 'enabled': True},
+    'Response_Details': {'key': 'detail_id', 'exclude': ('answer_number', 'answer_date', 'answer_bool'),
+                         'events': ('INSERT', 'UPDATE', 'DELETE'), 'enabled': False},
+    'GovernorateAdmins': {'key': 'admin_id', 'events': ('INSERT', 'UPDATE', 'DELETE'), 'enabled': True},
+    'UserSurveys': {'key': 'id', 'events': ('INSERT', 'UPDATE', 'DELETE'), 'enabled': True},
+    'SurveyGovernorate': {'key': 'id', 'events': ('INSERT', 'UPDATE', 'DELETE'), 'enabled': True},
+}
+# المستخدم المسجل للتعديلات التي تتم دون مستخدم معروف (الاستيراد والتهيئة)
+AUDIT_SYSTEM_USER_ID = 0
+# مدة الاحتفاظ برموز منع تكرار الإرسال قبل حذفها عند ضغط قاعدة البيانات
+SUBMISSION_TOKEN_TTL_DAYS = 7
+
+def audit_changes_json(columns: List[str], masked: Tuple, row: str, condition: str) -> str:
+    """
+    تعبير SQL يبني كائن JSON بالأعمدة التي يتحقق فيها الشرط فقط ({col} يُستبدل باسم العمود)،
+    فيُسجل في التعديل ما تغير فقط وفي الإضافة والحذف الأعمدة غير الفارغة.
+    """
+    parts = []
+    for column in columns:
+        value = f"CASE WHEN {row}.{column} IS NULL THEN NULL ELSE '***' END" if column in masked else f"{row}.{column}"
+        parts.append(f"SELECT '{column}' AS col, {value} AS val WHERE {condition.format(col=column)}")
+    return f"(SELECT json_group_object(col, val) FROM ({' UNION ALL '.join(parts)}))"
+
+def create_audit_triggers(c):
+    """
+    إعادة إنشاء مشغلات سجل التعديلات حسب أعمدة كل جدول الحالية. تُكتب السجلات داخل معاملة
+    التعديل نفسها، ويُقرأ تفعيل كل جدول من AuditSettings عند التنفيذ.
+    """
+    for table_name, spec in AUDIT_TABLES.items():
+        exclude = set(spec.get('exclude', ())) | {spec['key']}
+        columns = [row[1] for row in c.execute(f"PRAGMA table_info({table_name})") if row[1] not in exclude]
+        masked = spec.get('masked', ())
+        enabled = f"(SELECT enabled FROM AuditSettings WHERE table_name = '{table_name}')"
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            trigger = f"trg_audit_{table_name.lower()}_{event.lower()}"
+            c.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            if event not in spec['events']:
+                continue
+            if event == 'INSERT':
+                when, row = enabled, 'NEW'
+                old_json, new_json = "NULL", audit_changes_json(columns, masked, 'NEW', "NEW.{col} IS NOT NULL")
+            elif event == 'DELETE':
+                when, row = enabled, 'OLD'
+                old_json, new_json = audit_changes_json(columns, masked, 'OLD', "OLD.{col} IS NOT NULL"), "NULL"
+            else:
+                changed = " OR ".join(f"OLD.{column} IS NOT NEW.{column}" for column in columns)
+                when, row = f"{enabled} AND ({changed})", 'NEW'
+                old_json = audit_changes_json(columns, masked, 'OLD', "OLD.{col} IS NOT NEW.{col}")
+                new_json = audit_changes_json(columns, masked, 'NEW', "OLD.{col} IS NOT NEW.{col}")
+            c.execute(f'''
+                CREATE TRIGGER {trigger} AFTER {event} ON {table_name}
+                WHEN {when}
+                BEGIN
+                    INSERT INTO AuditLog (user_id, action_type, table_name, record_id, old_value, new_value)
+                    VALUES (COALESCE((SELECT user_id FROM AuditContext WHERE id = 1), {AUDIT_SYSTEM_USER_ID}),
+                            '{event}', '{table_name}', {row}.{spec['key']}, {old_json}, {new_json});
+                END''')
+
+def set_audit_user(conn, user_id: Optional[int]):
+    """
+    تحديد المستخدم المنفذ للتعديلات في معاملة الاتصال الحالية (None للنظام). تُستدعى قبل أول
+    تعديل في المعاملة، وتُنهى المعاملة بـ commit_audited حتى لا يبقى المستخدم بعدها.
+    """
+    conn.execute(
+        "INSERT INTO AuditContext (id, user_id) VALUES (1, ?) ON CONFLICT(id) DO UPDATE SET user_id = excluded.user_id",
+        (user_id,)
+    )
+
+def commit_audited(conn):
+    """
+    إنهاء معاملة بدأت بـ set_audit_user بعد إعادة المستخدم المنفذ إلى NULL في المعاملة نفسها،
+    فأي تعديل لاحق لم يحدد مستخدمه يُنسب إلى النظام لا إلى آخر مستخدم كتب في قاعدة البيانات.
+    """
+    conn.execute("UPDATE AuditContext SET user_id = NULL WHERE id = 1")
     conn.commit()
-    conn.close()
+
+def get_audit_settings() -> Dict[str, bool]:
+    """حالة تسجيل التعديلات لكل جدول"""
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        return {table_name: bool(enabled) for table_name, enabled in conn.execute(
+            "SELECT table_name, enabled FROM AuditSettings ORDER BY table_name"
+        )}
+    finally:
+        conn.close()
+
+def set_audit_table_enabled(table_name: str, enabled: bool):
+    """تفعيل أو تعطيل تسجيل تعديلات جدول (دون تغيير المخطط أو المشغلات)"""
+    if table_name not in AUDIT_TABLES:
+        raise ValueError(f"جدول غير مدعوم في سجل التعديلات: {table_name}")
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        conn.execute("UPDATE AuditSettings SET enabled = ? WHERE table_name = ?", (int(enabled), table_name))
+        conn.commit()
+    finally:
+        conn.close()
+
+# جداول التجميع الزمني وتعبير الفترة الزمنية (bucket) لكل منها
+ROLLUP_TABLES = {
+    'DailyResponseRollups': "DATE({row}.submission_date)",
+    'HourlyResponseRollups': "strftime('%Y-%m-%d %H:00', {row}.submission_date)",
+}
+
+def create_rollup_triggers(c, table_name: str):
+    """مشغلات تحافظ على جدول التجميع متزامناً مع جدول Responses عند الإضافة والتعديل والحذف"""
+    bucket = ROLLUP_TABLES[table_name]
+    add_row = f'''
+        INSERT INTO {table_name} (survey_id, region_id, bucket, is_completed, response_count)
+        VALUES (NEW.survey_id, NEW.region_id, {bucket.format(row='NEW')},
+                CASE WHEN NEW.is_completed THEN 1 ELSE 0 END, 1)
+        ON CONFLICT(survey_id, bucket, region_id, is_completed) DO UPDATE
+        SET response_count = response_count + 1;'''
+    remove_row = f'''
+        UPDATE {table_name} SET response_count = response_count - 1
+        WHERE survey_id = OLD.survey_id AND region_id = OLD.region_id
+          AND bucket = {bucket.format(row='OLD')}
+          AND is_completed = CASE WHEN OLD.is_completed THEN 1 ELSE 0 END;
+        DELETE FROM {table_name} WHERE response_count <= 0;'''
+    prefix = f"trg_{table_name.lower()}"
+    c.execute(f"""CREATE TRIGGER IF NOT EXISTS {prefix}_insert AFTER INSERT ON Responses
+                  BEGIN {add_row} END""")
+    c.execute(f"""CREATE TRIGGER IF NOT EXISTS {prefix}_delete AFTER DELETE ON Responses
+                  BEGIN {remove_row} END""")
+    c.execute(f"""CREATE TRIGGER IF NOT EXISTS {prefix}_update
+                  AFTER UPDATE OF survey_id, region_id, submission_date, is_completed ON Responses
+                  BEGIN {remove_row} {add_row} END""")
+
+def rebuild_rollup_table(c, table_name: str):
+    """إعادة حساب جدول التجميع بالكامل من جدول Responses"""
+    bucket = ROLLUP_TABLES[table_name].format(row='r')
+    c.execute(f"DELETE FROM {table_name}")
+    c.execute(f'''
+        INSERT INTO {table_name} (survey_id, region_id, bucket, is_completed, response_count)
+        SELECT r.survey_id, r.region_id, {bucket},
+               CASE WHEN r.is_completed THEN 1 ELSE 0 END, COUNT(*)
+        FROM Responses r
+        GROUP BY 1, 2, 3, 4
+    ''')
+
+def rebuild_rollups() -> Dict[str, int]:
+    """إعادة بناء جميع جداول التجميع وإرجاع عدد الصفوف في كل منها"""
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        counts = {}
+        for table_name in ROLLUP_TABLES:
+            rebuild_rollup_table(conn, table_name)
+            counts[table_name] = conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+        conn.commit()
+        return counts
+    finally:
+        conn.close()
+
+def vacuum_database() -> Dict[str, int]:
+    """
+    حذف رموز منع التكرار المنتهية ثم ضغط ملف قاعدة البيانات وتحديث إحصائيات المخطط،
+    وإرجاع الحجم قبل وبعد بالبايت
+    """
+    before = Path(DATABASE_PATH).stat().st_size
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        with conn:
+            conn.execute("DELETE FROM SubmissionTokens WHERE created_at < DATETIME('now', ?)",
+                         (f"-{SUBMISSION_TOKEN_TTL_DAYS} days",))
+        conn.execute("VACUUM")
+        conn.execute("ANALYZE")
+        conn.execute("PRAGMA optimize")
+    finally:
+        conn.close()
+    return {'before': before, 'after': Path(DATABASE_PATH).stat().st_size}
+
+RESPONSE_STATUS_VALUES = {'completed': 1, 'draft': 0}
+# فلاتر تحتاج جدول Responses نفسه لأنها غير موجودة في جداول التجميع
+RESPONSE_ONLY_FILTERS = ('user_id', 'finding')
+
+def build_response_filters(filters: Optional[Dict] = None,
+                           date_expr: str = "DATE(r.submission_date)") -> Tuple[str, list]:
+    """تحويل فلاتر الإجابات إلى شروط SQL (تفترض الاسمين المستعارين r و ha)"""
+    filters = filters or {}
+    conditions = []
+    params = []
+    if filters.get('governorate_id'):
+        conditions.append("ha.governorate_id = ?")
+        params.append(filters['governorate_id'])
+    if filters.get('admin_id'):
+        conditions.append("r.region_id = ?")
+        params.append(filters['admin_id'])
+    if filters.get('user_id'):
+        conditions.append("r.user_id = ?")
+        params.append(filters['user_id'])
+    if filters.get('completed_only'):
+        conditions.append("r.is_completed = 1")
+    if filters.get('status') in RESPONSE_STATUS_VALUES:
+        conditions.append("r.is_completed = ?")
+        params.append(RESPONSE_STATUS_VALUES[filters['status']])
+    if filters.get('finding'):
+        # الإجابات التي لها ملاحظات جودة من آخر تشغيل لمحرك التحقق (بأي نوع أو بنوع قاعدة محدد)
+        if filters['finding'] == 'any':
+            conditions.append("EXISTS (SELECT 1 FROM ValidationFindings vf WHERE vf.response_id = r.response_id)")
+        else:
+            conditions.append("""EXISTS (SELECT 1 FROM ValidationFindings vf
+                                 WHERE vf.response_id = r.response_id AND vf.rule_type = ?)""")
+            params.append(filters['finding'])
+    if filters.get('date_from'):
+        conditions.append(f"{date_expr} >= ?")
+        params.append(str(filters['date_from']))
+    if filters.get('date_to'):
+        conditions.append(f"{date_expr} <= ?")
+        params.append(str(filters['date_to']))
+    sql = ''.join(f" AND {condition}" for condition in conditions)
+    return sql, params
+
+def count_survey_responses(survey_id: int, filters: Optional[Dict] = None) -> Dict[str, int]:
+    """
+    عدد الإجابات (الإجمالي والمكتمل وعدد الإدارات الصحية) من جدول التجميع اليومي.
+    فلاتر المستخدم وملاحظات الجودة غير موجودة في التجميع، فيُحسب حينها من جدول Responses مباشرة.
+    """
+    filters = dict(filters or {})
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        if any(filters.get(key) for key in RESPONSE_ONLY_FILTERS):
+            filter_sql, params = build_response_filters(filters)
+            row = conn.execute(f'''
+                SELECT COUNT(*), COALESCE(SUM(CASE WHEN r.is_completed THEN 1 ELSE 0 END), 0),
+                       COUNT(DISTINCT r.region_id)
+                FROM Responses r
+                JOIN HealthAdministrations ha ON r.region_id = ha.admin_id
+                WHERE r.survey_id = ?{filter_sql}
+            ''', [survey_id] + params).fetchone()
+        else:
+            # جدول التجميع يحمل نفس أسماء الأعمدة، والتاريخ فيه هو عمود الفترة اليومية
+            filter_sql, params = build_response_filters(filters, date_expr="r.bucket")
+            row = conn.execute(f'''
+                SELECT COALESCE(SUM(r.response_count), 0),
+                       COALESCE(SUM(CASE WHEN r.is_completed THEN r.response_count ELSE 0 END), 0),
+                       COUNT(DISTINCT r.region_id)
+                FROM DailyResponseRollups r
+                JOIN HealthAdministrations ha ON r.region_id = ha.admin_id
+                WHERE r.survey_id = ?{filter_sql}
+            ''', [survey_id] + params).fetchone()
+        return {'total': row[0], 'completed': row[1], 'regions': row[2]}
+    finally:
+        conn.close()
+
+# دقة السلسلة الزمنية: (جدول التجميع، تعبير الفترة، طول الفترة بالأيام) من الأدق إلى الأعم
+TREND_RESOLUTIONS = {
+    'hour': ('HourlyResponseRollups', "r.bucket", 1 / 24),
+    'day': ('DailyResponseRollups', "r.bucket", 1),
+    'week': ('DailyResponseRollups', "DATE(r.bucket, 'weekday 0', '-6 days')", 7),
+    'month': ('DailyResponseRollups', "substr(r.bucket, 1, 7)", 30),
+}
+TREND_SERIES = {
+    None: "'الإجمالي'",
+    'governorate': "g.governorate_name",
+    'admin': "ha.admin_name",
+}
+
+def get_submission_trend(survey_id: int, filters: Optional[Dict] = None,
+                         resolution: str = 'hour', split_by: Optional[str] = None,
+                         max_points: int = 500) -> Dict:
+    """
+    عدد الإجابات عبر الزمن من جداول التجميع فقط.
+    تُستخدم الدقة المطلوبة أو أول دقة أعم منها لا يتجاوز فيها عدد الفترات max_points.
+    """
+    filters = {k: v for k, v in (filters or {}).items() if k not in RESPONSE_ONLY_FILTERS}
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        filter_sql, params = build_response_filters(filters, date_expr="r.bucket")
+        first, last = conn.execute(f'''
+            SELECT MIN(r.bucket), MAX(r.bucket)
+            FROM DailyResponseRollups r
+            JOIN HealthAdministrations ha ON r.region_id = ha.admin_id
+            WHERE r.survey_id = ?{filter_sql}
+        ''', [survey_id] + params).fetchone()
+        if not first:
+            return {'resolution': resolution, 'rows': []}
+
+        span_days = (date.fromisoformat(last) - date.fromisoformat(first)).days + 1
+        names = list(TREND_RESOLUTIONS)
+        for resolution in names[names.index(resolution):]:
+            if span_days / TREND_RESOLUTIONS[resolution][2] <= max_points:
+                break
+        table_name, period_expr, _ = TREND_RESOLUTIONS[resolution]
+
+        if table_name == 'HourlyResponseRollups' and filters.get('date_to'):
+            # فترات الساعة تحمل الوقت بعد التاريخ، فيشمل الحد الأعلى اليوم بأكمله
+            filters['date_to'] = f"{filters['date_to']} 23:59"
+        filter_sql, params = build_response_filters(filters, date_expr="r.bucket")
+        rows = conn.execute(f'''
+            SELECT {period_expr} AS period, {TREND_SERIES[split_by]} AS series,
+                   SUM(r.response_count),
+                   SUM(CASE WHEN r.is_completed THEN r.response_count ELSE 0 END)
+            FROM {table_name} r
+            JOIN HealthAdministrations ha ON r.region_id = ha.admin_id
+            JOIN Governorates g ON ha.governorate_id = g.governorate_id
+            WHERE r.survey_id = ?{filter_sql}
+            GROUP BY period, series
+            ORDER BY period
+        ''', [survey_id] + params).fetchall()
+        return {'resolution': resolution, 'rows': rows}
+    finally:
+        conn.close()
+
+def get_responses_page(survey_id: int, filters: Optional[Dict] = None,
+                       after: Optional[Tuple[str, int]] = None, page_size: int = 50) -> List[Tuple]:
+    """
+    صفحة من إجابات الاستبيان مرتبة من الأحدث، بالترقيم بالمفتاح على (submission_date, response_id).
+    after هو (تاريخ التقديم، معرف الإجابة) لآخر صف في الصفحة السابقة.
+    """
+    filter_sql, params = build_response_filters(filters)
+    if after:
+        filter_sql += " AND (r.submission_date, r.response_id) < (?, ?)"
+        params = params + list(after)
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        return conn.execute(f'''
+            SELECT r.response_id, u.username, ha.admin_name, g.governorate_name,
+                   r.submission_date, r.is_completed
+            FROM Responses r
+            JOIN Users u ON r.user_id = u.user_id
+            JOIN HealthAdministrations ha ON r.region_id = ha.admin_id
+            JOIN Governorates g ON ha.governorate_id = g.governorate_id
+            WHERE r.survey_id = ?{filter_sql}
+            ORDER BY r.submission_date DESC, r.response_id DESC
+            LIMIT ?
+        ''', [survey_id] + params + [page_size]).fetchall()
+    except sqlite3.Error as e:
+        st.error(f"حدث خطأ في جلب الإجابات: {str(e)}")
+        return []
+    finally:
+        conn.close()
+
+# مصادر جداول الإدارة: (العنوان، التعبير) لكل عمود والأول هو المعرف، وأعمدة البحث
+GRID_SOURCES = {
+    'users': {
+        'from': '''Users u
+            LEFT JOIN HealthAdministrations h ON u.assigned_region = h.admin_id
+            LEFT JOIN Governorates g ON h.governorate_id = g.governorate_id
+            LEFT JOIN GovernorateAdmins ga ON u.user_id = ga.user_id
+            LEFT JOIN Governorates gg ON ga.governorate_id = gg.governorate_id''',
+        'columns': [
+            ("ID", "u.user_id"),
+            ("اسم المستخدم", "u.username"),
+            ("الدور", "CASE u.role WHEN 'admin' THEN 'مسؤول نظام' "
+                      "WHEN 'governorate_admin' THEN 'مسؤول محافظة' ELSE 'موظف' END"),
+            ("المحافظة", "COALESCE(g.governorate_name, gg.governorate_name, 'غير محدد')"),
+            ("الإدارة الصحية", "COALESCE(h.admin_name, 'غير محدد')"),
+        ],
+        'search': ["u.username", "g.governorate_name", "gg.governorate_name", "h.admin_name"],
+    },
+    'governorates': {
+        'from': "Governorates g",
+        'columns': [
+            ("ID", "g.governorate_id"),
+            ("المحافظة", "g.governorate_name"),
+            ("الوصف", "COALESCE(NULLIF(g.description, ''), 'لا يوجد وصف')"),
+        ],
+        'search': ["g.governorate_name", "g.description"],
+    },
+    'regions': {
+        'from': "HealthAdministrations h JOIN Governorates g ON h.governorate_id = g.governorate_id",
+        'columns': [
+            ("ID", "h.admin_id"),
+            ("الإدارة الصحية", "h.admin_name"),
+            ("الوصف", "COALESCE(NULLIF(h.description, ''), 'لا يوجد وصف')"),
+            ("المحافظة", "g.governorate_name"),
+        ],
+        'search': ["h.admin_name", "h.description", "g.governorate_name"],
+    },
+    'surveys': {
+        'from': "Surveys s",
+        'columns': [
+            ("ID", "s.survey_id"),
+            ("الاستبيان", "s.survey_name"),
+            ("تاريخ الإنشاء", "s.created_at"),
+            ("الحالة", "CASE WHEN s.is_active THEN 'نشط' ELSE 'غير نشط' END"),
+        ],
+        'search': ["s.survey_name"],
+    },
+}
+
+def get_grid_page(source: str, search: str = "", sort_by: Optional[str] = None, descending: bool = False,
+                  page: int = 1, page_size: int = 50) -> Tuple[List[Tuple], int]:
+    """
+    صفحة من أحد جداول الإدارة مع البحث والترتيب والترقيم في SQL، وإرجاع (الصفوف، العدد الكلي المطابق).
+    sort_by عنوان أحد الأعمدة المعرفة فقط (لا يُمرر نص المستخدم إلى SQL).
+    """
+    spec = GRID_SOURCES[source]
+    expressions = dict(spec['columns'])
+    key_expr = spec['columns'][0][1]
+    where, params = "", []
+    if search:
+        where = "WHERE " + " OR ".join(f"{column} LIKE ?" for column in spec['search'])
+        params = [f"%{search}%"] * len(spec['search'])
+    order = f"{expressions.get(sort_by, key_expr)} {'DESC' if descending else 'ASC'}, {key_expr}"
+    select = ", ".join(f'{expression} AS "{label}"' for label, expression in spec['columns'])
+
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        total = conn.execute(
+            f"SELECT COUNT(DISTINCT {key_expr}) FROM {spec['from']} {where}", params
+        ).fetchone()[0]
+        rows = conn.execute(f'''
+            SELECT {select} FROM {spec['from']} {where}
+            GROUP BY {key_expr}
+            ORDER BY {order}
+            LIMIT ? OFFSET ?
+        ''', params + [page_size, (max(page, 1) - 1) * page_size]).fetchall()
+        return rows, total
+    except sqlite3.Error as e:
+        st.error(f"حدث خطأ في جلب البيانات: {str(e)}")
+        return [], 0
+    finally:
+        conn.close()
 
 def get_user_by_username(username):
     conn = sqlite3.connect(DATABASE_PATH)
@@ -165,6 +910,18 @@ def get_health_admins():
     conn.close()
     return admins
 
+def get_health_admins_by_governorate(governorate_id: int) -> List[Tuple[int, str]]:
+    """الإدارات الصحية التابعة لمحافظة معينة مرتبة بالاسم"""
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        return conn.execute('''
+            SELECT admin_id, admin_name FROM HealthAdministrations
+            WHERE governorate_id = ?
+            ORDER BY admin_name
+        ''', (governorate_id,)).fetchall()
+    finally:
+        conn.close()
+
 def get_health_admin_name(admin_id):
     """استرجاع اسم الإدارة الصحية بناءً على المعرف"""
     if admin_id is None:
@@ -205,6 +962,238 @@ def save_response(survey_id, user_id, region_id, is_completed=False):
         if conn:
             conn.close()
 
+# أعمدة القيم المكتوبة في Response_Details
+TYPED_ANSWER_COLUMNS = {
+    'answer_number': 'REAL',
+    'answer_date': 'TEXT',
+    'answer_bool': 'INTEGER',
+}
+TYPED_FIELD_COLUMNS = {'number': 'answer_number', 'date': 'answer_date', 'checkbox': 'answer_bool'}
+BOOL_TEXT_VALUES = {'true': 1, '1': 1, 'نعم': 1, 'false': 0, '0': 0, 'لا': 0}
+TYPED_BACKFILL_CHUNK = 5000
+# أقصى عدد معرفات في شرط IN واحد (أقل من حد متغيرات SQLite)
+SQL_VARIABLES_CHUNK = 500
+
+def typed_answer_values(field_type: str, value) -> Tuple[Optional[float], Optional[str], Optional[int]]:
+    """
+    تحويل الإجابة إلى (رقم، تاريخ بصيغة ISO، قيمة منطقية) حسب نوع الحقل.
+    القيم التي لا يمكن تحويلها تبقى NULL مع الاحتفاظ بالنص الأصلي في answer_value.
+    """
+    number = day = flag = None
+    if value is None or value == "":
+        return number, day, flag
+
+    if field_type == 'number':
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            pass
+    elif field_type == 'date':
+        if isinstance(value, (date, datetime)):
+            day = value.strftime("%Y-%m-%d")
+        else:
+            try:
+                day = date.fromisoformat(str(value).strip()[:10]).isoformat()
+            except ValueError:
+                pass
+    elif field_type == 'checkbox':
+        if isinstance(value, bool):
+            flag = int(value)
+        else:
+            flag = BOOL_TEXT_VALUES.get(str(value).strip().lower())
+    return number, day, flag
+
+def draft_value(field_type: str, value: Optional[str]):
+    """تحويل قيمة المسودة المخزنة نصياً إلى القيمة المناسبة لعنصر الإدخال"""
+    if value is None:
+        return None
+    try:
+        if field_type == 'number':
+            return float(value)
+        if field_type == 'checkbox':
+            # نفس القيم المقبولة في answer_bool ("true" و"1" و"نعم" من الواجهة والاستيراد)
+            flag = BOOL_TEXT_VALUES.get(value.strip().lower())
+            return bool(flag) if flag is not None else None
+        if field_type == 'date':
+            return date.fromisoformat(value[:10])
+    except ValueError:
+        return None
+    return value
+
+def normalize_answer(field_type: str, field_options: Optional[str], value) -> Tuple[Optional[str], Optional[str]]:
+    """
+    تحويل قيمة مُدخلة إلى النص المخزن بنفس صيغة نموذج الموظف مع التحقق من نوع الحقل.
+    يرجع (النص أو None للقيمة الفارغة، رسالة الخطأ).
+    """
+    if value is None or (isinstance(value, float) and value != value) or (isinstance(value, str) and not value.strip()):
+        return None, None
+    if field_type == 'number':
+        number = typed_answer_values(field_type, value)[0]
+        return (str(number), None) if number is not None and math.isfinite(number) else (None, f"'{value}' ليس رقماً")
+    if field_type == 'date':
+        day = typed_answer_values(field_type, value)[1]
+        return (day, None) if day else (None, f"'{value}' ليس تاريخاً بصيغة YYYY-MM-DD")
+    if field_type == 'checkbox':
+        flag = typed_answer_values(field_type, value)[2]
+        return (str(bool(flag)), None) if flag is not None else (None, f"'{value}' ليست قيمة نعم/لا")
+    if field_type == 'dropdown':
+        options = json.loads(field_options) if field_options else []
+        if str(value) not in options:
+            return None, f"'{value}' ليس من الخيارات المتاحة"
+    return str(value), None
+
+def fill_typed_answers(c, field_id: Optional[int] = None) -> int:
+    """
+    حساب القيم المكتوبة للإجابات الموجودة على دفعات (لكل الإجابات أو لحقل واحد)
+    وإرجاع عدد الصفوف المعالجة
+    """
+    field_filter = "AND rd.field_id = ?" if field_id is not None else ""
+    last_id, processed = 0, 0
+    while True:
+        rows = c.execute(f'''
+            SELECT rd.detail_id, sf.field_type, rd.answer_value
+            FROM Response_Details rd
+            JOIN Survey_Fields sf ON rd.field_id = sf.field_id
+            WHERE rd.detail_id > ? {field_filter}
+            ORDER BY rd.detail_id
+            LIMIT ?
+        ''', [last_id] + ([field_id] if field_id is not None else []) + [TYPED_BACKFILL_CHUNK]).fetchall()
+        if not rows:
+            return processed
+        c.executemany(
+            """UPDATE Response_Details SET answer_number = ?, answer_date = ?, answer_bool = ?
+               WHERE detail_id = ?""",
+            [typed_answer_values(field_type, value) + (detail_id,) for detail_id, field_type, value in rows]
+        )
+        last_id = rows[-1][0]
+        processed += len(rows)
+
+def canonical_answer(field_type: str, value):
+    """الصيغة المعيارية للقيمة في بصمة المحتوى: القيمة المكتوبة إن وجدت وإلا النص دون مسافات"""
+    for typed in typed_answer_values(field_type, value):
+        if typed is not None:
+            return typed
+    text = str(value).strip() if value is not None else ""
+    return text or None
+
+def answers_content_hash(answers: List[Tuple[int, str, object]]) -> Optional[str]:
+    """
+    بصمة SHA-256 لإجابات [(field_id، نوع الحقل، القيمة)] مرتبة حسب field_order. الحقول الفارغة
+    لا تدخل في البصمة، والإجابة الفارغة تماماً ليس لها بصمة.
+    """
+    canonical = [[field_id, typed] for field_id, field_type, value in answers
+                 for typed in (canonical_answer(field_type, value),) if typed is not None]
+    if not canonical:
+        return None
+    return hashlib.sha256(json.dumps(canonical, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def update_content_hashes(c, response_ids: List[int]) -> int:
+    """إعادة حساب بصمة المحتوى لإجابات محددة من تفاصيلها المخزنة، وإرجاع عدد البصمات التي تغيرت"""
+    changed = 0
+    for start in range(0, len(response_ids), SQL_VARIABLES_CHUNK):
+        chunk = response_ids[start:start + SQL_VARIABLES_CHUNK]
+        answers = {response_id: [] for response_id in chunk}
+        for response_id, field_id, field_type, value in c.execute(f'''
+            SELECT rd.response_id, rd.field_id, sf.field_type, rd.answer_value
+            FROM Response_Details rd
+            JOIN Survey_Fields sf ON rd.field_id = sf.field_id
+            WHERE rd.response_id IN ({",".join("?" * len(chunk))})
+            ORDER BY rd.response_id, sf.field_order, rd.field_id
+        ''', chunk):
+            answers[response_id].append((field_id, field_type, value))
+        # التحديث فقط عند تغير البصمة حتى لا ترتفع إصدارات البيانات دون داع
+        changed += c.executemany(
+            "UPDATE Responses SET content_hash = ? WHERE response_id = ? AND content_hash IS NOT ?",
+            [(content_hash, response_id, content_hash)
+             for response_id, content_hash in ((rid, answers_content_hash(a)) for rid, a in answers.items())]
+        ).rowcount
+    return changed
+
+def fill_content_hashes(c, survey_id: Optional[int] = None) -> int:
+    """حساب بصمة المحتوى لكل الإجابات (أو إجابات استبيان واحد) على دفعات وإرجاع عدد الإجابات المعالجة"""
+    survey_filter = "AND survey_id = ?" if survey_id is not None else ""
+    last_id, processed = 0, 0
+    while True:
+        response_ids = [row[0] for row in c.execute(f'''
+            SELECT response_id FROM Responses
+            WHERE response_id > ? {survey_filter}
+            ORDER BY response_id
+            LIMIT ?
+        ''', [last_id] + ([survey_id] if survey_id is not None else []) + [TYPED_BACKFILL_CHUNK])]
+        if not response_ids:
+            return processed
+        update_content_hashes(c, response_ids)
+        last_id = response_ids[-1]
+        processed += len(response_ids)
+
+def backfill_content_hashes() -> int:
+    """إعادة حساب بصمة المحتوى لجميع الإجابات"""
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        processed = fill_content_hashes(conn)
+        conn.commit()
+        return processed
+    finally:
+        conn.close()
+
+def find_duplicate_response(c, response_id: int) -> Optional[int]:
+    """أقدم إجابة مكتملة أخرى في نفس الاستبيان بنفس بصمة المحتوى (بحث واحد في الفهرس)"""
+    return c.execute('''
+        SELECT MIN(d.response_id)
+        FROM Responses r
+        JOIN Responses d ON d.survey_id = r.survey_id AND d.content_hash = r.content_hash
+        WHERE r.response_id = ? AND d.response_id <> r.response_id AND d.is_completed = TRUE
+    ''', (response_id,)).fetchone()[0]
+
+def get_duplicate_response_groups(survey_id: int, limit: int = 200) -> Dict:
+    """
+    مجموعات الإجابات المكتملة المتطابقة المحتوى في الاستبيان (الأكبر أولاً)، مع عدد الإجابات
+    الزائدة في كل المجموعات: {'groups': [(العدد، [المعرفات]، [المستخدمين]، أول تاريخ، آخر تاريخ)], 'extra': n}
+    """
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        extra = conn.execute('''
+            SELECT COALESCE(SUM(copies - 1), 0) FROM (
+                SELECT COUNT(*) AS copies FROM Responses
+                WHERE survey_id = ? AND content_hash IS NOT NULL AND is_completed = TRUE
+                GROUP BY content_hash HAVING COUNT(*) > 1)
+        ''', (survey_id,)).fetchone()[0]
+        groups = conn.execute('''
+            SELECT COUNT(*), GROUP_CONCAT(r.response_id), GROUP_CONCAT(DISTINCT u.username),
+                   MIN(r.submission_date), MAX(r.submission_date)
+            FROM Responses r
+            LEFT JOIN Users u ON r.user_id = u.user_id
+            WHERE r.survey_id = ? AND r.content_hash IS NOT NULL AND r.is_completed = TRUE
+            GROUP BY r.content_hash
+            HAVING COUNT(*) > 1
+            ORDER BY COUNT(*) DESC, MIN(r.response_id)
+            LIMIT ?
+        ''', (survey_id, limit)).fetchall()
+        return {
+            'groups': [(copies, sorted(int(i) for i in ids.split(",")), (users or "").split(","), first, last)
+                       for copies, ids, users, first, last in groups],
+            'extra': extra,
+        }
+    except sqlite3.Error as e:
+        st.error(f"حدث خطأ في البحث عن الإجابات المكررة: {str(e)}")
+        return {'groups': [], 'extra': 0}
+    finally:
+        conn.close()
+
+def backfill_typed_answers() -> int:
+    """إعادة حساب القيم المكتوبة لجميع الإجابات"""
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        processed = fill_typed_answers(conn)
+        conn.commit()
+        return processed
+    finally:
+        conn.close()
+
+def get_field_type(c, field_id: int) -> Optional[str]:
+    row = c.execute("SELECT field_type FROM Survey_Fields WHERE field_id = ?", (field_id,)).fetchone()
+    return row[0] if row else None
+
 def save_response_detail(response_id, field_id, answer_value):
     """حفظ تفاصيل الإجابة"""
     conn = None
@@ -213,8 +1202,11 @@ def save_response_detail(response_id, field_id, answer_value):
         c = conn.cursor()
         
         c.execute(
-            "INSERT INTO Response_Details (response_id, field_id, answer_value) VALUES (?, ?, ?)",
+            """INSERT INTO Response_Details
+               (response_id, field_id, answer_value, answer_number, answer_date, answer_bool)
+               VALUES (?, ?, ?, ?, ?, ?)""",
             (response_id, field_id, str(answer_value) if answer_value is not None else "")
+            + typed_answer_values(get_field_type(c, field_id), answer_value)
         )
         conn.commit()
         return True
@@ -225,17 +1217,18 @@ def save_response_detail(response_id, field_id, answer_value):
         if conn:
             conn.close()
             
-def save_survey(survey_name, fields, governorate_ids=None):
+def save_survey(survey_name, fields, acting_user_id, governorate_ids=None):
     """حفظ استبيان جديد مع حقوله في قاعدة البيانات"""
     conn = None
     try:
         conn = sqlite3.connect(DATABASE_PATH)
         c = conn.cursor()
+        set_audit_user(conn, acting_user_id)
         
         # 1. حفظ الاستبيان الأساسي
         c.execute(
             "INSERT INTO Surveys (survey_name, created_by) VALUES (?, ?)",
-            (survey_name, st.session_state.user_id)
+            (survey_name, acting_user_id)
         )
         survey_id = c.lastrowid
         
@@ -263,7 +1256,7 @@ def save_survey(survey_name, fields, governorate_ids=None):
                  i + 1)
             )
         
-        conn.commit()
+        commit_audited(conn)
         return True
         
     except sqlite3.Error as e:
@@ -285,12 +1278,13 @@ def update_user_activity(user_id):
     conn.commit()
     conn.close()
 
-def delete_survey(survey_id):
+def delete_survey(survey_id, acting_user_id):
     """حذف استبيان وجميع بياناته المرتبطة"""
     conn = None
     try:
         conn = sqlite3.connect(DATABASE_PATH)
         c = conn.cursor()
+        set_audit_user(conn, acting_user_id)
         
         # حذف تفاصيل الإجابات المرتبطة
         c.execute('''
@@ -300,6 +1294,11 @@ def delete_survey(survey_id):
             )
         ''', (survey_id,))
         
+        # حذف قواعد وملاحظات جودة البيانات ورموز منع التكرار
+        for table_name in ('ValidationFindings', 'ValidationRules', 'ValidationRuns', 'ValidationQueue',
+                           'SnapshotRuns', 'SnapshotQueue', 'SubmissionTokens'):
+            c.execute(f"DELETE FROM {table_name} WHERE survey_id = ?", (survey_id,))
+        
         # حذف الإجابات المرتبطة
         c.execute("DELETE FROM Responses WHERE survey_id = ?", (survey_id,))
         
@@ -309,7 +1308,7 @@ def delete_survey(survey_id):
         # حذف الاستبيان نفسه
         c.execute("DELETE FROM Surveys WHERE survey_id = ?", (survey_id,))
         
-        conn.commit()
+        commit_audited(conn)
         st.success("تم حذف الاستبيان بنجاح")
         return True
     except sqlite3.Error as e:
@@ -319,7 +1318,7 @@ def delete_survey(survey_id):
         if conn:
             conn.close()        
 
-def add_health_admin(admin_name, description, governorate_id):
+def add_health_admin(admin_name, description, governorate_id, acting_user_id=None):
     """إضافة إدارة صحية جديدة إلى قاعدة البيانات مع التحقق من التكرار"""
     conn = None
     try:
@@ -334,11 +1333,12 @@ def add_health_admin(admin_name, description, governorate_id):
             return False
         
         # إضافة الإدارة الجديدة
+        set_audit_user(conn, acting_user_id)
         c.execute(
             "INSERT INTO HealthAdministrations (admin_name, description, governorate_id) VALUES (?, ?, ?)",
             (admin_name, description, governorate_id)
         )
-        conn.commit()
+        commit_audited(conn)
         st.success(f"تمت إضافة الإدارة الصحية '{admin_name}' بنجاح")
         return True
         
@@ -356,12 +1356,13 @@ def get_governorates_list():
     governorates = c.fetchall()
     conn.close()
     return governorates      
-def update_survey(survey_id, survey_name, is_active, fields):
+def update_survey(survey_id, survey_name, is_active, fields, acting_user_id):
     """تحديث بيانات الاستبيان وحقوله"""
     conn = None
     try:
         conn = sqlite3.connect(DATABASE_PATH)
         c = conn.cursor()
+        set_audit_user(conn, acting_user_id)
         
         # 1. تحديث بيانات الاستبيان الأساسية
         c.execute(
@@ -374,6 +1375,7 @@ def update_survey(survey_id, survey_name, is_active, fields):
             field_options = json.dumps(field.get('field_options', [])) if field.get('field_options') else None
             
             if 'field_id' in field:  # حقل موجود يتم تحديثه
+                old_type = get_field_type(c, field['field_id'])
                 c.execute(
                     """UPDATE Survey_Fields 
                        SET field_label=?, field_type=?, field_options=?, is_required=?
@@ -384,6 +1386,10 @@ def update_survey(survey_id, survey_name, is_active, fields):
                      field.get('is_required', False),
                      field['field_id'])
                 )
+                # تغيير نوع الحقل يتطلب إعادة حساب القيم المكتوبة لإجاباته
+                if old_type != field['field_type']:
+                    fill_typed_answers(c, field['field_id'])
+                    fill_content_hashes(c, survey_id)
             else:  # حقل جديد يتم إضافته
                 c.execute("SELECT MAX(field_order) FROM Survey_Fields WHERE survey_id=?", (survey_id,))
                 max_order = c.fetchone()[0] or 0
@@ -400,7 +1406,7 @@ def update_survey(survey_id, survey_name, is_active, fields):
                      max_order + 1)
                 )
         
-        conn.commit()
+        commit_audited(conn)
         st.success("تم تحديث الاستبيان بنجاح")
         return True
         
@@ -410,22 +1416,20 @@ def update_survey(survey_id, survey_name, is_active, fields):
     finally:
         if conn:
             conn.close()      
-def update_user(user_id, username, role, region_id=None):
+def update_user(user_id, username, role, acting_user_id, region_id=None):
     """تحديث بيانات المستخدم"""
     conn = None
     try:
         conn = sqlite3.connect(DATABASE_PATH)
         c = conn.cursor()
         
-        # الحصول على القيم القديمة أولاً
-        c.execute("SELECT username, role, assigned_region FROM Users WHERE user_id=?", (user_id,))
-        old_data = c.fetchone()
-        
         c.execute("SELECT 1 FROM Users WHERE username=? AND user_id!=?", (username, user_id))
         if c.fetchone():
             st.error("اسم المستخدم موجود بالفعل!")
             return False
         
+        # التعديل يُسجل في سجل التعديلات بمشغلات قاعدة البيانات في نفس المعاملة
+        set_audit_user(conn, acting_user_id)
         c.execute(
             "UPDATE Users SET username=?, role=?, assigned_region=? WHERE user_id=?",
             (username, role, region_id, user_id)
@@ -434,23 +1438,7 @@ def update_user(user_id, username, role, region_id=None):
         if role == 'governorate_admin':
             c.execute("DELETE FROM GovernorateAdmins WHERE user_id=?", (user_id,))
             
-        conn.commit()
-        
-        # تسجيل التعديل في سجل التعديلات
-        new_data = (username, role, region_id)
-        changes = {
-            'username': {'old': old_data[0], 'new': new_data[0]},
-            'role': {'old': old_data[1], 'new': new_data[1]},
-            'assigned_region': {'old': old_data[2], 'new': new_data[2]}
-        }
-        log_audit_action(
-            st.session_state.user_id, 
-            'UPDATE', 
-            'Users', 
-            user_id,
-            old_data,
-            new_data
-        )
+        commit_audited(conn)
         
         st.success("تم تحديث بيانات المستخدم بنجاح")
         return True
@@ -461,7 +1449,7 @@ def update_user(user_id, username, role, region_id=None):
         if conn:
             conn.close()
 
-def add_user(username, password, role, region_id=None):
+def add_user(username, password, role, region_id=None, acting_user_id=None):
     """إضافة مستخدم جديد إلى قاعدة البيانات"""
     from auth import hash_password
     
@@ -475,11 +1463,12 @@ def add_user(username, password, role, region_id=None):
             st.error("اسم المستخدم موجود بالفعل!")
             return False
         
+        set_audit_user(conn, acting_user_id)
         c.execute(
             "INSERT INTO Users (username, password_hash, role, assigned_region) VALUES (?, ?, ?, ?)",
             (username, hash_password(password), role, region_id)
         )
-        conn.commit()
+        commit_audited(conn)
         st.success("تمت إضافة المستخدم بنجاح")
         return True
     except sqlite3.Error as e:
@@ -505,17 +1494,19 @@ def get_governorate_admin(user_id):
         conn.close()  
 
 # دوال مسؤول المحافظة
-def add_governorate_admin(user_id: int, governorate_id: int) -> bool:
+def add_governorate_admin(user_id: int, governorate_id: int,
+                          acting_user_id: Optional[int] = None) -> bool:
     """
     إضافة مسؤول محافظة جديد
     """
     conn = sqlite3.connect(DATABASE_PATH)
     try:
+        set_audit_user(conn, acting_user_id)
         conn.execute(
             "INSERT INTO GovernorateAdmins (user_id, governorate_id) VALUES (?, ?)",
             (user_id, governorate_id)
         )
-        conn.commit()
+        commit_audited(conn)
         return True
     except sqlite3.Error as e:
         st.error(f"خطأ في إضافة مسؤول المحافظة: {str(e)}")
@@ -561,24 +1552,57 @@ def get_governorate_surveys(governorate_id: int) -> list:
     finally:
         conn.close()
 
-def get_governorate_employees(governorate_id: int) -> list:
+def get_governorate_employees_page(governorate_id: int, search: str = "", admin_id: Optional[int] = None,
+                                   page: int = 1, page_size: int = 50) -> Tuple[List[Dict], int]:
     """
-    الحصول على الموظفين التابعين لمحافظة معينة
+    صفحة من موظفي المحافظة باستعلام مجمع واحد: الإدارة الصحية والاستبيانات المسموح بها (JSON)
+    وآخر دخول وعدد الإجابات المكتملة اليوم، وإرجاع (الموظفين، العدد الكلي المطابق)
     """
+    where = "WHERE ha.governorate_id = ? AND u.role = 'employee'"
+    params: List = [governorate_id]
+    if search:
+        where += " AND u.username LIKE ?"
+        params.append(f"%{search}%")
+    if admin_id:
+        where += " AND u.assigned_region = ?"
+        params.append(admin_id)
+
     conn = sqlite3.connect(DATABASE_PATH)
     try:
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT u.user_id, u.username, ha.admin_name
+        total = conn.execute(f'''
+            SELECT COUNT(*) FROM Users u
+            JOIN HealthAdministrations ha ON u.assigned_region = ha.admin_id
+            {where}
+        ''', params).fetchone()[0]
+        rows = conn.execute(f'''
+            SELECT u.user_id, u.username, u.assigned_region, ha.admin_name, u.last_login,
+                   (SELECT json_group_array(json_array(s.survey_id, s.survey_name))
+                    FROM UserSurveys us JOIN Surveys s ON us.survey_id = s.survey_id
+                    WHERE us.user_id = u.user_id),
+                   (SELECT COUNT(*) FROM Responses r
+                    WHERE r.user_id = u.user_id AND r.submission_date >= DATE('now') AND r.is_completed)
             FROM Users u
             JOIN HealthAdministrations ha ON u.assigned_region = ha.admin_id
-            WHERE ha.governorate_id = ? AND u.role = 'employee'
+            {where}
             ORDER BY u.username
-        ''', (governorate_id,))
-        return cursor.fetchall()
+            LIMIT ? OFFSET ?
+        ''', params + [page_size, (max(page, 1) - 1) * page_size]).fetchall()
+        employees = [{
+            'user_id': user_id,
+            'username': username,
+            'admin_id': region_id,
+            'admin_name': admin_name,
+            'last_login': last_login,
+            'surveys': [tuple(survey) for survey in json.loads(surveys)],
+            'today_count': today_count,
+        } for user_id, username, region_id, admin_name, last_login, surveys, today_count in rows]
+        return employees, total
+    except sqlite3.Error as e:
+        st.error(f"حدث خطأ في جلب الموظفين: {str(e)}")
+        return [], 0
     finally:
-        conn.close()        
-        
+        conn.close()
+
 def get_allowed_surveys(user_id: int) -> List[Tuple[int, str]]:
     """الحصول على الاستبيانات المسموح بها للموظف"""
     conn = sqlite3.connect(DATABASE_PATH)
@@ -656,7 +1680,8 @@ def get_user_allowed_surveys(user_id: int) -> List[Tuple[int, str]]:
     finally:
         conn.close()
 
-def update_user_allowed_surveys(user_id: int, survey_ids: List[int]) -> bool:
+def update_user_allowed_surveys(user_id: int, survey_ids: List[int],
+                                acting_user_id: Optional[int] = None) -> bool:
     """تحديث الاستبيانات المسموح بها للمستخدم"""
     conn = sqlite3.connect(DATABASE_PATH)
     try:
@@ -685,16 +1710,18 @@ def update_user_allowed_surveys(user_id: int, survey_ids: List[int]) -> bool:
             if cursor.fetchone():
                 valid_surveys.append(survey_id)
         
-        # حذف جميع التصاريح الحالية
-        cursor.execute("DELETE FROM UserSurveys WHERE user_id=?", (user_id,))
-        
-        # إضافة التصاريح الجديدة
-        for survey_id in valid_surveys:
-            cursor.execute(
-                "INSERT INTO UserSurveys (user_id, survey_id) VALUES (?, ?)",
-                (user_id, survey_id))
+        # تعديل الفروق فقط حتى لا يُسجل حذف وإضافة كل التصاريح مع كل حفظ
+        current = {row[0] for row in cursor.execute(
+            "SELECT survey_id FROM UserSurveys WHERE user_id=?", (user_id,))}
+        set_audit_user(conn, acting_user_id)
+        cursor.executemany(
+            "DELETE FROM UserSurveys WHERE user_id=? AND survey_id=?",
+            [(user_id, survey_id) for survey_id in current - set(valid_surveys)])
+        cursor.executemany(
+            "INSERT INTO UserSurveys (user_id, survey_id) VALUES (?, ?)",
+            [(user_id, survey_id) for survey_id in set(valid_surveys) - current])
         
-        conn.commit()
+        commit_audited(conn)
         return True
     except sqlite3.Error as e:
         st.error(f"حدث خطأ في تحديث الاستبيانات المسموح بها: {str(e)}")
@@ -702,40 +1729,284 @@ def update_user_allowed_surveys(user_id: int, survey_ids: List[int]) -> bool:
     finally:
         conn.close()
         
-def get_response_details(response_id: int) -> List[Tuple]:
-    """الحصول على تفاصيل إجابة محددة"""
+def get_response_answers(response_id: int) -> Tuple[Optional[int], List[Tuple]]:
+    """
+    إصدار الإجابة وجميع حقول استبيانها مع القيمة المسجلة لكل حقل (None للحقول المتروكة فارغة):
+    (field_id, field_label, field_type, field_options, answer_value)
+    """
     conn = sqlite3.connect(DATABASE_PATH)
     try:
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT rd.detail_id, rd.field_id, sf.field_label, 
-                   sf.field_type, sf.field_options, rd.answer_value
-            FROM Response_Details rd
-            JOIN Survey_Fields sf ON rd.field_id = sf.field_id
-            WHERE rd.response_id = ?
+        response = conn.execute(
+            "SELECT survey_id, version FROM Responses WHERE response_id = ?", (response_id,)
+        ).fetchone()
+        if not response:
+            return None, []
+        fields = conn.execute('''
+            SELECT sf.field_id, sf.field_label, sf.field_type, sf.field_options, rd.answer_value
+            FROM Survey_Fields sf
+            LEFT JOIN Response_Details rd ON rd.field_id = sf.field_id AND rd.response_id = ?
+            WHERE sf.survey_id = ?
             ORDER BY sf.field_order
-        ''', (response_id,))
-        return cursor.fetchall()
+        ''', (response_id, response[0])).fetchall()
+        return response[1], fields
     except sqlite3.Error as e:
         st.error(f"حدث خطأ في جلب تفاصيل الإجابة: {str(e)}")
-        return []
+        return None, []
     finally:
         conn.close()
 
-def update_response_detail(detail_id: int, new_value: str) -> bool:
-    """تحديث قيمة إجابة محددة"""
-    conn = sqlite3.connect(DATABASE_PATH)
+def apply_response_edits(response_id: int, changes: Dict[int, object], user_id: int,
+                         expected_version: Optional[int] = None) -> Tuple[Optional[int], Optional[str]]:
+    """
+    تطبيق تعديلات إجابة كاملة {field_id: القيمة الجديدة أو None للحذف} في معاملة واحدة
+    (انظر apply_response_edits_batch). يرجع (الإصدار الجديد، رسالة الخطأ).
+    """
+    versions, error = apply_response_edits_batch(
+        {response_id: changes}, user_id,
+        {response_id: expected_version} if expected_version is not None else None
+    )
+    return versions.get(response_id), error
+
+def apply_response_edits_batch(edits: Dict[int, Dict[int, object]], user_id: int,
+                               expected_versions: Optional[Dict[int, int]] = None
+                               ) -> Tuple[Dict[int, int], Optional[str]]:
+    """
+    تطبيق تعديلات عدة إجابات {response_id: {field_id: القيمة أو None للحذف}} في معاملة واحدة:
+    تعديل الموجود وإضافة الحقول التي تُركت فارغة، وسجل تعديل واحد لكل إجابة بالقيم القديمة والجديدة.
+    تُتحقق القيم من نوع كل حقل، وتُرفض الإجابة التي لا يطابق إصدارها expected_versions (عدلها
+    مستخدم آخر). أي خطأ يلغي الدفعة كلها. يرجع ({response_id: الإصدار بعد الحفظ}، رسالة الخطأ).
+    """
+    expected_versions = expected_versions or {}
+    response_ids = list(edits)
+    conn = sqlite3.connect(DATABASE_PATH, isolation_level=None, timeout=30)
     try:
-        cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE Response_Details SET answer_value = ? WHERE detail_id = ?",
-            (new_value, detail_id)
+        conn.execute("BEGIN IMMEDIATE")
+        set_audit_user(conn, user_id)
+        responses, fields, current = {}, {}, {}
+        for start in range(0, len(response_ids), SQL_VARIABLES_CHUNK):
+            chunk = response_ids[start:start + SQL_VARIABLES_CHUNK]
+            placeholders = ','.join('?' * len(chunk))
+            responses.update((response_id, (survey_id, version)) for response_id, survey_id, version in conn.execute(
+                f"SELECT response_id, survey_id, version FROM Responses WHERE response_id IN ({placeholders})", chunk
+            ))
+            for response_id, field_id, answer in conn.execute(
+                f"SELECT response_id, field_id, answer_value FROM Response_Details WHERE response_id IN ({placeholders})",
+                chunk
+            ):
+                current.setdefault(response_id, {})[field_id] = answer
+        survey_ids = sorted({survey_id for survey_id, _ in responses.values()})
+        for field_id, survey_id, label, field_type, options in conn.execute(f'''
+            SELECT field_id, survey_id, field_label, field_type, field_options FROM Survey_Fields
+            WHERE survey_id IN ({','.join('?' * len(survey_ids))})
+        ''', survey_ids):
+            fields[field_id] = (survey_id, label, field_type, options)
+
+        errors, changed = [], {}
+        for response_id, changes in edits.items():
+            if response_id not in responses:
+                errors.append(f"إجابة #{response_id}: الإجابة غير موجودة")
+                continue
+            survey_id, version = responses[response_id]
+            if expected_versions.get(response_id, version) != version:
+                errors.append(f"إجابة #{response_id}: تم تعديلها من مستخدم آخر، يرجى إعادة تحميلها")
+                continue
+            answers = current.get(response_id, {})
+            for field_id, value in changes.items():
+                if field_id not in fields or fields[field_id][0] != survey_id:
+                    errors.append(f"إجابة #{response_id}: الحقل {field_id} غير موجود في الاستبيان")
+                    continue
+                _, label, field_type, options = fields[field_id]
+                text, error = normalize_answer(field_type, options, value)
+                if error:
+                    errors.append(f"إجابة #{response_id} - {label}: {error}")
+                elif answers.get(field_id) != text:
+                    changed.setdefault(response_id, {})[field_id] = text
+        if errors:
+            conn.execute("ROLLBACK")
+            return {}, "\n".join(errors)
+
+        field_types = {field_id: field_type for field_id, (_, _, field_type, _) in fields.items()}
+        for response_id, answers in changed.items():
+            apply_answer_diff(conn, response_id, answers, field_types)
+        update_content_hashes(conn, list(changed))
+        conn.executemany("UPDATE Responses SET version = version + 1 WHERE response_id = ?",
+                         [(response_id,) for response_id in changed])
+        conn.executemany(
+            """INSERT INTO AuditLog (user_id, action_type, table_name, record_id, old_value, new_value)
+               VALUES (?, 'UPDATE', 'Responses', ?, ?, ?)""",
+            [(user_id, response_id,
+              json.dumps({fields[f][1]: current.get(response_id, {}).get(f) for f in answers}, ensure_ascii=False),
+              json.dumps({fields[f][1]: v for f, v in answers.items()}, ensure_ascii=False))
+             for response_id, answers in changed.items()]
         )
-        conn.commit()
-        return True
+        commit_audited(conn)
+        return {response_id: version + (response_id in changed)
+                for response_id, (_, version) in responses.items()}, None
     except sqlite3.Error as e:
-        st.error(f"حدث خطأ في تحديث الإجابة: {str(e)}")
-        return False
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        return {}, f"حدث خطأ في حفظ التعديلات: {str(e)}"
+    finally:
+        conn.close()
+
+# عمليات التصحيح الجماعي: استبدال قيمة بأخرى، أو ضرب الحقول الرقمية في معامل (تصحيح الوحدة)
+BULK_OPERATIONS = ('replace', 'scale')
+
+def bulk_correction_scope(c, survey_id: int, field_id: int, filters: Optional[Dict],
+                          operation: str, match_value) -> Tuple[str, str, list]:
+    """
+    نوع الحقل وشروط SQL للإجابات المشمولة بالتصحيح الجماعي (تفترض الأسماء المستعارة rd و r و ha).
+    المطابقة في الحقول المكتوبة تتم على القيمة المكتوبة ('46' و'46.0' نفس الرقم) عبر فهارسها.
+    """
+    if operation not in BULK_OPERATIONS:
+        raise ValueError(f"عملية غير معروفة: {operation}")
+    field = c.execute("SELECT field_type, field_options FROM Survey_Fields WHERE field_id = ? AND survey_id = ?",
+                      (field_id, survey_id)).fetchone()
+    if not field:
+        raise ValueError("الحقل غير موجود في الاستبيان")
+    field_type, options = field
+    conditions, params = ["r.survey_id = ?", "rd.field_id = ?"], [survey_id, field_id]
+    if operation == 'scale':
+        if field_type != 'number':
+            raise ValueError("تصحيح الوحدة متاح للحقول الرقمية فقط")
+        conditions.append("rd.answer_number IS NOT NULL")
+    else:
+        if field_type == 'dropdown':
+            # القيمة الخاطئة قد لا تكون من الخيارات الحالية (خيار أعيدت تسميته)
+            text, error = (str(match_value) if match_value not in (None, "") else None), None
+        else:
+            text, error = normalize_answer(field_type, options, match_value)
+        if error or text is None:
+            raise ValueError(error or "يجب تحديد القيمة المراد استبدالها")
+        column = TYPED_FIELD_COLUMNS.get(field_type)
+        if column:
+            conditions.append(f"rd.{column} = ?")
+            number, day, flag = typed_answer_values(field_type, text)
+            params.append({'answer_number': number, 'answer_date': day, 'answer_bool': flag}[column])
+        else:
+            conditions.append("rd.answer_value = ?")
+            params.append(text)
+    filter_sql, filter_params = build_response_filters(filters)
+    return field_type, ' AND '.join(conditions) + filter_sql, params + filter_params
+
+BULK_SCOPE_FROM = '''
+    FROM Response_Details rd
+    JOIN Responses r ON rd.response_id = r.response_id
+    JOIN HealthAdministrations ha ON r.region_id = ha.admin_id
+'''
+
+def preview_bulk_correction(survey_id: int, field_id: int, filters: Optional[Dict],
+                            operation: str, match_value=None) -> Dict[str, int]:
+    """عدد الإجابات والصفوف التي سيغيرها التصحيح الجماعي (استعلام تجميعي واحد)"""
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        _, where, params = bulk_correction_scope(conn, survey_id, field_id, filters, operation, match_value)
+        rows, responses = conn.execute(
+            f"SELECT COUNT(*), COUNT(DISTINCT rd.response_id) {BULK_SCOPE_FROM} WHERE {where}", params
+        ).fetchone()
+        return {'rows': rows, 'responses': responses}
+    finally:
+        conn.close()
+
+def apply_bulk_correction(survey_id: int, field_id: int, filters: Optional[Dict], operation: str,
+                          match_value, new_value, user_id: int) -> Dict[str, int]:
+    """
+    تطبيق التصحيح الجماعي بعبارة UPDATE واحدة لكل دفعة من الصفوف المطابقة (بالترقيم بالمفتاح
+    على detail_id، وكل دفعة في معاملة قصيرة حتى لا يطول قفل الكتابة)، مع رفع إصدار الإجابات
+    المتأثرة وسجل تعديل واحد للعملية كلها. يرجع عدد الصفوف والإجابات التي تغيرت.
+    """
+    conn = sqlite3.connect(DATABASE_PATH, isolation_level=None, timeout=30)
+    try:
+        field_type, where, params = bulk_correction_scope(conn, survey_id, field_id, filters, operation, match_value)
+        if operation == 'scale':
+            factor = typed_answer_values('number', new_value)[0]
+            if factor is None or not math.isfinite(factor) or factor == 0:
+                raise ValueError("معامل التحويل يجب أن يكون رقماً غير الصفر")
+            set_sql = "answer_number = answer_number * ?, answer_value = CAST(answer_number * ? AS TEXT)"
+            set_params = [factor, factor]
+            new_text = factor
+        else:
+            options = conn.execute("SELECT field_options FROM Survey_Fields WHERE field_id = ?",
+                                   (field_id,)).fetchone()[0]
+            new_text, error = normalize_answer(field_type, options, new_value)
+            if error or new_text is None:
+                raise ValueError(error or "يجب تحديد القيمة الجديدة")
+            set_sql = "answer_value = ?, answer_number = ?, answer_date = ?, answer_bool = ?"
+            set_params = [new_text] + list(typed_answer_values(field_type, new_text))
+
+        last_id, rows, responses, log_id = 0, 0, set(), None
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            set_audit_user(conn, user_id)
+            chunk = conn.execute(f'''
+                SELECT rd.detail_id, rd.response_id {BULK_SCOPE_FROM}
+                WHERE {where} AND rd.detail_id > ?
+                ORDER BY rd.detail_id
+                LIMIT ?
+            ''', params + [last_id, SQL_VARIABLES_CHUNK]).fetchall()
+            if chunk:
+                if log_id is None:
+                    log_id = conn.execute(
+                        """INSERT INTO AuditLog (user_id, action_type, table_name, record_id, old_value, new_value)
+                           VALUES (?, 'BULK_UPDATE', 'Response_Details', NULL, ?, ?)""",
+                        (user_id,
+                         json.dumps({'survey_id': survey_id, 'field_id': field_id, 'filters': filters or {},
+                                     'operation': operation, 'match': match_value}, ensure_ascii=False, default=str),
+                         json.dumps({'value': new_text, 'rows': 0}, ensure_ascii=False, default=str))
+                    ).lastrowid
+                detail_ids = [detail_id for detail_id, _ in chunk]
+                response_ids = sorted({response_id for _, response_id in chunk})
+                conn.execute(
+                    f"UPDATE Response_Details SET {set_sql} WHERE detail_id IN ({','.join('?' * len(detail_ids))})",
+                    set_params + detail_ids
+                )
+                conn.execute(
+                    f"UPDATE Responses SET version = version + 1 WHERE response_id IN ({','.join('?' * len(response_ids))})",
+                    response_ids
+                )
+                update_content_hashes(conn, response_ids)
+                last_id = detail_ids[-1]
+                rows += len(detail_ids)
+                responses.update(response_ids)
+            if log_id is not None:
+                conn.execute(
+                    "UPDATE AuditLog SET new_value = ? WHERE log_id = ?",
+                    (json.dumps({'value': new_text, 'rows': rows, 'responses': len(responses)},
+                                ensure_ascii=False, default=str), log_id)
+                )
+            commit_audited(conn)
+            if len(chunk) < SQL_VARIABLES_CHUNK:
+                return {'rows': rows, 'responses': len(responses)}
+    except sqlite3.Error:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+def get_responses_answers(response_ids: List[int]) -> Dict[int, Dict]:
+    """
+    إصدار وإجابات عدة إجابات في استعلامين: {response_id: {'version': v, 'answers': {field_id: القيمة}}}
+    """
+    result = {}
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        for start in range(0, len(response_ids), SQL_VARIABLES_CHUNK):
+            chunk = response_ids[start:start + SQL_VARIABLES_CHUNK]
+            placeholders = ','.join('?' * len(chunk))
+            for response_id, version in conn.execute(
+                f"SELECT response_id, version FROM Responses WHERE response_id IN ({placeholders})", chunk
+            ):
+                result[response_id] = {'version': version, 'answers': {}}
+            for response_id, field_id, answer in conn.execute(
+                f"SELECT response_id, field_id, answer_value FROM Response_Details WHERE response_id IN ({placeholders})",
+                chunk
+            ):
+                result[response_id]['answers'][field_id] = answer
+        return result
+    except sqlite3.Error as e:
+        st.error(f"حدث خطأ في جلب الإجابات: {str(e)}")
+        return {}
     finally:
         conn.close()
 
@@ -761,77 +2032,151 @@ def get_response_info(response_id: int) -> Optional[Tuple]:
     finally:
         conn.close()        
         
-def log_audit_action(user_id: int, action_type: str, table_name: str, 
-                    record_id: int = None, old_value: str = None, 
-                    new_value: str = None) -> bool:
-    """تسجيل إجراء في سجل التعديلات"""
+REPORT_ARTIFACT_COLUMNS = ('artifact_id', 'report_type', 'survey_id', 'governorate_id', 'version',
+                           'file_path', 'file_size', 'data_version', 'created_at')
+
+def get_latest_report_artifact(report_type: str, survey_id: Optional[int] = None,
+                               governorate_id: Optional[int] = None) -> Optional[Dict]:
+    """آخر إصدار من تقرير محدد (المحافظة أو الاستبيان NULL يعني التقرير على مستوى الجمهورية)"""
     conn = sqlite3.connect(DATABASE_PATH)
     try:
-        conn.execute(
-            """INSERT INTO AuditLog 
-               (user_id, action_type, table_name, record_id, old_value, new_value)
-               VALUES (?, ?, ?, ?, ?, ?)""",
-            (user_id, action_type, table_name, record_id, 
-             json.dumps(old_value) if old_value else None,
-             json.dumps(new_value) if new_value else None)
-        )
-        conn.commit()
-        return True
-    except sqlite3.Error as e:
-        st.error(f"حدث خطأ في تسجيل الإجراء: {str(e)}")
-        return False
+        row = conn.execute(f'''
+            SELECT {", ".join(REPORT_ARTIFACT_COLUMNS)} FROM ReportArtifacts
+            WHERE report_type = ? AND survey_id IS ? AND governorate_id IS ?
+            ORDER BY version DESC LIMIT 1
+        ''', (report_type, survey_id, governorate_id)).fetchone()
+        return dict(zip(REPORT_ARTIFACT_COLUMNS, row)) if row else None
+    finally:
+        conn.close()
+
+def get_report_artifacts(governorate_id: Optional[int] = None) -> List[Dict]:
+    """أحدث إصدار من كل تقرير لمحافظة معينة، أو تقارير مستوى الجمهورية إذا لم تُحدد محافظة"""
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        rows = conn.execute(f'''
+            SELECT {", ".join("a." + column for column in REPORT_ARTIFACT_COLUMNS)}
+            FROM ReportArtifacts a
+            WHERE a.governorate_id IS ?
+              AND a.version = (SELECT MAX(version) FROM ReportArtifacts b
+                               WHERE b.report_type = a.report_type
+                                 AND b.survey_id IS a.survey_id
+                                 AND b.governorate_id IS a.governorate_id)
+            ORDER BY a.report_type, a.survey_id
+        ''', (governorate_id,)).fetchall()
+        return [dict(zip(REPORT_ARTIFACT_COLUMNS, row)) for row in rows]
+    finally:
+        conn.close()
+
+def add_report_artifact(report_type: str, survey_id: Optional[int], governorate_id: Optional[int],
+                        file_path: str, file_size: int, data_version: str) -> int:
+    """تسجيل إصدار جديد من تقرير وإرجاع رقم الإصدار"""
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        with conn:
+            version = conn.execute('''
+                SELECT COALESCE(MAX(version), 0) + 1 FROM ReportArtifacts
+                WHERE report_type = ? AND survey_id IS ? AND governorate_id IS ?
+            ''', (report_type, survey_id, governorate_id)).fetchone()[0]
+            conn.execute('''
+                INSERT INTO ReportArtifacts
+                (report_type, survey_id, governorate_id, version, file_path, file_size, data_version)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (report_type, survey_id, governorate_id, version, file_path, file_size, data_version))
+        return version
+    finally:
+        conn.close()
+
+def prune_report_artifacts(keep_versions: int) -> List[str]:
+    """حذف سجلات الإصدارات الأقدم من آخر keep_versions لكل تقرير وإرجاع مسارات ملفاتها"""
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        with conn:
+            stale = conn.execute('''
+                SELECT a.artifact_id, a.file_path FROM ReportArtifacts a
+                WHERE (SELECT COUNT(*) FROM ReportArtifacts b
+                       WHERE b.report_type = a.report_type
+                         AND b.survey_id IS a.survey_id
+                         AND b.governorate_id IS a.governorate_id
+                         AND b.version > a.version) >= ?
+            ''', (keep_versions,)).fetchall()
+            conn.executemany("DELETE FROM ReportArtifacts WHERE artifact_id = ?",
+                             [(artifact_id,) for artifact_id, _ in stale])
+        return [path for _, path in stale]
     finally:
         conn.close()
 
+def build_audit_filters(
+    table_name: str = None,
+    action_type: str = None,
+    username: str = None,
+    date_range: tuple = None,
+    search_query: str = None
+) -> Tuple[str, list]:
+    """تحويل فلاتر سجل التعديلات إلى شروط SQL (تفترض الاسمين المستعارين a و u)"""
+    params = []
+    conditions = []
+
+    if table_name:
+        conditions.append("a.table_name = ?")
+        params.append(table_name)
+    if action_type:
+        conditions.append("a.action_type = ?")
+        params.append(action_type)
+    if username:
+        conditions.append("u.username LIKE ?")
+        params.append(f"%{username}%")
+    if date_range and len(date_range) == 2:
+        start_date, end_date = date_range
+        conditions.append("DATE(a.action_timestamp) BETWEEN ? AND ?")
+        params.extend([start_date, end_date])
+    if search_query:
+        conditions.append("""
+            (a.old_value LIKE ? OR 
+             a.new_value LIKE ? OR 
+             u.username LIKE ? OR 
+             a.table_name LIKE ? OR
+             a.action_type LIKE ?)
+        """)
+        search_term = f"%{search_query}%"
+        params.extend([search_term, search_term, search_term, search_term, search_term])
+
+    return ' AND '.join(conditions), params
+
 def get_audit_logs(
     table_name: str = None, 
     action_type: str = None,
     username: str = None,
     date_range: tuple = None,
-    search_query: str = None
+    search_query: str = None,
+    before_id: Optional[int] = None,
+    limit: Optional[int] = None
 ) -> List[Tuple]:
-    """الحصول على سجل التعديلات مع فلاتر متقدمة"""
+    """
+    الحصول على سجل التعديلات مع فلاتر متقدمة، الأحدث أولاً. مع limit ترجع صفحة واحدة
+    (ترقيم بالمفتاح: السجلات الأقدم من before_id)
+    """
     conn = sqlite3.connect(DATABASE_PATH)
     try:
         cursor = conn.cursor()
         query = '''
-            SELECT a.log_id, u.username, a.action_type, a.table_name, 
+            SELECT a.log_id, COALESCE(u.username, 'النظام'), a.action_type, a.table_name, 
                    a.record_id, a.old_value, a.new_value, a.action_timestamp
             FROM AuditLog a
-            JOIN Users u ON a.user_id = u.user_id
+            LEFT JOIN Users u ON a.user_id = u.user_id
         '''
-        params = []
-        conditions = []
-        
-        # تطبيق الفلاتر
-        if table_name:
-            conditions.append("a.table_name = ?")
-            params.append(table_name)
-        if action_type:
-            conditions.append("a.action_type = ?")
-            params.append(action_type)
-        if username:
-            conditions.append("u.username LIKE ?")
-            params.append(f"%{username}%")
-        if date_range and len(date_range) == 2:
-            start_date, end_date = date_range
-            conditions.append("DATE(a.action_timestamp) BETWEEN ? AND ?")
-            params.extend([start_date, end_date])
-        if search_query:
-            conditions.append("""
-                (a.old_value LIKE ? OR 
-                 a.new_value LIKE ? OR 
-                 u.username LIKE ? OR 
-                 a.table_name LIKE ? OR
-                 a.action_type LIKE ?)
-            """)
-            search_term = f"%{search_query}%"
-            params.extend([search_term, search_term, search_term, search_term, search_term])
+        conditions, params = build_audit_filters(
+            table_name, action_type, username, date_range, search_query)
+        if before_id is not None:
+            conditions = ' AND '.join(filter(None, [conditions, "a.log_id < ?"]))
+            params.append(before_id)
         
         if conditions:
-            query += ' WHERE ' + ' AND '.join(conditions)
+            query += ' WHERE ' + conditions
             
-        query += ' ORDER BY a.action_timestamp DESC'
+        query += ' ORDER BY a.log_id DESC'
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
         
         cursor.execute(query, params)
         return cursor.fetchall()
@@ -841,6 +2186,221 @@ def get_audit_logs(
     finally:
         conn.close()
         
+OPEN_DRAFT_QUERY = '''
+    SELECT response_id, submission_date FROM Responses
+    WHERE user_id = ? AND survey_id = ? AND is_completed = FALSE
+    ORDER BY response_id DESC
+    LIMIT 1
+'''
+
+def apply_answer_diff(conn, response_id: int, answers: Dict[int, object], field_types: Dict[int, str]) -> int:
+    """
+    تحديث تفاصيل إجابة موجودة بالفروق فقط: إضافة الجديد وتعديل المتغير وحذف ما أصبح فارغاً.
+    الحقول غير المرسلة تبقى كما هي. يرجع عدد الصفوف المتأثرة.
+    """
+    existing = {field_id: (detail_id, value) for detail_id, field_id, value in conn.execute(
+        "SELECT detail_id, field_id, answer_value FROM Response_Details WHERE response_id = ?",
+        (response_id,)
+    )}
+    inserts, updates, deletes = [], [], []
+    for field_id, answer in answers.items():
+        current = existing.get(field_id)
+        if answer is None:
+            if current:
+                deletes.append((current[0],))
+        elif current is None:
+            inserts.append((response_id, field_id, str(answer)) + typed_answer_values(field_types[field_id], answer))
+        elif current[1] != str(answer):
+            updates.append((str(answer),) + typed_answer_values(field_types[field_id], answer) + (current[0],))
+
+    conn.executemany(
+        '''INSERT INTO Response_Details
+           (response_id, field_id, answer_value, answer_number, answer_date, answer_bool)
+           VALUES (?, ?, ?, ?, ?, ?)''',
+        inserts
+    )
+    conn.executemany(
+        '''UPDATE Response_Details
+           SET answer_value = ?, answer_number = ?, answer_date = ?, answer_bool = ?
+           WHERE detail_id = ?''',
+        updates
+    )
+    conn.executemany("DELETE FROM Response_Details WHERE detail_id = ?", deletes)
+    return len(inserts) + len(updates) + len(deletes)
+
+def save_survey_submission(survey_id: int, user_id: int, region_id: int, answers: Dict[int, object],
+                           is_completed: bool, token: Optional[str] = None
+                           ) -> Tuple[Optional[int], Optional[str], Optional[int]]:
+    """
+    حفظ إجابة كاملة (الرأس والتفاصيل) في معاملة واحدة وإرجاع (معرف الإجابة، رسالة الخطأ،
+    معرف إجابة مكتملة سابقة بنفس المحتوى إن وجدت - تُحفظ الإجابة مع التنبيه إلى التكرار).
+    token رمز منع التكرار من العميل: إعادة الإرسال بنفس الرمز (نقر مزدوج أو إعادة تنفيذ أو
+    إعادة محاولة الشبكة) ترجع الإجابة الأصلية دون كتابة جديدة.
+    للمستخدم مسودة مفتوحة واحدة لكل استبيان: الحفظ كمسودة يحدّثها في مكانها بالفروق،
+    والإرسال النهائي يحوّلها إلى إجابة مكتملة بدلاً من نسخها.
+    التحقق من قاعدة الإكمال مرة واحدة يومياً يتم داخل المعاملة نفسها بقفل الكتابة
+    حتى لا يمر إرسالان متزامنان لنفس المستخدم.
+    """
+    conn = sqlite3.connect(DATABASE_PATH, isolation_level=None, timeout=30)
+    try:
+        fields = {field_id: (label, field_type, is_required) for field_id, label, field_type, is_required in conn.execute(
+            "SELECT field_id, field_label, field_type, is_required FROM Survey_Fields WHERE survey_id = ?",
+            (survey_id,)
+        )}
+        unknown = [field_id for field_id in answers if field_id not in fields]
+        if unknown:
+            return None, f"حقول غير موجودة في الاستبيان: {unknown}", None
+
+        conn.execute("BEGIN IMMEDIATE")
+        # الفحص داخل قفل الكتابة، والمفتاح الأساسي يمنع تسجيل الرمز مرتين في كل الأحوال
+        if token:
+            original = conn.execute(
+                "SELECT response_id FROM SubmissionTokens WHERE user_id = ? AND token = ?", (user_id, token)
+            ).fetchone()
+            if original:
+                conn.execute("ROLLBACK")
+                return original[0], None, None
+        set_audit_user(conn, user_id)
+        if is_completed and conn.execute('''
+            SELECT 1 FROM Responses
+            WHERE user_id = ? AND survey_id = ? AND is_completed = TRUE
+            AND DATE(submission_date) = DATE('now')
+            LIMIT 1
+        ''', (user_id, survey_id)).fetchone():
+            conn.execute("ROLLBACK")
+            return None, "تم إكمال هذا الاستبيان اليوم بالفعل", None
+
+        field_types = {field_id: field_type for field_id, (_, field_type, _) in fields.items()}
+        draft = conn.execute(OPEN_DRAFT_QUERY, (user_id, survey_id)).fetchone()
+        if is_completed:
+            # الإرسال قد يحمل الفروق فقط (واجهة API)، فالحقول المطلوبة تُفحص على المسودة بعد دمجها
+            merged = dict(conn.execute(
+                "SELECT field_id, answer_value FROM Response_Details WHERE response_id = ?", (draft[0],)
+            )) if draft else {}
+            merged.update(answers)
+            missing = [label for field_id, (label, _, is_required) in fields.items()
+                       if is_required and merged.get(field_id) in (None, "")]
+            if missing:
+                conn.execute("ROLLBACK")
+                return None, f"الحقول التالية مطلوبة: {', '.join(missing)}", None
+        if draft:
+            response_id = draft[0]
+            conn.execute(
+                '''UPDATE Responses SET region_id = ?, is_completed = ?, submission_date = CURRENT_TIMESTAMP
+                   WHERE response_id = ?''',
+                (region_id, is_completed, response_id)
+            )
+            apply_answer_diff(conn, response_id, answers, field_types)
+        else:
+            response_id = conn.execute(
+                "INSERT INTO Responses (survey_id, user_id, region_id, is_completed) VALUES (?, ?, ?, ?)",
+                (survey_id, user_id, region_id, is_completed)
+            ).lastrowid
+            conn.executemany(
+                '''INSERT INTO Response_Details
+                   (response_id, field_id, answer_value, answer_number, answer_date, answer_bool)
+                   VALUES (?, ?, ?, ?, ?, ?)''',
+                [(response_id, field_id, str(answer)) + typed_answer_values(field_types[field_id], answer)
+                 for field_id, answer in answers.items() if answer is not None]
+            )
+        update_content_hashes(conn, [response_id])
+        duplicate_of = find_duplicate_response(conn, response_id) if is_completed else None
+        if token:
+            conn.execute(
+                "INSERT INTO SubmissionTokens (user_id, token, survey_id, response_id) VALUES (?, ?, ?, ?)",
+                (user_id, token, survey_id, response_id)
+            )
+        commit_audited(conn)
+        return response_id, None, duplicate_of
+    except sqlite3.Error as e:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        return None, f"حدث خطأ في حفظ الاستجابة: {str(e)}", None
+    finally:
+        conn.close()
+
+def create_api_session(token_hash: str, user: Dict, expires_at: float):
+    """تسجيل جلسة واجهة JSON جديدة مع حذف الجلسات المنتهية"""
+    conn = sqlite3.connect(DATABASE_PATH, timeout=30)
+    try:
+        with conn:
+            conn.execute("DELETE FROM ApiSessions WHERE expires_at < ?", (time.time(),))
+            conn.execute(
+                '''INSERT INTO ApiSessions (token_hash, user_id, username, role, region_id, expires_at)
+                   VALUES (?, ?, ?, ?, ?, ?)''',
+                (token_hash, user['user_id'], user['username'], user['role'], user['assigned_region'], expires_at)
+            )
+    finally:
+        conn.close()
+
+def get_api_session(token_hash: str) -> Optional[Dict]:
+    """جلسة واجهة JSON غير المنتهية لبصمة الرمز أو None"""
+    conn = sqlite3.connect(DATABASE_PATH, timeout=30)
+    try:
+        row = conn.execute(
+            "SELECT user_id, username, role, region_id, expires_at FROM ApiSessions WHERE token_hash = ? AND expires_at >= ?",
+            (token_hash, time.time())
+        ).fetchone()
+    finally:
+        conn.close()
+    if not row:
+        return None
+    return dict(zip(('user_id', 'username', 'role', 'region_id', 'expires_at'), row))
+
+def get_employee_survey_states(user_id: int, survey_ids: List[int]) -> Dict[int, Dict]:
+    """
+    بيانات عدة استبيانات للوحة الموظف دفعة واحدة: الاسم وتاريخ الإنشاء وحالة الإكمال اليوم
+    والمسودة المفتوحة والحقول، باستعلامات ثابتة العدد مهما زاد عدد الاستبيانات المختارة.
+    """
+    if not survey_ids:
+        return {}
+    placeholders = ",".join("?" * len(survey_ids))
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        states = {}
+        for survey_id, survey_name, created_at, completed_today, draft_id, draft_saved_at in conn.execute(f'''
+            SELECT s.survey_id, s.survey_name, s.created_at,
+                   EXISTS (SELECT 1 FROM Responses r
+                           WHERE r.survey_id = s.survey_id AND r.user_id = ? AND r.is_completed = TRUE
+                           AND DATE(r.submission_date) = DATE('now')),
+                   d.response_id, d.submission_date
+            FROM Surveys s
+            LEFT JOIN Responses d ON d.response_id = (
+                SELECT MAX(response_id) FROM Responses
+                WHERE survey_id = s.survey_id AND user_id = ? AND is_completed = FALSE)
+            WHERE s.survey_id IN ({placeholders})
+        ''', [user_id, user_id] + list(survey_ids)):
+            states[survey_id] = {
+                'survey_name': survey_name,
+                'created_at': created_at,
+                'completed_today': bool(completed_today),
+                'draft': {'response_id': draft_id, 'saved_at': draft_saved_at, 'answers': {}} if draft_id else None,
+                'fields': [],
+            }
+
+        for row in conn.execute(f'''
+            SELECT survey_id, field_id, field_label, field_type, field_options, is_required, field_order
+            FROM Survey_Fields
+            WHERE survey_id IN ({placeholders})
+            ORDER BY survey_id, field_order
+        ''', list(survey_ids)):
+            if row[0] in states:
+                states[row[0]]['fields'].append(row[1:])
+
+        drafts = {state['draft']['response_id']: state['draft'] for state in states.values() if state['draft']}
+        if drafts:
+            for response_id, field_id, answer_value in conn.execute(f'''
+                SELECT response_id, field_id, answer_value FROM Response_Details
+                WHERE response_id IN ({",".join("?" * len(drafts))})
+            ''', list(drafts)):
+                drafts[response_id]['answers'][field_id] = answer_value
+        return states
+    except sqlite3.Error as e:
+        st.error(f"حدث خطأ في جلب بيانات الاستبيانات: {str(e)}")
+        return {}
+    finally:
+        conn.close()
+
 def has_completed_survey_today(user_id: int, survey_id: int) -> bool:
     """التحقق مما إذا كان المستخدم قد أكمل الاستبيان اليوم"""
     conn = sqlite3.connect(DATABASE_PATH)
@@ -1,19 +1,22 @@
 import streamlit as st
 import sqlite3
-import pandas as pd
-import geocoder
+from lazy_imports import LazyModule
 from typing import List, Dict, Optional, Tuple
 from datetime import datetime
 import json
+import hashlib
+import secrets
 from database import (
     DATABASE_PATH,
     get_health_admin_name,
-    save_response,
-    save_response_detail,
-    get_survey_fields,
-    has_completed_survey_today
+    save_survey_submission,
+    get_employee_survey_states,
+    draft_value
 )
 
+# pandas يُحمّل عند عرض جدول الإجابات فقط
+pd = LazyModule("pandas")
+
 def show_employee_dashboard():
     """
     عرض لوحة تحكم الموظف مع الميزات المطورة:
@@ -45,9 +48,10 @@ def show_employee_dashboard():
     # عرض اختيار متعدد للاستبيانات
     selected_surveys = display_survey_selection(allowed_surveys)
     
-    # عرض كل استبيان محدد
+    # بيانات جميع الاستبيانات المحددة دفعة واحدة ثم عرض كل استبيان
+    survey_states = get_employee_survey_states(st.session_state.user_id, selected_surveys)
     for survey_id in selected_surveys:
-        display_single_survey(survey_id, region_info['admin_id'])
+        display_single_survey(survey_id, region_info['admin_id'], survey_states.get(survey_id))
 
 def get_employee_region_info(region_id: int) -> Optional[Dict]:
     """الحصول على معلومات المنطقة التابع لها الموظف"""
@@ -75,7 +79,6 @@ def get_employee_region_info(region_id: int) -> Optional[Dict]:
 
 def display_employee_header(region_info: Dict):
     """عرض معلومات رأس لوحة الموظف"""
-    st.set_page_config(layout="wide")
     st.title(f"لوحة الموظف - {region_info['admin_name']}")
     
     # الحصول على آخر وقت دخول من قاعدة البيانات
@@ -117,41 +120,35 @@ def display_survey_selection(allowed_surveys: List[Tuple[int, str]]) -> List[int
     
     return selected_surveys
 
-def display_single_survey(survey_id: int, region_id: int):
+def display_single_survey(survey_id: int, region_id: int, state: Optional[Dict]):
     """عرض استبيان واحد مع خيارات الإدخال"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    try:
-        # الحصول على معلومات الاستبيان
-        survey_info = conn.execute('''
-            SELECT survey_name, created_at FROM Surveys WHERE survey_id = ?
-        ''', (survey_id,)).fetchone()
+    if not state:
+        st.error("الاستبيان المحدد غير موجود")
+        return
         
-        if not survey_info:
-            st.error("الاستبيان المحدد غير موجود")
-            return
-            
-        # التحقق مما إذا كان المستخدم قد أكمل هذا الاستبيان اليوم
-        if has_completed_survey_today(st.session_state.user_id, survey_id):
-            st.warning(f"لقد أكملت استبيان '{survey_info[0]}' اليوم. يمكنك إكماله مرة أخرى غدًا.")
-            return
-            
-        # عرض عنوان الاستبيان
-        with st.expander(f"📋 {survey_info[0]} (تاريخ الإنشاء: {survey_info[1]})"):
-            # الحصول على حقول الاستبيان
-            fields = get_survey_fields(survey_id)
-            
-            # عرض نموذج الاستبيان مع تحديد الموقع
-            display_survey_form(survey_id, region_id, fields, survey_info[0])
-            
-    except sqlite3.Error as e:
-        st.error(f"حدث خطأ في قاعدة البيانات: {str(e)}")
-    finally:
-        conn.close()
+    # التحقق مما إذا كان المستخدم قد أكمل هذا الاستبيان اليوم
+    if state['completed_today']:
+        st.warning(f"لقد أكملت استبيان '{state['survey_name']}' اليوم. يمكنك إكماله مرة أخرى غدًا.")
+        return
+        
+    # عرض عنوان الاستبيان
+    with st.expander(f"📋 {state['survey_name']} (تاريخ الإنشاء: {state['created_at']})"):
+        display_survey_form(survey_id, region_id, state['fields'], state['survey_name'], state['draft'])
+
+def display_survey_form(survey_id: int, region_id: int, fields: List[Tuple], survey_name: str,
+                        draft: Optional[Dict] = None):
+    """عرض نموذج استبيان مع خيارات الحفظ (يُعبأ من المسودة المفتوحة إن وجدت)"""
+    draft_answers = draft['answers'] if draft else {}
+    # رمز منع التكرار لهذا العرض من النموذج: يبقى بعد نجاح الحفظ حتى يُعرض النموذج دون إرسال
+    # (إدخال جديد)، فإعادة الإرسال بنقرة مزدوجة أو بعد إعادة الاتصال تحمل الرمز نفسه
+    token_key = f"submission_token_{survey_id}"
+    if token_key not in st.session_state:
+        st.session_state[token_key] = secrets.token_hex(16)
 
-def display_survey_form(survey_id: int, region_id: int, fields: List[Tuple], survey_name: str):
-    """عرض نموذج استبيان مع خيارات الحفظ"""
     with st.form(f"survey_form_{survey_id}"):
         st.markdown("**يرجى تعبئة جميع الحقول المطلوبة (*)**")
+        if draft:
+            st.caption(f"💾 تم استرجاع المسودة المحفوظة بتاريخ {draft['saved_at']}")
 
         
         # قسم حقول الاستبيان
@@ -159,7 +156,8 @@ def display_survey_form(survey_id: int, region_id: int, fields: List[Tuple], sur
         answers = {}
         for field in fields:
             field_id, label, field_type, options, is_required, _ = field
-            answers[field_id] = render_field(field_id, label, field_type, options, is_required)
+            answers[field_id] = render_field(field_id, label, field_type, options, is_required,
+                                             draft_answers.get(field_id))
         
         # أزرار الحفظ والإرسال
         col1, col2 = st.columns(2)
@@ -174,28 +172,41 @@ def display_survey_form(survey_id: int, region_id: int, fields: List[Tuple], sur
                 region_id,
                 fields,
                 answers,
-                
                 submitted,
-                survey_name
+                survey_name,
+                submission_token(st.session_state[token_key], submitted, answers)
             )
+        elif st.session_state.pop(f"submission_saved_{survey_id}", False):
+            st.session_state[token_key] = secrets.token_hex(16)
+
+def submission_token(form_token: str, is_completed: bool, answers: Dict[int, any]) -> str:
+    """
+    رمز منع التكرار لإرسال محدد: رمز عرض النموذج مع الإجابات ونوع الحفظ، فتكرار الإرسال نفسه
+    يُتجاهل، وحفظ المسودة بعد تعديلها أو إرسالها مكتملة من نفس العرض يُحفظ كتغيير جديد
+    """
+    content = json.dumps([is_completed, sorted(answers.items())], default=str, ensure_ascii=False)
+    return hashlib.sha256(f"{form_token}:{content}".encode('utf-8')).hexdigest()
 
 
 
-def render_field(field_id: int, label: str, field_type: str, options: str, is_required: bool):
-    """عرض حقل إدخال حسب نوعه"""
+def render_field(field_id: int, label: str, field_type: str, options: str, is_required: bool,
+                 saved_value: Optional[str] = None):
+    """عرض حقل إدخال حسب نوعه (مع القيمة المحفوظة في المسودة إن وجدت)"""
     required_mark = " *" if is_required else ""
+    value = draft_value(field_type, saved_value)
     
     if field_type == 'text':
-        return st.text_input(label + required_mark, key=f"text_{field_id}")
+        return st.text_input(label + required_mark, value=value or "", key=f"text_{field_id}")
     elif field_type == 'number':
-        return st.number_input(label + required_mark, key=f"number_{field_id}")
+        return st.number_input(label + required_mark, value=value or 0.0, key=f"number_{field_id}")
     elif field_type == 'dropdown':
         options_list = json.loads(options) if options else []
-        return st.selectbox(label + required_mark, options_list, key=f"dropdown_{field_id}")
+        index = options_list.index(value) if value in options_list else 0
+        return st.selectbox(label + required_mark, options_list, index=index, key=f"dropdown_{field_id}")
     elif field_type == 'checkbox':
-        return st.checkbox(label + required_mark, key=f"checkbox_{field_id}")
+        return st.checkbox(label + required_mark, value=bool(value), key=f"checkbox_{field_id}")
     elif field_type == 'date':
-        return st.date_input(label + required_mark, key=f"date_{field_id}")
+        return st.date_input(label + required_mark, value=value or "today", key=f"date_{field_id}")
     else:
         st.warning(f"نوع الحقل غير معروف: {field_type}")
         return None
@@ -206,9 +217,10 @@ def process_survey_submission(
     fields: List[Tuple],
     answers: Dict[int, any],
     is_completed: bool,
-    survey_name: str
+    survey_name: str,
+    token: Optional[str] = None
 ):
-    """معالجة إرسال أو حفظ الاستبيان"""
+    """معالجة إرسال أو حفظ الاستبيان (token: رمز منع تكرار الحفظ لنفس عرض النموذج)"""
     # التحقق من الحقول المطلوبة
     missing_fields = check_required_fields(fields, answers)
     
@@ -216,48 +228,35 @@ def process_survey_submission(
         st.error(f"الحقول التالية مطلوبة: {', '.join(missing_fields)}")
         return
     
-    # التحقق مما إذا كان المستخدم قد أكمل هذا الاستبيان اليوم
-    if is_completed and has_completed_survey_today(st.session_state.user_id, survey_id):
-        st.error("لقد قمت بإكمال هذا الاستبيان اليوم بالفعل. يمكنك إكماله مرة أخرى غدًا.")
-        return
-    
-    # حفظ الإجابات في قاعدة البيانات
-    response_id = save_response(
+    # الحفظ في معاملة واحدة مع التحقق من الإكمال اليومي (نفس مسار واجهة API)
+    response_id, error, duplicate_of = save_survey_submission(
         survey_id=survey_id,
         user_id=st.session_state.user_id,
         region_id=region_id,
-        is_completed=is_completed
+        answers=answers,
+        is_completed=is_completed,
+        token=token
     )
     
     if not response_id:
-        st.error("حدث خطأ أثناء حفظ البيانات")
+        st.error(error or "حدث خطأ أثناء حفظ البيانات")
         return
-    
-    # حفظ تفاصيل الإجابات
-    save_response_details(response_id, answers)
+    st.session_state[f"submission_saved_{survey_id}"] = True
     
     # عرض رسالة نجاح
     show_submission_message(is_completed, survey_name)
+    if duplicate_of:
+        st.warning(f"تنبيه: الإجابات مطابقة تماماً للإجابة السابقة #{duplicate_of}، تأكد من عدم إدخال النموذج مرتين")
 
 def check_required_fields(fields: List[Tuple], answers: Dict[int, any]) -> List[str]:
     """التحقق من الحقول المطلوبة"""
     missing_fields = []
     for field in fields:
         field_id, label, _, _, is_required, _ = field
-        if is_required and not answers.get(field_id):
+        if is_required and answers.get(field_id) in (None, ""):
             missing_fields.append(label)
     return missing_fields
 
-def save_response_details(response_id: int, answers: Dict[int, any]):
-    """حفظ تفاصيل الإجابات"""
-    for field_id, answer in answers.items():
-        if answer is not None:
-            save_response_detail(
-                response_id=response_id,
-                field_id=field_id,
-                answer_value=str(answer)
-            )
-
 def show_submission_message(is_completed: bool, survey_name: str):
     """عرض رسالة نجاح حسب نوع الحفظ"""
     if is_completed:
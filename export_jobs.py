@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+from database import DATABASE_DIR, get_survey_data_watermark
+from exports import (
+    build_survey_workbook,
+    build_survey_csv,
+    build_survey_parquet,
+    build_survey_arrow,
+    update_survey_snapshot
+)
+
+EXPORT_CACHE_DIR = DATABASE_DIR / "exports"
+EXPORT_TMP_DIR = EXPORT_CACHE_DIR / "tmp"
+EXPORT_CACHE_MAX_BYTES = int(os.environ.get("EXPORT_CACHE_MAX_MB", "500")) * 1024 * 1024
+EXPORT_CACHE_MAX_AGE_SECONDS = int(os.environ.get("EXPORT_CACHE_MAX_AGE_HOURS", "72")) * 3600
+EXPORT_WORKERS = int(os.environ.get("EXPORT_WORKERS", "2"))
+# مدة الاحتفاظ بحالة المهام المنتهية في الذاكرة
+FINISHED_JOB_TTL_SECONDS = 3600
+
+EXPORT_FORMATS = {
+    'xlsx': {
+        'builder': build_survey_workbook,
+        'label': "Excel",
+        'mime': "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    },
+    'csv': {
+        'builder': build_survey_csv,
+        'label': "CSV",
+        'mime': "text/csv",
+    },
+    'parquet': {
+        'builder': build_survey_parquet,
+        'label': "Parquet",
+        'mime': "application/vnd.apache.parquet",
+    },
+    'arrow': {
+        'builder': build_survey_arrow,
+        'label': "Arrow IPC",
+        'mime': "application/vnd.apache.arrow.file",
+    },
+}
+
+# مجمع العمال وسجل المهام مشتركان بين جميع الجلسات في نفس العملية
+_executor = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix="export")
+_jobs: Dict[str, dict] = {}
+_jobs_lock = threading.Lock()
+
+def export_cache_key(survey_id: int, filters: Optional[Dict], watermark: int, fmt: str) -> str:
+    """مفتاح الملف المخزن: الاستبيان + الفلاتر + إصدار البيانات + الصيغة"""
+    payload = json.dumps(
+        {'survey_id': survey_id, 'filters': filters or {}, 'watermark': watermark, 'format': fmt},
+        sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+def artifact_path(cache_key: str, fmt: str) -> str:
+    return str(EXPORT_CACHE_DIR / f"{cache_key}.{fmt}")
+
+def submit_export(survey_id: int, filters: Optional[Dict] = None, fmt: str = 'xlsx') -> str:
+    """
+    إرسال مهمة تصدير وإرجاع معرفها فوراً.
+    إذا كان الملف موجوداً لنفس إصدار البيانات تكتمل المهمة مباشرة دون إعادة البناء.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"صيغة تصدير غير مدعومة: {fmt}")
+
+    EXPORT_TMP_DIR.mkdir(parents=True, exist_ok=True)
+    watermark = get_survey_data_watermark(survey_id)
+    cache_key = export_cache_key(survey_id, filters, watermark, fmt)
+    path = artifact_path(cache_key, fmt)
+
+    with _jobs_lock:
+        _prune_finished_jobs()
+
+        # مهمة جارية لنفس المفتاح: لا داعي لتكرار العمل
+        for job_id, job in _jobs.items():
+            if job.get('cache_key') == cache_key and job['status'] in ('queued', 'running'):
+                return job_id
+
+        job = _new_job('export', survey_id, filters=filters or {}, format=fmt,
+                       mime=EXPORT_FORMATS[fmt]['mime'], cache_key=cache_key, path=path)
+        job_id = job['job_id']
+
+        if os.path.exists(path):
+            os.utime(path)  # تحديث وقت الاستخدام حتى لا يُحذف كملف قديم
+            job.update(status='done', progress=1.0, message="الملف جاهز من الذاكرة المؤقتة",
+                       cached=True, finished_at=time.time())
+            return job_id
+
+    _executor.submit(_run_export_job, job_id)
+    return job_id
+
+def submit_snapshot_update(survey_id: int, rebuild: bool = False) -> str:
+    """إرسال مهمة تحديث اللقطة التحليلية للاستبيان (إلحاق الإجابات الجديدة فقط)"""
+    with _jobs_lock:
+        _prune_finished_jobs()
+        for job_id, job in _jobs.items():
+            if (job['kind'] == 'snapshot' and job['survey_id'] == survey_id
+                    and job['status'] in ('queued', 'running')):
+                return job_id
+        job = _new_job('snapshot', survey_id, rebuild=rebuild)
+
+    _executor.submit(_run_snapshot_job, job['job_id'])
+    return job['job_id']
+
+def _new_job(kind: str, survey_id: int, **values) -> dict:
+    """تسجيل مهمة جديدة في السجل (يُستدعى مع الاحتفاظ بالقفل)"""
+    job = {
+        'job_id': uuid.uuid4().hex,
+        'kind': kind,
+        'survey_id': survey_id,
+        'path': None,
+        'status': 'queued',
+        'progress': 0.0,
+        'message': "في انتظار عامل متاح",
+        'error': None,
+        'cached': False,
+        'result': None,
+        'submitted_at': time.time(),
+        'finished_at': None,
+    }
+    job.update(values)
+    _jobs[job['job_id']] = job
+    return job
+
+def get_export_job(job_id: str) -> Optional[dict]:
+    """الحصول على نسخة من حالة المهمة"""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        return dict(job) if job else None
+
+def _update_job(job_id: str, **values):
+    with _jobs_lock:
+        if job_id in _jobs:
+            _jobs[job_id].update(values)
+
+def _run_export_job(job_id: str):
+    job = get_export_job(job_id)
+    builder = EXPORT_FORMATS[job['format']]['builder']
+    # الكتابة في مجلد مؤقت ثم النقل حتى لا يُقدَّم ملف ناقص من الذاكرة المؤقتة
+    tmp_path = str(EXPORT_TMP_DIR / f"{job_id}.{job['format']}")
+
+    def progress(fraction: float, message: str):
+        _update_job(job_id, progress=min(max(fraction, 0.0), 1.0), message=message)
+
+    _update_job(job_id, status='running', message="بدأ التصدير")
+    try:
+        builder(job['survey_id'], job['filters'], tmp_path, progress)
+        os.replace(tmp_path, job['path'])
+        _update_job(job_id, status='done', progress=1.0, message="اكتمل التصدير",
+                    finished_at=time.time())
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        _update_job(job_id, status='failed', error=str(e), message="فشل التصدير",
+                    finished_at=time.time())
+    finally:
+        evict_stale_exports()
+
+def _run_snapshot_job(job_id: str):
+    job = get_export_job(job_id)
+
+    def progress(fraction: float, message: str):
+        _update_job(job_id, progress=min(max(fraction, 0.0), 1.0), message=message)
+
+    _update_job(job_id, status='running', message="بدأ تحديث اللقطة")
+    try:
+        manifest = update_survey_snapshot(job['survey_id'], job['rebuild'], progress)
+        _update_job(job_id, status='done', progress=1.0, message="تم تحديث اللقطة",
+                    result=manifest, finished_at=time.time())
+    except Exception as e:
+        _update_job(job_id, status='failed', error=str(e), message="فشل تحديث اللقطة",
+                    finished_at=time.time())
+
+def _prune_finished_jobs():
+    now = time.time()
+    expired = [job_id for job_id, job in _jobs.items()
+               if job['finished_at'] and now - job['finished_at'] > FINISHED_JOB_TTL_SECONDS]
+    for job_id in expired:
+        del _jobs[job_id]
+
+def evict_stale_exports(max_bytes: int = EXPORT_CACHE_MAX_BYTES,
+                        max_age_seconds: int = EXPORT_CACHE_MAX_AGE_SECONDS) -> int:
+    """حذف الملفات الأقدم من المدة المسموحة ثم الأقدم استخداماً حتى يصبح الحجم ضمن الحد"""
+    if not EXPORT_CACHE_DIR.exists():
+        return 0
+
+    with _jobs_lock:
+        in_use = {job['path'] for job in _jobs.values() if job['status'] in ('queued', 'running')}
+
+    now = time.time()
+    artifacts = []
+    removed = 0
+    for entry in os.scandir(EXPORT_CACHE_DIR):
+        if not entry.is_file() or entry.path in in_use:
+            continue
+        stat = entry.stat()
+        if now - stat.st_mtime > max_age_seconds:
+            removed += _remove_artifact(entry.path)
+        else:
+            artifacts.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total_size = sum(size for _, size, _ in artifacts)
+    for _, size, path in sorted(artifacts):
+        if total_size <= max_bytes:
+            break
+        removed += _remove_artifact(path)
+        total_size -= size
+    return removed
+
+def _remove_artifact(path: str) -> int:
+    try:
+        os.remove(path)
+        return 1
+    except FileNotFoundError:  # حذفه عامل آخر بالفعل
+        return 0
@@ -0,0 +1,145 @@
+import re
+import time
+import streamlit as st
+from datetime import datetime
+from typing import Dict, List, Optional
+from export_jobs import EXPORT_FORMATS, submit_export, submit_snapshot_update, get_export_job
+from exports import read_snapshot_manifest, snapshot_status
+from scheduler import REPORT_TYPES
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+# مهلة إعادة عرض الصفحة تلقائياً ما دامت مهمة في الخلفية قيد التنفيذ
+JOB_POLL_SECONDS = 1.0
+JOB_POLL_KEY = "background_jobs_pending"
+
+def request_job_poll():
+    """طلب متابعة تلقائية لمهمة قيد التنفيذ (تُنفذ في نهاية الصفحة حتى تكتمل بقية العناصر)"""
+    st.session_state[JOB_POLL_KEY] = True
+
+def poll_pending_jobs():
+    """تُستدعى في نهاية لوحة التحكم: إعادة عرض الصفحة بعد مهلة قصيرة إذا كانت هناك مهمة قيد التنفيذ"""
+    if st.session_state.pop(JOB_POLL_KEY, False):
+        time.sleep(JOB_POLL_SECONDS)
+        st.rerun()
+
+def display_export_panel(survey_id: int, survey_name: str, filters: Optional[Dict] = None,
+                         key_prefix: str = "export", formats: Optional[List[str]] = None):
+    """
+    عرض التصدير في الخلفية: إرسال المهمة ومتابعة تقدمها ثم تنزيل الملف الجاهز
+    """
+    job_key = f"{key_prefix}_job_{survey_id}"
+
+    formats = formats or list(EXPORT_FORMATS)
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        fmt = st.selectbox(
+            "صيغة الملف",
+            formats,
+            format_func=lambda x: EXPORT_FORMATS[x]['label'],
+            key=f"{key_prefix}_format_{survey_id}"
+        )
+    with col2:
+        st.write("")
+        if st.button(f"تصدير شامل لجميع البيانات إلى {EXPORT_FORMATS[fmt]['label']}",
+                     key=f"{key_prefix}_submit_{survey_id}"):
+            st.session_state[job_key] = submit_export(survey_id, filters, fmt)
+
+    job_id = st.session_state.get(job_key)
+    if not job_id:
+        return
+
+    job = get_export_job(job_id)
+    if not job:
+        del st.session_state[job_key]
+        return
+
+    if job['status'] in ('queued', 'running'):
+        st.progress(job['progress'], text=job['message'])
+        request_job_poll()
+    elif job['status'] == 'failed':
+        st.error(f"فشل التصدير: {job['error']}")
+    else:
+        filename = (re.sub(r'[^\w\-_]', '_', survey_name) + "_كامل_"
+                    + datetime.now().strftime("%Y%m%d_%H%M") + f".{job['format']}")
+        # إنشاء الملف يتم صفحة بصفحة على القرص، لكن زر التنزيل يقرأه كاملاً في الذاكرة عند عرضه
+        try:
+            with open(job['path'], "rb") as f:
+                st.download_button(
+                    label=f"تنزيل ملف {EXPORT_FORMATS[job['format']]['label']}",
+                    data=f,
+                    file_name=filename,
+                    mime=job['mime'],
+                    key=f"{key_prefix}_download_{survey_id}"
+                )
+        except FileNotFoundError:
+            del st.session_state[job_key]
+            st.info("انتهت صلاحية الملف المُصدَّر، يرجى إعادة التصدير")
+            return
+        if job['cached']:
+            st.success("الملف جاهز (لم تتغير البيانات منذ آخر تصدير)")
+        else:
+            st.success("تم إنشاء الملف بنجاح")
+
+def display_snapshot_panel(survey_id: int, key_prefix: str = "snapshot"):
+    """
+    عرض حالة اللقطة التحليلية (ملفات Parquet) للاستبيان مع زر تحديثها في الخلفية
+    """
+    job_key = f"{key_prefix}_job_{survey_id}"
+    manifest = read_snapshot_manifest(survey_id)
+    status = snapshot_status(survey_id)
+
+    with st.expander("📦 اللقطة التحليلية (Parquet)"):
+        if manifest:
+            st.caption(
+                f"عدد الصفوف: {manifest['rows']} - عدد الملفات: {len(manifest['parts'])}"
+                f" - آخر إجابة مضمنة: #{manifest['last_response_id']}"
+            )
+            if status['needs_rebuild']:
+                st.warning("تغيرت حقول الاستبيان أو لم يكتمل آخر تحديث للقطة، وسيُعاد بناؤها بالكامل عند التحديث")
+            elif status['new'] or status['changed']:
+                st.info(f"اللقطة غير محدثة: {status['new']} إجابة جديدة و{status['changed']} إجابة معدلة"
+                        " بعد آخر تحديث")
+        else:
+            st.caption("لم يتم إنشاء لقطة لهذا الاستبيان بعد")
+
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("تحديث اللقطة (الإجابات الجديدة والمعدلة)", key=f"{key_prefix}_update_{survey_id}"):
+                st.session_state[job_key] = submit_snapshot_update(survey_id)
+        with col2:
+            if st.button("إعادة بناء اللقطة بالكامل", key=f"{key_prefix}_rebuild_{survey_id}"):
+                st.session_state[job_key] = submit_snapshot_update(survey_id, rebuild=True)
+
+        job = get_export_job(st.session_state[job_key]) if job_key in st.session_state else None
+        if not job:
+            return
+        if job['status'] in ('queued', 'running'):
+            st.progress(job['progress'], text=job['message'])
+            request_job_poll()
+        elif job['status'] == 'failed':
+            st.error(f"فشل تحديث اللقطة: {job['error']}")
+        else:
+            st.success(job['message'])
+
+def display_report_downloads(artifacts: List[Dict], survey_names: Dict[int, str],
+                             key_prefix: str = "reports"):
+    """عرض التقارير المُعدة مسبقاً (آخر إصدار من كل تقرير) للتنزيل الفوري"""
+    if not artifacts:
+        st.caption("لم يتم إعداد تقارير مجدولة بعد")
+        return
+
+    for artifact in artifacts:
+        title = REPORT_TYPES.get(artifact['report_type'], artifact['report_type'])
+        if artifact['survey_id'] is not None:
+            title += f" - {survey_names.get(artifact['survey_id'], artifact['survey_id'])}"
+        try:
+            with open(artifact['file_path'], "rb") as f:
+                st.download_button(
+                    label=f"📥 {title} (إصدار {artifact['version']} - {artifact['created_at']})",
+                    data=f,
+                    file_name=re.sub(r'[^\w\-_]', '_', title) + f"_v{artifact['version']}.xlsx",
+                    mime=XLSX_MIME,
+                    key=f"{key_prefix}_{artifact['artifact_id']}"
+                )
+        except FileNotFoundError:
+            st.caption(f"{title}: الملف غير متاح حالياً")
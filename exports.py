@@ -0,0 +1,554 @@
+from __future__ import annotations
+import io
+import os
+import csv
+import sqlite3
+import json
+from typing import Callable, Dict, Optional
+from lazy_imports import LazyModule
+from database import DATABASE_DIR, DATABASE_PATH, build_response_filters, build_audit_filters
+
+pd = LazyModule("pandas")
+
+# دالة تقدم التصدير: تستقبل نسبة بين 0 و 1 ورسالة قصيرة
+ProgressCallback = Callable[[float, str], None]
+
+DETAILS_CHUNK_SIZE = 20000
+# عدد الصفوف في كل مجموعة صفوف داخل ملفات Parquet (لكل مجموعة إحصائيات min/max خاصة بها)
+PARQUET_ROW_GROUP_SIZE = 100000
+SNAPSHOTS_DIR = DATABASE_DIR / "snapshots"
+# البادئة "_" تجعل pyarrow.dataset يتجاهل ملف الوصف عند قراءة مجلد اللقطة
+SNAPSHOT_MANIFEST = "_manifest.json"
+
+def _noop_progress(fraction: float, message: str):
+    pass
+
+def build_survey_workbook(survey_id: int, filters: Optional[Dict], path: str,
+                          progress: Optional[ProgressCallback] = None) -> str:
+    """بناء ملف Excel شامل لإجابات استبيان في المسار المحدد"""
+    progress = progress or _noop_progress
+    filter_sql, filter_params = build_response_filters(filters)
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        progress(0.05, "جاري جلب ملخص الإجابات")
+        responses = conn.execute(f'''
+            SELECT r.response_id, u.username, ha.admin_name, g.governorate_name,
+                   r.submission_date, r.is_completed
+            FROM Responses r
+            JOIN Users u ON r.user_id = u.user_id
+            JOIN HealthAdministrations ha ON r.region_id = ha.admin_id
+            JOIN Governorates g ON ha.governorate_id = g.governorate_id
+            WHERE r.survey_id = ?{filter_sql}
+            ORDER BY r.submission_date DESC
+        ''', [survey_id] + filter_params).fetchall()
+
+        summary_df = pd.DataFrame(
+            [(r[0], r[1], r[2], r[3], r[4], "مكتملة" if r[5] else "مسودة") for r in responses],
+            columns=["ID", "المستخدم", "الإدارة الصحية", "المحافظة", "تاريخ التقديم", "الحالة"]
+        )
+
+        # جلب جميع التفاصيل باستعلام واحد على دفعات بدلاً من استعلام لكل إجابة
+        total_details = conn.execute(f'''
+            SELECT COUNT(*)
+            FROM Response_Details rd
+            JOIN Responses r ON rd.response_id = r.response_id
+            JOIN HealthAdministrations ha ON r.region_id = ha.admin_id
+            WHERE r.survey_id = ?{filter_sql}
+        ''', [survey_id] + filter_params).fetchone()[0]
+
+        details_chunks = []
+        loaded = 0
+        for chunk in pd.read_sql_query(f'''
+            SELECT rd.response_id AS "ID الإجابة",
+                   sf.field_label AS "الحقل",
+                   rd.answer_value AS "القيمة",
+                   u.username AS "أدخلها",
+                   r.submission_date AS "تاريخ الإدخال",
+                   CASE WHEN r.is_completed THEN 'مكتملة' ELSE 'مسودة' END AS "حالة الإجابة"
+            FROM Response_Details rd
+            JOIN Survey_Fields sf ON rd.field_id = sf.field_id
+            JOIN Responses r ON rd.response_id = r.response_id
+            JOIN Users u ON r.user_id = u.user_id
+            JOIN HealthAdministrations ha ON r.region_id = ha.admin_id
+            WHERE r.survey_id = ?{filter_sql}
+            ORDER BY r.submission_date DESC, rd.response_id, sf.field_order
+        ''', conn, params=[survey_id] + filter_params, chunksize=DETAILS_CHUNK_SIZE):
+            details_chunks.append(chunk)
+            loaded += len(chunk)
+            progress(0.1 + 0.5 * loaded / max(total_details, 1), f"تم جلب {loaded} من {total_details} إجابة تفصيلية")
+
+        fields = conn.execute('''
+            SELECT field_label, field_type, field_options, is_required
+            FROM Survey_Fields
+            WHERE survey_id = ?
+            ORDER BY field_order
+        ''', (survey_id,)).fetchall()
+    finally:
+        conn.close()
+
+    progress(0.65, "جاري كتابة ملف Excel")
+    with pd.ExcelWriter(path, engine='openpyxl') as writer:
+        # 1. ورقة ملخص الإجابات
+        summary_df.to_excel(writer, sheet_name='ملخص_الإجابات', index=False)
+
+        # 2. ورقة تفاصيل جميع الإجابات
+        if details_chunks:
+            pd.concat(details_chunks, ignore_index=True).to_excel(
+                writer, sheet_name='تفاصيل_الإجابات', index=False)
+        progress(0.9, "جاري كتابة أوراق الحقول والمستخدمين")
+
+        # 3. ورقة حقول الاستبيان
+        fields_df = pd.DataFrame(
+            [(f[0], f[1], json.loads(f[2]) if f[2] else None, "نعم" if f[3] else "لا") for f in fields],
+            columns=["اسم الحقل", "نوع الحقل", "الخيارات", "مطلوب"]
+        )
+        fields_df.to_excel(writer, sheet_name='حقول_الاستبيان', index=False)
+
+        # 4. ورقة المستخدمين الذين أدخلوا بيانات
+        users_df = summary_df.drop(columns=["ID"])
+        users_df.drop_duplicates().to_excel(writer, sheet_name='المستخدمين', index=False)
+
+    progress(1.0, "اكتمل التصدير")
+    return path
+
+
+# ===== التصدير العمودي (Parquet / Arrow) =====
+
+RESPONSES_COLUMNAR_QUERY = '''
+    SELECT r.response_id, r.survey_id,
+           u.username, ha.admin_name AS health_admin, g.governorate_name AS governorate,
+           CAST(strftime('%s', r.submission_date) AS INTEGER) AS submission_ts,
+           r.is_completed,
+           rd.field_id, sf.field_label, sf.field_type, sf.field_order,
+           rd.answer_value
+    FROM Response_Details rd
+    JOIN Responses r ON rd.response_id = r.response_id
+    JOIN Survey_Fields sf ON rd.field_id = sf.field_id
+    JOIN Users u ON r.user_id = u.user_id
+    JOIN HealthAdministrations ha ON r.region_id = ha.admin_id
+    JOIN Governorates g ON ha.governorate_id = g.governorate_id
+    WHERE r.survey_id = ?{filters}
+    ORDER BY rd.response_id, sf.field_order
+'''
+
+AUDIT_COLUMNAR_QUERY = '''
+    SELECT a.log_id, COALESCE(u.username, 'النظام') AS username, a.action_type, a.table_name, a.record_id,
+           a.old_value, a.new_value,
+           CAST(strftime('%s', a.action_timestamp) AS INTEGER) AS action_ts
+    FROM AuditLog a
+    LEFT JOIN Users u ON a.user_id = u.user_id
+    {filters}
+    ORDER BY a.log_id
+'''
+
+def responses_arrow_schema():
+    """مخطط Arrow لإجابات الاستبيان بالصيغة الطويلة (صف لكل إجابة حقل)"""
+    import pyarrow as pa
+    text = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ('response_id', pa.int64()),
+        ('survey_id', pa.int64()),
+        ('username', text),
+        ('health_admin', text),
+        ('governorate', text),
+        ('submission_date', pa.timestamp('s')),
+        ('is_completed', pa.bool_()),
+        ('field_id', pa.int64()),
+        ('field_label', text),
+        ('field_type', text),
+        ('field_order', pa.int32()),
+        ('answer_value', pa.string()),
+    ])
+
+def audit_arrow_schema():
+    """مخطط Arrow لسجل التعديلات"""
+    import pyarrow as pa
+    text = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ('log_id', pa.int64()),
+        ('username', text),
+        ('action_type', text),
+        ('table_name', text),
+        ('record_id', pa.int64()),
+        ('old_value', pa.string()),
+        ('new_value', pa.string()),
+        ('action_timestamp', pa.timestamp('s')),
+    ])
+
+def _timestamp_column(df: pd.DataFrame, source: str, target: str) -> pd.DataFrame:
+    df[target] = pd.to_datetime(df.pop(source), unit='s')
+    return df
+
+def iter_response_batches(conn, survey_id: int, filters: Optional[Dict] = None,
+                          min_response_id: int = 0, max_response_id: Optional[int] = None,
+                          chunk_size: int = PARQUET_ROW_GROUP_SIZE):
+    """قراءة إجابات الاستبيان على دفعات وتحويل كل دفعة إلى جدول Arrow بمخطط ثابت"""
+    import pyarrow as pa
+    schema = responses_arrow_schema()
+    filter_sql, filter_params = build_response_filters(filters)
+    if min_response_id:
+        filter_sql += " AND r.response_id > ?"
+        filter_params = filter_params + [min_response_id]
+    if max_response_id is not None:
+        filter_sql += " AND r.response_id <= ?"
+        filter_params = filter_params + [max_response_id]
+    for chunk in pd.read_sql_query(
+            RESPONSES_COLUMNAR_QUERY.format(filters=filter_sql), conn,
+            params=[survey_id] + filter_params, chunksize=chunk_size):
+        chunk = _timestamp_column(chunk, 'submission_ts', 'submission_date')
+        chunk['is_completed'] = chunk['is_completed'].astype(bool)
+        yield pa.Table.from_pandas(chunk[schema.names], schema=schema, preserve_index=False)
+
+def iter_audit_batches(conn, filters: Optional[Dict] = None, chunk_size: int = PARQUET_ROW_GROUP_SIZE):
+    """قراءة سجل التعديلات على دفعات كجداول Arrow (الفلاتر بنفس مفاتيح get_audit_logs)"""
+    import pyarrow as pa
+    schema = audit_arrow_schema()
+    conditions, params = build_audit_filters(**(filters or {}))
+    filter_sql = f"WHERE {conditions}" if conditions else ""
+    for chunk in pd.read_sql_query(
+            AUDIT_COLUMNAR_QUERY.format(filters=filter_sql), conn,
+            params=params, chunksize=chunk_size):
+        chunk = _timestamp_column(chunk, 'action_ts', 'action_timestamp')
+        chunk['record_id'] = chunk['record_id'].astype('Int64')
+        yield pa.Table.from_pandas(chunk[schema.names], schema=schema, preserve_index=False)
+
+def write_parquet(batches, schema, path: str, progress: Optional[ProgressCallback] = None,
+                  total_rows: Optional[int] = None) -> int:
+    """
+    كتابة الدفعات تباعاً في ملف Parquet دون تجميعها في الذاكرة.
+    الأعمدة النصية مرمزة بالقاموس وكل مجموعة صفوف تحمل إحصائياتها.
+    """
+    import pyarrow.parquet as pq
+    progress = progress or _noop_progress
+    written = 0
+    with pq.ParquetWriter(path, schema, compression='zstd',
+                          use_dictionary=True, write_statistics=True) as writer:
+        for batch in batches:
+            writer.write_table(batch, row_group_size=PARQUET_ROW_GROUP_SIZE)
+            written += batch.num_rows
+            if total_rows:
+                progress(0.05 + 0.9 * written / total_rows, f"تمت كتابة {written} من {total_rows} صف")
+    return written
+
+def write_arrow_ipc(batches, schema, path: str) -> int:
+    """كتابة ملف Arrow IPC بقواميس موحدة لجميع الدفعات"""
+    import pyarrow as pa
+    tables = list(batches)
+    table = pa.concat_tables(tables) if tables else schema.empty_table()
+    table = table.unify_dictionaries()
+    with pa.OSFile(path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=PARQUET_ROW_GROUP_SIZE)
+    return table.num_rows
+
+def count_response_details(conn, survey_id: int, filters: Optional[Dict] = None) -> int:
+    filter_sql, filter_params = build_response_filters(filters)
+    return conn.execute(f'''
+        SELECT COUNT(*)
+        FROM Response_Details rd
+        JOIN Responses r ON rd.response_id = r.response_id
+        JOIN HealthAdministrations ha ON r.region_id = ha.admin_id
+        WHERE r.survey_id = ?{filter_sql}
+    ''', [survey_id] + filter_params).fetchone()[0]
+
+def build_survey_parquet(survey_id: int, filters: Optional[Dict], path: str,
+                         progress: Optional[ProgressCallback] = None) -> str:
+    """تصدير إجابات الاستبيان إلى ملف Parquet"""
+    progress = progress or _noop_progress
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        total = count_response_details(conn, survey_id, filters)
+        progress(0.05, "جاري كتابة ملف Parquet")
+        write_parquet(iter_response_batches(conn, survey_id, filters),
+                      responses_arrow_schema(), path, progress, total)
+    finally:
+        conn.close()
+    progress(1.0, "اكتمل التصدير")
+    return path
+
+def build_survey_arrow(survey_id: int, filters: Optional[Dict], path: str,
+                       progress: Optional[ProgressCallback] = None) -> str:
+    """تصدير إجابات الاستبيان إلى ملف Arrow IPC"""
+    progress = progress or _noop_progress
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        progress(0.1, "جاري قراءة الإجابات")
+        write_arrow_ipc(iter_response_batches(conn, survey_id, filters),
+                        responses_arrow_schema(), path)
+    finally:
+        conn.close()
+    progress(1.0, "اكتمل التصدير")
+    return path
+
+def export_audit_log_parquet(path: str, filters: Optional[Dict] = None) -> int:
+    """تصدير سجل التعديلات إلى ملف Parquet وإرجاع عدد الصفوف"""
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        return write_parquet(iter_audit_batches(conn, filters), audit_arrow_schema(), path)
+    finally:
+        conn.close()
+
+def export_audit_log_arrow(path: str, filters: Optional[Dict] = None) -> int:
+    """تصدير سجل التعديلات إلى ملف Arrow IPC وإرجاع عدد الصفوف"""
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        return write_arrow_ipc(iter_audit_batches(conn, filters), audit_arrow_schema(), path)
+    finally:
+        conn.close()
+
+# ===== لقطات تحليلية لكل استبيان =====
+
+def snapshot_dir(survey_id: int):
+    return SNAPSHOTS_DIR / f"survey_{survey_id}"
+
+def read_snapshot_manifest(survey_id: int) -> Optional[Dict]:
+    """قراءة ملف وصف اللقطة (None إذا لم تُنشأ بعد)"""
+    manifest_path = snapshot_dir(survey_id) / SNAPSHOT_MANIFEST
+    if not manifest_path.exists():
+        return None
+    with open(manifest_path, encoding='utf-8') as f:
+        return json.load(f)
+
+def snapshot_status(survey_id: int) -> Optional[Dict]:
+    """
+    ما تغير منذ آخر تحديث للقطة (None إذا لم تُنشأ بعد): عدد الإجابات الجديدة والمعدلة،
+    و needs_rebuild إذا تغيرت حقول الاستبيان أو لا تطابق اللقطة ما سجلته قاعدة البيانات
+    """
+    manifest = read_snapshot_manifest(survey_id)
+    if manifest is None:
+        return None
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        run = conn.execute("SELECT last_response_id, field_changes FROM SnapshotRuns WHERE survey_id = ?",
+                           (survey_id,)).fetchone()
+        changed = conn.execute("SELECT COUNT(*) FROM SnapshotQueue WHERE survey_id = ?", (survey_id,)).fetchone()[0]
+        new = conn.execute("SELECT COUNT(*) FROM Responses WHERE survey_id = ? AND response_id > ?",
+                           (survey_id, manifest['last_response_id'])).fetchone()[0]
+    finally:
+        conn.close()
+    return {'new': new, 'changed': changed,
+            'needs_rebuild': not run or bool(run[1]) or run[0] != manifest['last_response_id']}
+
+def update_survey_snapshot(survey_id: int, rebuild: bool = False,
+                           progress: Optional[ProgressCallback] = None) -> Dict:
+    """
+    تحديث لقطة Parquet الخاصة بالاستبيان: إلحاق الإجابات الجديدة كملف جزئي إضافي وإعادة كتابة
+    الأجزاء التي تضم إجابات تغيرت بعد تضمينها (ترقية مسودة أو تعديل أو تصحيح جماعي أو حذف).
+    تغيير حقول الاستبيان أو عدم تطابق اللقطة مع SnapshotRuns يعيد بناءها كاملة.
+    """
+    progress = progress or _noop_progress
+    directory = snapshot_dir(survey_id)
+    directory.mkdir(parents=True, exist_ok=True)
+    manifest = None if rebuild else read_snapshot_manifest(survey_id)
+
+    conn = sqlite3.connect(DATABASE_PATH, isolation_level=None, timeout=30)
+    try:
+        # تسجيل الحد الأعلى قبل القراءة: ما يتغير من الإجابات المضمنة أثناء الكتابة يُضاف إلى
+        # الطابور برقم أكبر من queued_seq فيُعالج في التحديث التالي
+        conn.execute("BEGIN IMMEDIATE")
+        run = conn.execute("SELECT last_response_id, field_changes FROM SnapshotRuns WHERE survey_id = ?",
+                           (survey_id,)).fetchone()
+        queued_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM SnapshotQueue WHERE survey_id = ?",
+                                  (survey_id,)).fetchone()[0]
+        last_response_id = conn.execute(
+            "SELECT COALESCE(MAX(response_id), 0) FROM Responses WHERE survey_id = ?", (survey_id,)
+        ).fetchone()[0]
+        changed_ids = [row[0] for row in conn.execute(
+            "SELECT response_id FROM SnapshotQueue WHERE survey_id = ? AND seq <= ?", (survey_id, queued_seq))]
+        conn.execute(
+            """INSERT INTO SnapshotRuns (survey_id, last_response_id) VALUES (?, ?)
+               ON CONFLICT(survey_id) DO UPDATE SET last_response_id = excluded.last_response_id""",
+            (survey_id, last_response_id)
+        )
+        conn.execute("COMMIT")
+        field_changes = run[1] if run else 0
+        if manifest is not None and (not run or field_changes or run[0] != manifest['last_response_id']):
+            manifest = None
+
+        if manifest is None:
+            parts = [(1, last_response_id)] if last_response_id else []
+            manifest = {'survey_id': survey_id, 'last_response_id': 0, 'rows': 0, 'parts': []}
+        else:
+            parts = [(part['from_response_id'], part['to_response_id']) for part in manifest['parts']
+                     if any(part['from_response_id'] <= response_id <= part['to_response_id']
+                            for response_id in changed_ids)]
+            if last_response_id > manifest['last_response_id']:
+                parts.append((manifest['last_response_id'] + 1, last_response_id))
+
+        written = {}
+        for index, (first_id, last_id) in enumerate(parts):
+            progress(0.1 + 0.8 * index / len(parts), f"جاري كتابة الإجابات {first_id} - {last_id}")
+            part_name = f"part-{first_id:010d}-{last_id:010d}.parquet"
+            tmp_path = str(directory / f".{part_name}.tmp")
+            rows = write_parquet(
+                iter_response_batches(conn, survey_id, min_response_id=first_id - 1, max_response_id=last_id),
+                responses_arrow_schema(), tmp_path
+            )
+            written[part_name] = (tmp_path, {'file': part_name, 'rows': rows,
+                                             'from_response_id': first_id, 'to_response_id': last_id})
+    finally:
+        conn.close()
+
+    if not manifest['parts']:
+        for old_part in directory.glob("part-*.parquet"):
+            if old_part.name not in written:
+                old_part.unlink()
+    for part_name, (tmp_path, _) in written.items():
+        os.replace(tmp_path, directory / part_name)
+    manifest['parts'] = [part for part in manifest['parts'] if part['file'] not in written]
+    manifest['parts'] = sorted(manifest['parts'] + [part for _, part in written.values()],
+                               key=lambda part: part['from_response_id'])
+    manifest['last_response_id'] = last_response_id
+    manifest['rows'] = sum(part['rows'] for part in manifest['parts'])
+    with open(directory / SNAPSHOT_MANIFEST, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    conn = sqlite3.connect(DATABASE_PATH, timeout=30)
+    try:
+        with conn:
+            conn.execute("DELETE FROM SnapshotQueue WHERE survey_id = ? AND seq <= ?", (survey_id, queued_seq))
+            conn.execute("UPDATE SnapshotRuns SET field_changes = field_changes - ? WHERE survey_id = ?",
+                         (field_changes, survey_id))
+    finally:
+        conn.close()
+    progress(1.0, "تم تحديث اللقطة" if written else "اللقطة محدثة بالفعل")
+    return manifest
+
+# ===== تصدير CSV متدفق =====
+
+CSV_PAGE_SIZE = 1000
+SURVEY_CSV_BASE_COLUMNS = ["ID", "المستخدم", "الإدارة الصحية", "المحافظة", "تاريخ التقديم", "الحالة"]
+AUDIT_CSV_COLUMNS = ["ID", "المستخدم", "الإجراء", "الجدول", "رقم السجل",
+                     "القيمة القديمة", "القيمة الجديدة", "الوقت"]
+
+def iter_csv_chunks(header: list, row_pages):
+    """
+    ترميز الصفوف إلى CSV صفحة بصفحة كبايتات UTF-8 مع BOM في البداية
+    (ليتعرف Excel على النص العربي)، دون الاحتفاظ بأكثر من صفحة في الذاكرة.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    yield '\ufeff'.encode('utf-8') + buffer.getvalue().encode('utf-8')
+
+    for rows in row_pages:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+
+def iter_survey_response_pages(conn, survey_id: int, filters: Optional[Dict] = None,
+                               page_size: int = CSV_PAGE_SIZE):
+    """
+    صفحات إجابات الاستبيان بصيغة عريضة (صف لكل إجابة وعمود لكل حقل)
+    باستخدام الترقيم بالمفتاح على response_id بدلاً من OFFSET.
+    """
+    filter_sql, filter_params = build_response_filters(filters)
+    field_ids = [row[0] for row in conn.execute(
+        "SELECT field_id FROM Survey_Fields WHERE survey_id = ? ORDER BY field_order",
+        (survey_id,)
+    )]
+    field_positions = {field_id: i for i, field_id in enumerate(field_ids)}
+
+    last_id = 0
+    while True:
+        responses = conn.execute(f'''
+            SELECT r.response_id, u.username, ha.admin_name, g.governorate_name,
+                   r.submission_date, r.is_completed
+            FROM Responses r
+            JOIN Users u ON r.user_id = u.user_id
+            JOIN HealthAdministrations ha ON r.region_id = ha.admin_id
+            JOIN Governorates g ON ha.governorate_id = g.governorate_id
+            WHERE r.survey_id = ? AND r.response_id > ?{filter_sql}
+            ORDER BY r.response_id
+            LIMIT ?
+        ''', [survey_id, last_id] + filter_params + [page_size]).fetchall()
+        if not responses:
+            return
+
+        answers = {r[0]: [""] * len(field_ids) for r in responses}
+        placeholders = ','.join('?' * len(responses))
+        for response_id, field_id, answer_value in conn.execute(f'''
+            SELECT response_id, field_id, answer_value
+            FROM Response_Details
+            WHERE response_id IN ({placeholders})
+        ''', list(answers)):
+            if field_id in field_positions:
+                answers[response_id][field_positions[field_id]] = answer_value
+
+        yield [
+            [r[0], r[1], r[2], r[3], r[4], "مكتملة" if r[5] else "مسودة"] + answers[r[0]]
+            for r in responses
+        ]
+        last_id = responses[-1][0]
+
+def survey_csv_header(conn, survey_id: int) -> list:
+    labels = [row[0] for row in conn.execute(
+        "SELECT field_label FROM Survey_Fields WHERE survey_id = ? ORDER BY field_order",
+        (survey_id,)
+    )]
+    return SURVEY_CSV_BASE_COLUMNS + labels
+
+def iter_audit_log_pages(conn, filters: Optional[Dict] = None, page_size: int = CSV_PAGE_SIZE):
+    """صفحات سجل التعديلات بالترقيم بالمفتاح على log_id (الفلاتر بنفس مفاتيح get_audit_logs)"""
+    conditions, params = build_audit_filters(**(filters or {}))
+    filter_sql = f" AND {conditions}" if conditions else ""
+    last_id = 0
+    while True:
+        rows = conn.execute(f'''
+            SELECT a.log_id, COALESCE(u.username, 'النظام'), a.action_type, a.table_name,
+                   a.record_id, a.old_value, a.new_value, a.action_timestamp
+            FROM AuditLog a
+            LEFT JOIN Users u ON a.user_id = u.user_id
+            WHERE a.log_id > ?{filter_sql}
+            ORDER BY a.log_id
+            LIMIT ?
+        ''', [last_id] + params + [page_size]).fetchall()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+def write_chunks(chunks, path: str) -> int:
+    """كتابة مولد بايتات إلى ملف وإرجاع الحجم المكتوب"""
+    written = 0
+    with open(path, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+            written += len(chunk)
+    return written
+
+def build_survey_csv(survey_id: int, filters: Optional[Dict], path: str,
+                     progress: Optional[ProgressCallback] = None) -> str:
+    """تصدير إجابات الاستبيان إلى CSV صفحة بصفحة"""
+    progress = progress or _noop_progress
+    filter_sql, filter_params = build_response_filters(filters)
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        total = conn.execute(f'''
+            SELECT COUNT(*)
+            FROM Responses r
+            JOIN HealthAdministrations ha ON r.region_id = ha.admin_id
+            WHERE r.survey_id = ?{filter_sql}
+        ''', [survey_id] + filter_params).fetchone()[0]
+
+        def pages():
+            done = 0
+            for page in iter_survey_response_pages(conn, survey_id, filters):
+                done += len(page)
+                progress(done / max(total, 1), f"تمت كتابة {done} من {total} إجابة")
+                yield page
+
+        write_chunks(iter_csv_chunks(survey_csv_header(conn, survey_id), pages()), path)
+    finally:
+        conn.close()
+    progress(1.0, "اكتمل التصدير")
+    return path
+
+def export_audit_log_csv(path: str, filters: Optional[Dict] = None) -> int:
+    """تصدير سجل التعديلات إلى CSV صفحة بصفحة وإرجاع حجم الملف"""
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        return write_chunks(iter_csv_chunks(AUDIT_CSV_COLUMNS, iter_audit_log_pages(conn, filters)), path)
+    finally:
+        conn.close()
@@ -1,23 +1,27 @@
 import streamlit as st
 import sqlite3
-import pandas as pd
-import json
+from lazy_imports import LazyModule
 from typing import List, Tuple, Optional
-from datetime import datetime
 from database import (
     DATABASE_PATH,
+    set_audit_user,
+    commit_audited,
     get_governorate_admin_data,
     get_governorate_surveys,
-    get_governorate_employees,
+    get_governorate_employees_page,
+    get_health_admins_by_governorate,
     update_survey,
     get_survey_fields,
     update_user,
-    get_user_allowed_surveys,
     update_user_allowed_surveys,
-    get_response_info,
-    get_response_details,
-    update_response_detail
+    count_survey_responses,
+    get_report_artifacts
 )
+from export_views import display_export_panel, display_report_downloads, poll_pending_jobs
+from grid_views import display_selectable_table, display_pager, display_responses_editor
+from analytics_views import display_survey_analytics, display_submission_trend, select_survey_for_analytics
+
+pd = LazyModule("pandas")
 
 def show_governorate_admin_dashboard():
     """
@@ -37,26 +41,45 @@ def show_governorate_admin_dashboard():
     
     governorate_id, governorate_name, description = gov_data
     
-    # تنسيق واجهة المستخدم
-    st.set_page_config(layout="wide")
+    # تنسيق واجهة المستخدم (إعداد الصفحة يتم مرة واحدة في app.py)
     st.title(f"لوحة تحكم محافظة {governorate_name}")
     st.markdown(f"**وصف المحافظة:** {description}")
     
-    # تبويبات لوحة التحكم
-    tab1, tab2, tab3 = st.tabs([
-        "📋 إدارة الاستبيانات",
-        "📊 عرض البيانات",
-        "👥 إدارة الموظفين"
-    ])
-    
-    with tab1:
-        manage_governorate_surveys(governorate_id, governorate_name)
-    
-    with tab2:
-        view_governorate_data(governorate_id, governorate_name)
-    
-    with tab3:
-        manage_governorate_employees(governorate_id, governorate_name)
+    # أقسام لوحة التحكم (يُنفذ القسم المختار فقط بدلاً من كل التبويبات مع كل نقرة)
+    sections = {
+        "📋 إدارة الاستبيانات": manage_governorate_surveys,
+        "📊 عرض البيانات": view_governorate_data,
+        "👥 إدارة الموظفين": manage_governorate_employees,
+        "📈 تحليل الإجابات": view_governorate_analytics,
+    }
+    section = st.radio("القسم", list(sections), horizontal=True,
+                       key="governorate_section", label_visibility="collapsed")
+    st.divider()
+    sections[section](governorate_id, governorate_name)
+    poll_pending_jobs()
+
+def view_governorate_analytics(governorate_id: int, governorate_name: str):
+    """
+    تحليل إجابات استبيانات المحافظة موزعة حسب الإدارات الصحية
+    """
+    st.subheader(f"تحليل إجابات محافظة {governorate_name}")
+
+    surveys = get_governorate_surveys(governorate_id)
+    survey_id = select_survey_for_analytics(surveys, key=f"gov_analytics_survey_{governorate_id}")
+    if survey_id:
+        st.markdown("#### حجم الإجابات عبر الزمن")
+        display_submission_trend(
+            survey_id,
+            filters={'governorate_id': governorate_id},
+            split_options=(None, 'admin'),
+            key_prefix=f"gov_trend_{governorate_id}"
+        )
+        display_survey_analytics(
+            survey_id,
+            filters={'governorate_id': governorate_id},
+            group_by_options=('admin',),
+            key_prefix=f"gov_analytics_{governorate_id}"
+        )
 
 def manage_governorate_surveys(governorate_id: int, governorate_name: str):
     """
@@ -140,11 +163,12 @@ def edit_governorate_survey(survey_id: int, governorate_id: int):
             with col1:
                 save_btn = st.form_submit_button("💾 حفظ التعديلات")
                 if save_btn:
+                    set_audit_user(conn, st.session_state.user_id)
                     conn.execute(
                         "UPDATE Surveys SET is_active=? WHERE survey_id=?",
                         (is_active, survey_id)
                     )
-                    conn.commit()
+                    commit_audited(conn)
                     st.success("تم تحديث حالة الاستبيان بنجاح")
                     del st.session_state.editing_survey
                     st.rerun()
@@ -167,7 +191,7 @@ def view_governorate_data(governorate_id: int, governorate_name: str):
     عرض بيانات المحافظة
     """
     st.header(f"بيانات محافظة {governorate_name}")
-    
+
     surveys = get_governorate_surveys(governorate_id)
     
     if not surveys:
@@ -201,288 +225,155 @@ def view_survey_responses(survey_id: int, governorate_id: int):
         
         # زر العودة مع مفتاح فريد
         if st.button("← العودة إلى القائمة", 
-                    key=f"back_{survey_id}_{governorate_id}_{datetime.now().timestamp()}"):
+                    key=f"back_{survey_id}_{governorate_id}"):
             if 'viewing_survey' in st.session_state:
                 del st.session_state.viewing_survey
             st.rerun()
         
-        # الحصول على الإجابات للمحافظة فقط
-        responses = conn.execute('''
-            SELECT r.response_id, u.username, ha.admin_name, 
-                   r.submission_date, r.is_completed
-            FROM Responses r
-            JOIN Users u ON r.user_id = u.user_id
-            JOIN HealthAdministrations ha ON r.region_id = ha.admin_id
-            WHERE r.survey_id = ? AND ha.governorate_id = ?
-            ORDER BY r.submission_date DESC
-        ''', (survey_id, governorate_id)).fetchall()
-        
-        if not responses:
+        # الإحصائيات من جدول التجميع بدلاً من جلب جميع إجابات المحافظة
+        filters = {'governorate_id': governorate_id}
+        totals = count_survey_responses(survey_id, filters)
+        if totals['total'] == 0:
             st.info("لا توجد إجابات مسجلة لهذا الاستبيان في محافظتك")
             return
         
-        # عرض الإحصائيات
-        total = len(responses)
-        completed = sum(1 for r in responses if r[4])
-        
         col1, col2, col3 = st.columns(3)
-        col1.metric("إجمالي الإجابات", total)
-        col2.metric("الإجابات المكتملة", completed)
-        col3.metric("نسبة الإكمال", f"{round((completed/total)*100)}%")
-        
-        # اختيار إجابة محددة مع مفتاح فريد
-        selected_response = st.selectbox(
-            "اختر إجابة لتعديلها",
-            options=responses,
-            format_func=lambda x: f"إجابة #{x[0]} - {x[1]} - {x[2]} - {x[3]}",
-            key=f"select_response_{survey_id}_{governorate_id}_{datetime.now().timestamp()}"
+        col1.metric("إجمالي الإجابات", totals['total'])
+        col2.metric("الإجابات المكتملة", totals['completed'])
+        col3.metric("نسبة الإكمال", f"{round((totals['completed'] / totals['total']) * 100)}%")
+
+        # تصدير إجابات المحافظة فقط (CSV متدفق أو Excel)
+        display_export_panel(
+            survey_id,
+            survey[0],
+            filters={'governorate_id': governorate_id},
+            key_prefix=f"gov_export_{governorate_id}",
+            formats=['csv', 'xlsx']
         )
+
+        # التقارير المُعدة ليلاً لهذا الاستبيان ومصفوفة إكمال المحافظة
+        with st.expander("📁 التقارير الجاهزة (تُحدَّث ليلاً)"):
+            display_report_downloads(
+                [a for a in get_report_artifacts(governorate_id) if a['survey_id'] in (None, survey_id)],
+                {survey_id: survey[0]},
+                key_prefix=f"gov_reports_{governorate_id}"
+            )
         
-        if selected_response:
-            response_id = selected_response[0]
-            display_editable_response(response_id, survey_id, governorate_id)
+        # جدول تعديل الإجابات: صف لكل إجابة وعمود لكل حقل، والحفظ دفعة واحدة
+        display_responses_editor(survey_id, filters, key=f"gov_responses_{governorate_id}_{survey_id}")
     
     except sqlite3.Error as e:
         st.error(f"حدث خطأ في قاعدة البيانات: {str(e)}")
     finally:
         conn.close()
 
-def display_editable_response(response_id: int, survey_id: int, governorate_id: int):
+def manage_governorate_employees(governorate_id: int, governorate_name: str, page_size: int = 50):
     """
-    عرض وتعديل إجابة محددة مع حل مشاكل الأزرار بشكل نهائي
+    إدارة موظفي المحافظة (صفحة واحدة من استعلام مجمع مع البحث والتصفية)
     """
-    # الحصول على معلومات الإجابة
-    response_info = get_response_info(response_id)
-    if not response_info:
-        st.error("لم يتم العثور على معلومات الإجابة")
-        return
-    
-    # إنشاء كائن حالة الجلسة إذا لم يكن موجوداً
-    if f"response_{response_id}_edits" not in st.session_state:
-        st.session_state[f"response_{response_id}_edits"] = {}
-    
-    # عرض معلومات الإجابة
-    with st.container():
-        st.markdown(f"""
-        ### معلومات الإجابة:
-        - **المستخدم:** {response_info[2]}
-        - **الإدارة الصحية:** {response_info[3]}
-        - **المحافظة:** {response_info[4]}
-        - **تاريخ التقديم:** {response_info[5]}
-        """)
-        
-        # زر العودة مع مفتاح فريد
-        if st.button("← العودة إلى القائمة", 
-                    key=f"back_{response_id}_{datetime.now().timestamp()}"):
-            if 'viewing_survey' in st.session_state:
-                del st.session_state.viewing_survey
-            st.rerun()
-
-    # الحصول على تفاصيل الإجابة
-    details = get_response_details(response_id)
-    if not details:
-        st.warning("لا توجد تفاصيل مسجلة لهذه الإجابة")
-        return
-    
-    # عرض حقول التعديل
-    for detail in details:
-        detail_id, field_id, label, field_type, options, answer = detail
-        
-        # استخدام مفتاح فريد لكل حقل يتضمن معرف الاستبيان وطابع زمني
-        field_key = f"field_{survey_id}_{response_id}_{detail_id}_{datetime.now().timestamp()}"
-        
-        st.markdown(f"#### {label}")
-        
-        if field_type == 'text':
-            new_value = st.text_input(
-                label,
-                value=answer,
-                key=field_key
-            )
-        elif field_type == 'number':
-            new_value = st.number_input(
-                label,
-                value=float(answer) if answer and answer.replace('.', '').isdigit() else 0,
-                key=field_key
-            )
-        elif field_type == 'dropdown':
-            options_list = json.loads(options) if options else []
-            new_value = st.selectbox(
-                label,
-                options=options_list,
-                index=options_list.index(answer) if answer in options_list else 0,
-                key=field_key
-            )
-        elif field_type == 'checkbox':
-            new_value = st.checkbox(
-                label,
-                value=bool(answer),
-                key=field_key
-            )
-        elif field_type == 'date':
-            new_value = st.date_input(
-                label,
-                value=datetime.strptime(answer, "%Y-%m-%d").date() if answer else datetime.now(),
-                key=field_key
-            )
-        else:
-            new_value = answer
-        
-        # حفظ التعديلات في حالة الجلسة
-        if new_value != answer:
-            st.session_state[f"response_{response_id}_edits"][detail_id] = str(new_value)
-        elif detail_id in st.session_state[f"response_{response_id}_edits"]:
-            del st.session_state[f"response_{response_id}_edits"][detail_id]
-
-    # أزرار التحكم
-    col1, col2 = st.columns(2)
+    st.header(f"إدارة موظفي محافظة {governorate_name}")
     
+    health_admins = get_health_admins_by_governorate(governorate_id)
+    col1, col2 = st.columns([2, 2])
     with col1:
-        # زر الحفظ مع مفتاح فريد
-        if st.button("💾 حفظ التعديلات", 
-                    key=f"save_{response_id}_{datetime.now().timestamp()}"):
-            if st.session_state[f"response_{response_id}_edits"]:
-                success_count = 0
-                for detail_id, new_value in st.session_state[f"response_{response_id}_edits"].items():
-                    if update_response_detail(detail_id, new_value):
-                        success_count += 1
-                
-                if success_count > 0:
-                    st.success(f"تم تحديث {success_count} حقول بنجاح")
-                    # تحديث الصفحة بعد الحفظ
-                    st.rerun()
-                else:
-                    st.error("حدث خطأ أثناء حفظ التعديلات")
-            else:
-                st.info("لم تقم بإجراء أي تعديلات")
-    
+        search = st.text_input("🔍 بحث باسم المستخدم", key="employees_search").strip()
     with col2:
-        # زر الإلغاء مع مفتاح فريد
-        if st.button("❌ إلغاء التعديلات", 
-                    key=f"cancel_{response_id}_{datetime.now().timestamp()}"):
-            # مسح التعديلات من حالة الجلسة
-            st.session_state[f"response_{response_id}_edits"] = {}
-            st.info("تم إلغاء جميع التعديلات")
-            st.rerun()
+        admin_id = st.selectbox(
+            "الإدارة الصحية",
+            [None] + [a[0] for a in health_admins],
+            format_func=lambda x: "الكل" if x is None else next(a[1] for a in health_admins if a[0] == x),
+            key="employees_admin_filter"
+        )
 
-def manage_governorate_employees(governorate_id: int, governorate_name: str):
-    """
-    إدارة موظفي المحافظة
-    """
-    st.header(f"إدارة موظفي محافظة {governorate_name}")
-    
-    employees = get_governorate_employees(governorate_id)
-    
+    # أي تغيير في التصفية يعيد القائمة إلى الصفحة الأولى
+    signature = (search, admin_id)
+    if st.session_state.get("employees_grid_signature") != signature:
+        st.session_state.employees_grid_signature = signature
+        st.session_state.employees_grid_page = 1
+    page = st.session_state.employees_grid_page
+
+    employees, total = get_governorate_employees_page(governorate_id, search, admin_id, page, page_size)
     if not employees:
-        st.info("لا يوجد موظفون مسجلون لهذه المحافظة")
+        st.info("لا يوجد موظفون مسجلون لهذه المحافظة" if not (search or admin_id) else "لا يوجد موظفون مطابقون")
         return
     
     # عرض الموظفين
-    for emp in employees:
-        user_id, username, admin_name = emp
-        
-        with st.expander(f"{username} - {admin_name}"):
-            col1, col2 = st.columns([4, 1])
-            
-            with col1:
-                st.markdown(f"""
-                **اسم المستخدم:** {username}  
-                **الإدارة الصحية:** {admin_name}
-                """)
-            
-            with col2:
-                if st.button("تعديل", key=f"edit_btn_{user_id}"):
-                    st.session_state.editing_employee = user_id
-    # معالجة تعديل الموظف
+    df = pd.DataFrame([(
+        emp['user_id'],
+        emp['username'],
+        emp['admin_name'],
+        "، ".join(name for _, name in emp['surveys']) or "لا يوجد",
+        emp['last_login'] or "لم يسجل الدخول",
+        emp['today_count'],
+    ) for emp in employees], columns=["ID", "اسم المستخدم", "الإدارة الصحية", "الاستبيانات المسموح بها",
+                                      "آخر دخول", "إجابات اليوم"])
+    selected_id = display_selectable_table(df, key=f"employees_grid_editor_{page}_{hash(signature)}")
+    display_pager("employees_grid", page, max((total + page_size - 1) // page_size, 1), total)
+
+    if selected_id is not None and st.button("تعديل", key="edit_selected_employee"):
+        st.session_state.editing_employee = selected_id
+
+    # معالجة تعديل الموظف (بيانات الموظف من صف القائمة دون استعلامات إضافية)
     if 'editing_employee' in st.session_state:
-        edit_employee(st.session_state.editing_employee, governorate_id)
+        employee = next((emp for emp in employees if emp['user_id'] == st.session_state.editing_employee), None)
+        if employee:
+            edit_employee(employee, governorate_id, health_admins)
 
-def edit_employee(user_id: int, governorate_id: int):
+def edit_employee(employee: dict, governorate_id: int, health_admins: List[Tuple[int, str]]):
     """
     تعديل بيانات الموظف
     """
     st.subheader("تعديل بيانات الموظف")
+    user_id = employee['user_id']
     
-    conn = sqlite3.connect(DATABASE_PATH)
-    try:
-        # الحصول على بيانات الموظف
-        employee = conn.execute('''
-            SELECT u.username, u.assigned_region, ha.admin_name
-            FROM Users u
-            JOIN HealthAdministrations ha ON u.assigned_region = ha.admin_id
-            WHERE u.user_id = ?
-        ''', (user_id,)).fetchone()
-        
-        if not employee:
-            st.error("الموظف غير موجود")
-            del st.session_state.editing_employee
-            return
-        
-        # الحصول على الإدارات الصحية للمحافظة فقط
-        health_admins = conn.execute('''
-            SELECT admin_id, admin_name FROM HealthAdministrations
-            WHERE governorate_id = ?
-            ORDER BY admin_name
-        ''', (governorate_id,)).fetchall()
+    # الاستبيانات المتاحة للمحافظة فقط
+    surveys = get_governorate_surveys(governorate_id)
+    survey_ids = [s[0] for s in surveys]
+    valid_allowed_survey_ids = [sid for sid, _ in employee['surveys'] if sid in survey_ids]
+    admin_ids = [a[0] for a in health_admins]
+    
+    # نموذج التعديل
+    with st.form(f"edit_employee_{user_id}"):
+        st.text_input("اسم المستخدم", value=employee['username'], disabled=True)
         
-        # الحصول على الاستبيانات المتاحة للمحافظة فقط
-        surveys = get_governorate_surveys(governorate_id)
+        selected_admin = st.selectbox(
+            "الإدارة الصحية",
+            options=admin_ids,
+            index=admin_ids.index(employee['admin_id']) if employee['admin_id'] in admin_ids else 0,
+            format_func=lambda x: next(a[1] for a in health_admins if a[0] == x)
+        )
         
-        # الحصول على الاستبيانات المسموح بها للموظف
-        allowed_surveys = get_user_allowed_surveys(user_id)
-        allowed_survey_ids = [s[0] for s in allowed_surveys]
+        if surveys:
+            selected_surveys = st.multiselect(
+                "الاستبيانات المسموح بها",
+                options=survey_ids,
+                default=valid_allowed_survey_ids,
+                format_func=lambda x: next(s[1] for s in surveys if s[0] == x)
+            )
+        else:
+            st.info("لا توجد استبيانات متاحة لهذه المحافظة")
+            selected_surveys = []
         
-        # تصفية allowed_survey_ids لضمان وجودها في surveys
-        survey_ids = [s[0] for s in surveys]
-        valid_allowed_survey_ids = [sid for sid in allowed_survey_ids if sid in survey_ids]
+        # أزرار الحفظ والإلغاء
+        col1, col2 = st.columns(2)
+        with col1:
+            submit_btn = st.form_submit_button("💾 حفظ التعديلات")
+        with col2:
+            cancel_btn = st.form_submit_button("❌ إلغاء")
         
-        # نموذج التعديل
-        with st.form(f"edit_employee_{user_id}"):
-            st.text_input("اسم المستخدم", value=employee[0], disabled=True)
-            
-            selected_admin = st.selectbox(
-                "الإدارة الصحية",
-                options=[a[0] for a in health_admins],
-                index=[a[0] for a in health_admins].index(employee[1]) if health_admins else 0,
-                format_func=lambda x: next(a[1] for a in health_admins if a[0] == x)
-            )
-            
-            if surveys:
-                selected_surveys = st.multiselect(
-                    "الاستبيانات المسموح بها",
-                    options=[s[0] for s in surveys],
-                    default=valid_allowed_survey_ids,
-                    format_func=lambda x: next(s[1] for s in surveys if s[0] == x)
-                )
-            else:
-                st.info("لا توجد استبيانات متاحة لهذه المحافظة")
-                selected_surveys = []
-            
-            # أزرار الحفظ والإلغاء
-            col1, col2 = st.columns(2)
-            with col1:
-                submit_btn = st.form_submit_button("💾 حفظ التعديلات")
-            with col2:
-                cancel_btn = st.form_submit_button("❌ إلغاء")
-            
-            if submit_btn:
-                # تحديث بيانات الموظف
-                update_user(user_id, employee[0], 'employee', selected_admin)
-                
-                # تحديث الاستبيانات المسموح بها
-                if update_user_allowed_surveys(user_id, selected_surveys):
-                    st.success("تم تحديث بيانات الموظف بنجاح")
-                    del st.session_state.editing_employee
-                    st.rerun()
+        if submit_btn:
+            # تحديث بيانات الموظف
+            update_user(user_id, employee['username'], 'employee', st.session_state.user_id, selected_admin)
             
-            if cancel_btn:
+            # تحديث الاستبيانات المسموح بها
+            if update_user_allowed_surveys(user_id, selected_surveys, st.session_state.user_id):
+                st.success("تم تحديث بيانات الموظف بنجاح")
                 del st.session_state.editing_employee
                 st.rerun()
-    
-    except sqlite3.Error as e:
-        st.error(f"حدث خطأ في قاعدة البيانات: {str(e)}")
-    finally:
-        conn.close()
+        
+        if cancel_btn:
+            del st.session_state.editing_employee
+            st.rerun()
         
         
 
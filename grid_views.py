@@ -0,0 +1,227 @@
+import json
+import streamlit as st
+from typing import Dict, List, Optional
+from database import (GRID_SOURCES, get_grid_page, get_survey_fields, get_responses_page,
+                      get_responses_answers, apply_response_edits_batch, normalize_answer, draft_value)
+from lazy_imports import LazyModule
+
+pd = LazyModule("pandas")
+
+SELECT_COLUMN = "اختيار"
+
+def display_data_grid(source: str, key: str, page_size_options=(25, 50, 100)) -> Optional[int]:
+    """
+    جدول إدارة بعدد ثابت من العناصر مهما زاد عدد السجلات: بحث وترتيب وترقيم في SQL
+    وجدول واحد للصفحة الحالية. يرجع معرف الصف المحدد (عمود الاختيار) أو None.
+    """
+    labels = [label for label, _ in GRID_SOURCES[source]['columns']]
+
+    col1, col2, col3, col4 = st.columns([3, 2, 1, 1])
+    with col1:
+        search = st.text_input("🔍 بحث", key=f"{key}_search").strip()
+    with col2:
+        sort_by = st.selectbox("ترتيب حسب", labels, key=f"{key}_sort")
+    with col3:
+        descending = st.checkbox("تنازلي", key=f"{key}_desc")
+    with col4:
+        page_size = st.selectbox("حجم الصفحة", page_size_options, key=f"{key}_page_size")
+
+    # أي تغيير في البحث أو الترتيب يعيد الجدول إلى الصفحة الأولى
+    signature = (search, sort_by, descending, page_size)
+    if st.session_state.get(f"{key}_signature") != signature:
+        st.session_state[f"{key}_signature"] = signature
+        st.session_state[f"{key}_page"] = 1
+
+    page = st.session_state[f"{key}_page"]
+    rows, total = get_grid_page(source, search, sort_by, descending, page, page_size)
+    pages = max((total + page_size - 1) // page_size, 1)
+    if page > pages:  # بعد حذف آخر سجل في الصفحة الأخيرة
+        st.session_state[f"{key}_page"] = page = pages
+        rows, total = get_grid_page(source, search, sort_by, descending, page, page_size)
+
+    if not rows:
+        st.info("لا توجد سجلات مطابقة")
+        return None
+
+    selected = display_selectable_table(pd.DataFrame(rows, columns=labels),
+                                        key=f"{key}_editor_{page}_{hash(signature)}")
+    display_pager(key, page, pages, total)
+    return selected
+
+def display_selectable_table(df, key: str) -> Optional[int]:
+    """
+    جدول للقراءة فقط مع عمود اختيار، ويرجع قيمة العمود الأول (المعرف) للصف المحدد أو None.
+    المفتاح يجب أن يتغير مع الصفحة حتى لا ينتقل التحديد إلى صفحة أخرى.
+    """
+    id_column = df.columns[0]
+    labels = list(df.columns)
+    df = df.copy()
+    df.insert(0, SELECT_COLUMN, False)
+    edited = st.data_editor(
+        df,
+        hide_index=True,
+        use_container_width=True,
+        disabled=labels,
+        column_config={SELECT_COLUMN: st.column_config.CheckboxColumn(SELECT_COLUMN, width="small")},
+        key=key,
+    )
+    selected = edited.loc[edited[SELECT_COLUMN], id_column]
+    return int(selected.iloc[0]) if len(selected) else None
+
+def display_pager(key: str, page: int, pages: int, total: int):
+    """أزرار الصفحة السابقة والتالية، ورقم الصفحة محفوظ في الجلسة تحت {key}_page"""
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        if st.button("→ السابق", key=f"{key}_prev", disabled=page <= 1):
+            st.session_state[f"{key}_page"] = page - 1
+            st.rerun()
+    with col2:
+        st.caption(f"الصفحة {page} من {pages} - عدد السجلات: {total}")
+    with col3:
+        if st.button("التالي ←", key=f"{key}_next", disabled=page >= pages):
+            st.session_state[f"{key}_page"] = page + 1
+            st.rerun()
+
+def display_grid_actions(selected_id: Optional[int], key: str) -> Optional[str]:
+    """أزرار تعديل وحذف السجل المحدد، وترجع 'edit' أو 'delete' عند الضغط"""
+    if selected_id is None:
+        st.caption("حدد صفاً من الجدول لتعديله أو حذفه")
+        return None
+    col1, col2, _ = st.columns([1, 1, 4])
+    with col1:
+        if st.button("تعديل", key=f"{key}_edit"):
+            return 'edit'
+    with col2:
+        if st.button("حذف", key=f"{key}_delete"):
+            return 'delete'
+    return None
+
+RESPONSE_INFO_COLUMNS = ["ID", "المستخدم", "الإدارة الصحية", "تاريخ التقديم", "الحالة"]
+
+def field_column_config(field_type: str, label: str, options: Optional[str]):
+    """نوع عمود الجدول المناسب لنوع الحقل (يمنع إدخال قيم من نوع آخر في الواجهة)"""
+    if field_type == 'number':
+        return st.column_config.NumberColumn(label)
+    if field_type == 'checkbox':
+        return st.column_config.CheckboxColumn(label)
+    if field_type == 'date':
+        return st.column_config.DateColumn(label, format="YYYY-MM-DD")
+    if field_type == 'dropdown':
+        return st.column_config.SelectboxColumn(label, options=json.loads(options) if options else [])
+    return st.column_config.TextColumn(label)
+
+def collect_grid_edits(edited_rows: Dict, response_ids: List[int], field_columns: Dict[str, tuple],
+                       stored: Dict[int, Dict]) -> tuple:
+    """
+    تحويل تعديلات خلايا الجدول (edited_rows) إلى فروق {response_id: {field_id: القيمة}}
+    بعد التحقق من نوع كل حقل، مع تجاهل الخلايا التي عادت إلى قيمتها المحفوظة.
+    يرجع (الفروق، رسائل الأخطاء).
+    """
+    edits, errors = {}, []
+    for row_index, cells in edited_rows.items():
+        response_id = response_ids[int(row_index)]
+        answers = stored.get(response_id, {}).get('answers', {})
+        for column, value in cells.items():
+            if column not in field_columns:
+                continue
+            field_id, label, field_type, options = field_columns[column]
+            text, error = normalize_answer(field_type, options, value)
+            if error:
+                errors.append(f"إجابة #{response_id} - {label}: {error}")
+            elif text != answers.get(field_id):
+                edits.setdefault(response_id, {})[field_id] = text
+    return edits, errors
+
+def display_responses_editor(survey_id: int, filters: Dict, key: str, page_size_options=(25, 50, 100)):
+    """
+    جدول تعديل لإجابات الاستبيان: صف لكل إجابة وعمود لكل حقل، بترقيم بالمفتاح ومفاتيح ثابتة
+    حتى لا تضيع التعديلات مع إعادة التنفيذ. تُجمع تعديلات الخلايا كفروق وتُتحقق من نوع كل
+    حقل ثم تُحفظ دفعة واحدة في معاملة واحدة.
+    """
+    fields = get_survey_fields(survey_id)
+    if not fields:
+        st.info("لا توجد حقول لهذا الاستبيان")
+        return
+
+    page_size = st.selectbox("عدد الصفوف في الصفحة", page_size_options, key=f"{key}_page_size")
+    signature = json.dumps([filters, page_size], sort_keys=True, default=str)
+    if st.session_state.get(f"{key}_signature") != signature:
+        st.session_state[f"{key}_signature"] = signature
+        st.session_state[f"{key}_cursors"] = [None]
+    st.session_state.setdefault(f"{key}_revision", 0)
+    cursors = st.session_state[f"{key}_cursors"]
+
+    rows = get_responses_page(survey_id, filters, after=cursors[-1], page_size=page_size + 1)
+    has_next = len(rows) > page_size
+    rows = rows[:page_size]
+    if not rows:
+        st.info("لا توجد إجابات مطابقة")
+        return
+
+    # اسم العمود هو عنوان الحقل (مع رقمه إذا تكرر العنوان في نفس الاستبيان)
+    labels = [field[1] for field in fields]
+    field_columns = {
+        (label if labels.count(label) == 1 else f"{label} #{field_id}"): (field_id, label, field_type, options)
+        for field_id, label, field_type, options, *_ in fields
+    }
+    response_ids = [r[0] for r in rows]
+    stored = get_responses_answers(response_ids)
+    df = pd.DataFrame(
+        [[r[0], r[1], r[2], r[4], "مكتملة" if r[5] else "مسودة"]
+         + [draft_value(field_type, stored.get(r[0], {}).get('answers', {}).get(field_id))
+            for field_id, _, field_type, _ in field_columns.values()]
+         for r in rows],
+        columns=RESPONSE_INFO_COLUMNS + list(field_columns)
+    )
+
+    editor_key = f"{key}_editor_{len(cursors)}_{st.session_state[f'{key}_revision']}_{hash(signature)}"
+    # الإصدارات عند فتح الصفحة هي أساس التحقق من التعديل المتزامن عند الحفظ
+    if st.session_state.get(f"{key}_versions", (None,))[0] != editor_key:
+        st.session_state[f"{key}_versions"] = (editor_key, {rid: stored[rid]['version'] for rid in stored})
+    versions = st.session_state[f"{key}_versions"][1]
+    st.data_editor(
+        df,
+        hide_index=True,
+        use_container_width=True,
+        num_rows="fixed",
+        disabled=RESPONSE_INFO_COLUMNS,
+        column_config={column: field_column_config(field_type, column, options)
+                       for column, (_, _, field_type, options) in field_columns.items()},
+        key=editor_key,
+    )
+    edits, errors = collect_grid_edits(st.session_state[editor_key]['edited_rows'],
+                                       response_ids, field_columns, stored)
+
+    flash = st.session_state.pop(f"{key}_flash", None)
+    if flash:
+        st.success(flash)
+    for error in errors:
+        st.error(error)
+    if edits:
+        st.caption(f"تعديلات غير محفوظة: {sum(len(c) for c in edits.values())} خلية في {len(edits)} إجابة")
+
+    col1, col2, col3, col4 = st.columns([1, 1, 1, 1])
+    with col1:
+        if st.button("💾 حفظ التعديلات", key=f"{key}_save", disabled=not edits or bool(errors)):
+            saved, error = apply_response_edits_batch(
+                edits, st.session_state.user_id, {rid: versions[rid] for rid in edits if rid in versions})
+            if error:
+                st.error(error)
+            else:
+                st.session_state[f"{key}_flash"] = f"تم حفظ التعديلات في {len(edits)} إجابة"
+                st.session_state[f"{key}_revision"] += 1
+                st.rerun()
+    with col2:
+        if st.button("❌ تجاهل التعديلات", key=f"{key}_discard", disabled=not (edits or errors)):
+            st.session_state[f"{key}_revision"] += 1
+            st.rerun()
+    # التنقل بين الصفحات معطل أثناء وجود تعديلات غير محفوظة حتى لا تضيع
+    with col3:
+        if st.button("→ السابق", key=f"{key}_prev", disabled=len(cursors) == 1 or bool(edits or errors)):
+            cursors.pop()
+            st.rerun()
+    with col4:
+        if st.button("التالي ←", key=f"{key}_next", disabled=not has_next or bool(edits or errors)):
+            cursors.append((rows[-1][4], rows[-1][0]))
+            st.rerun()
+    st.caption(f"الصفحة {len(cursors)}")
@@ -0,0 +1,134 @@
+import csv
+import sqlite3
+from typing import Callable, Dict, Iterator, List, Optional
+from database import DATABASE_PATH, set_audit_user, typed_answer_values, update_content_hashes
+from exports import SURVEY_CSV_BASE_COLUMNS
+
+ProgressCallback = Callable[[int, str], None]
+IMPORT_CHUNK_SIZE = 1000
+USER_ROLES = ('admin', 'governorate_admin', 'employee')
+COMPLETED_VALUES = ('مكتملة', '1', 'true', 'True', 'completed')
+
+def _noop_progress(done: int, message: str):
+    pass
+
+def read_csv_chunks(path: str, chunk_size: int = IMPORT_CHUNK_SIZE) -> Iterator[List[Dict[str, str]]]:
+    """قراءة ملف CSV على دفعات من القواميس (يقبل ملفات Excel ذات BOM)"""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        chunk = []
+        for row in csv.DictReader(f):
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+def import_users_csv(path: str, progress: Optional[ProgressCallback] = None) -> Dict:
+    """
+    استيراد المستخدمين من CSV بالأعمدة: username, password, role, region_id, governorate_id.
+    region_id للموظفين (الإدارة الصحية) و governorate_id لمسؤولي المحافظات.
+    الأسماء الموجودة مسبقاً تُتجاوز ولا تُعدَّل.
+    """
+    from auth import hash_password
+
+    progress = progress or _noop_progress
+    result = {'imported': 0, 'skipped': 0, 'errors': []}
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        existing = {row[0] for row in conn.execute("SELECT username FROM Users")}
+        line = 1
+        for chunk in read_csv_chunks(path):
+            with conn:  # كل دفعة في معاملة واحدة
+                set_audit_user(conn, None)
+                for row in chunk:
+                    line += 1
+                    username = (row.get('username') or '').strip()
+                    role = (row.get('role') or 'employee').strip()
+                    if not username or not row.get('password'):
+                        result['errors'].append(f"سطر {line}: اسم المستخدم وكلمة المرور مطلوبان")
+                        continue
+                    if role not in USER_ROLES:
+                        result['errors'].append(f"سطر {line}: دور غير معروف '{role}'")
+                        continue
+                    if username in existing:
+                        result['skipped'] += 1
+                        continue
+
+                    cursor = conn.execute(
+                        "INSERT INTO Users (username, password_hash, role, assigned_region) VALUES (?, ?, ?, ?)",
+                        (username, hash_password(row['password']), role,
+                         int(row['region_id']) if role == 'employee' and row.get('region_id') else None)
+                    )
+                    if role == 'governorate_admin' and row.get('governorate_id'):
+                        conn.execute(
+                            "INSERT INTO GovernorateAdmins (user_id, governorate_id) VALUES (?, ?)",
+                            (cursor.lastrowid, int(row['governorate_id']))
+                        )
+                    existing.add(username)
+                    result['imported'] += 1
+            progress(line - 1, f"تمت معالجة {line - 1} سطر")
+    finally:
+        conn.close()
+    return result
+
+def import_responses_csv(path: str, survey_id: int, progress: Optional[ProgressCallback] = None) -> Dict:
+    """
+    استيراد إجابات استبيان من CSV بنفس صيغة تصدير CSV (عمود لكل حقل باسم الحقل).
+    يُحدد المستخدم بالاسم والإدارة الصحية بالاسم واسم المحافظة، ويُتجاهل عمود ID.
+    """
+    progress = progress or _noop_progress
+    result = {'imported': 0, 'skipped': 0, 'errors': []}
+    user_col, admin_col, governorate_col, date_col, status_col = SURVEY_CSV_BASE_COLUMNS[1:]
+
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        fields = conn.execute(
+            "SELECT field_id, field_label, field_type FROM Survey_Fields WHERE survey_id = ?",
+            (survey_id,)
+        ).fetchall()
+        if not fields:
+            raise ValueError(f"الاستبيان {survey_id} غير موجود أو ليس له حقول")
+        users = dict(conn.execute("SELECT username, user_id FROM Users"))
+        admins = {(admin_name, governorate_name): admin_id for admin_id, admin_name, governorate_name in conn.execute('''
+            SELECT ha.admin_id, ha.admin_name, g.governorate_name
+            FROM HealthAdministrations ha
+            JOIN Governorates g ON ha.governorate_id = g.governorate_id
+        ''')}
+
+        line = 1
+        for chunk in read_csv_chunks(path):
+            with conn:
+                set_audit_user(conn, None)
+                imported_ids = []
+                for row in chunk:
+                    line += 1
+                    user_id = users.get((row.get(user_col) or '').strip())
+                    admin_id = admins.get(((row.get(admin_col) or '').strip(),
+                                           (row.get(governorate_col) or '').strip()))
+                    if user_id is None or admin_id is None:
+                        result['skipped'] += 1
+                        result['errors'].append(f"سطر {line}: مستخدم أو إدارة صحية غير معروفة")
+                        continue
+
+                    cursor = conn.execute(
+                        '''INSERT INTO Responses (survey_id, user_id, region_id, submission_date, is_completed)
+                           VALUES (?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), ?)''',
+                        (survey_id, user_id, admin_id, row.get(date_col) or None,
+                         (row.get(status_col) or '').strip() in COMPLETED_VALUES)
+                    )
+                    conn.executemany(
+                        '''INSERT INTO Response_Details
+                           (response_id, field_id, answer_value, answer_number, answer_date, answer_bool)
+                           VALUES (?, ?, ?, ?, ?, ?)''',
+                        [(cursor.lastrowid, field_id, row[label])
+                         + typed_answer_values(field_type, row[label])
+                         for field_id, label, field_type in fields if row.get(label) not in (None, '')]
+                    )
+                    imported_ids.append(cursor.lastrowid)
+                    result['imported'] += 1
+                update_content_hashes(conn, imported_ids)
+            progress(line - 1, f"تمت معالجة {line - 1} سطر")
+    finally:
+        conn.close()
+    return result
@@ -0,0 +1,18 @@
+import importlib
+from types import ModuleType
+from typing import Optional
+
+class LazyModule:
+    """
+    وحدة لا تُستورد إلا عند أول استخدام لإحدى خصائصها.
+    تسمح لوحدات قاعدة البيانات بالعمل من سطر الأوامر دون تحميل Streamlit.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module: Optional[ModuleType] = None
+
+    def __getattr__(self, attr: str):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
@@ -0,0 +1,105 @@
+"""
+عدد الاتصالات والاستعلامات التي يكلفها تنفيذ واحد لصفحة كل دور (ما يحدث مع كل نقرة في Streamlit).
+يستخدم أول مستخدم من كل دور في قاعدة البيانات الحالية.
+
+أمثلة:
+    python profile_queries.py                       # القسم الافتراضي لكل لوحة
+    python profile_queries.py --all-sections        # كل قسم من أقسام لوحات المسؤولين
+    python profile_queries.py --show-sql            # طباعة الاستعلامات المنفذة أيضاً
+"""
+import sys
+import sqlite3
+import argparse
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+
+STATEMENT_PREFIXES = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE')
+
+# مفتاح اختيار القسم في الجلسة وأقسام كل لوحة
+DASHBOARD_SECTIONS = {
+    'admin': ("admin_section", ["إدارة المستخدمين", "إدارة المحافظات", "إدارة الإدارات الصحية",
+                                "إدارة الاستبيانات", "عرض البيانات", "تحليل الإجابات"]),
+    'governorate_admin': ("governorate_section", ["📋 إدارة الاستبيانات", "📊 عرض البيانات",
+                                                  "👥 إدارة الموظفين", "📈 تحليل الإجابات"]),
+    'employee': (None, [None]),
+}
+
+class QueryCounter:
+    """يستبدل sqlite3.connect مؤقتاً ليحصي الاتصالات والعبارات المنفذة عبر trace callback"""
+
+    def __init__(self):
+        self.connections = 0
+        self.statements: List[str] = []
+        self._connect = sqlite3.connect
+
+    def __enter__(self):
+        def counting_connect(*args, **kwargs):
+            conn = self._connect(*args, **kwargs)
+            self.connections += 1
+            conn.set_trace_callback(self._record)
+            return conn
+        sqlite3.connect = counting_connect
+        return self
+
+    def __exit__(self, *exc):
+        sqlite3.connect = self._connect
+
+    def _record(self, sql: str):
+        if sql.lstrip().upper().startswith(STATEMENT_PREFIXES):
+            self.statements.append(" ".join(sql.split()))
+
+def first_user(role: str) -> Optional[tuple]:
+    from database import DATABASE_PATH
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        return conn.execute(
+            "SELECT user_id, username, assigned_region FROM Users WHERE role = ? ORDER BY user_id LIMIT 1",
+            (role,)
+        ).fetchone()
+    finally:
+        conn.close()
+
+def measure(role: str, user: tuple, section_key: Optional[str], section: Optional[str]) -> Dict:
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file("app.py", default_timeout=120)
+    state = {'authenticated': True, 'user_id': user[0], 'username': user[1], 'role': role,
+             'region_id': user[2], 'last_activity': datetime.now()}
+    if section_key:
+        state[section_key] = section
+    for key, value in state.items():
+        at.session_state[key] = value
+    with QueryCounter() as counter:
+        at.run()
+    return {'connections': counter.connections, 'statements': counter.statements,
+            'errors': [str(e.message) for e in at.exception]}
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="عدد استعلامات قاعدة البيانات في كل تنفيذ للصفحة")
+    parser.add_argument("--all-sections", action="store_true")
+    parser.add_argument("--show-sql", action="store_true")
+    args = parser.parse_args(argv)
+
+    from database import init_db
+    init_db()  # التهيئة تتم مرة واحدة لكل عملية ولا تدخل في تكلفة التنفيذ
+
+    print(f"{'اللوحة / القسم':<45}{'اتصالات':>10}{'استعلامات':>12}")
+    for role, (section_key, sections) in DASHBOARD_SECTIONS.items():
+        user = first_user(role)
+        if not user:
+            print(f"{role:<45}{'لا يوجد مستخدم بهذا الدور':>22}")
+            continue
+        for section in (sections if args.all_sections else sections[:1]):
+            result = measure(role, user, section_key, section)
+            label = f"{role} / {section}" if section else role
+            print(f"{label:<45}{result['connections']:>10}{len(result['statements']):>12}")
+            for error in result['errors']:
+                print(f"    خطأ: {error}")
+            if args.show_sql:
+                for sql, count in Counter(result['statements']).most_common():
+                    print(f"    {count:>4} × {sql[:110]}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""
+قياس زمن بدء التشغيل: استيراد كل وحدة في عملية جديدة (بارد) وأول عرض لصفحة الدخول،
+ومقارنتها بميزانية ثابتة حتى لا يعود البطء بعد النشر أو التوسع التلقائي.
+
+أمثلة:
+    python profile_startup.py                 # تقرير بالأزمنة وأبطأ الوحدات المستوردة
+    python profile_startup.py --check         # رمز خروج 1 عند تجاوز الميزانية (مناسب لـ CI)
+    python profile_startup.py --check --scale 2   # ميزانية مضاعفة للأجهزة الأبطأ
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from typing import Dict, List, Tuple
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# ميزانية زمن الاستيراد البارد لكل وحدة بالمللي ثانية
+IMPORT_BUDGETS_MS = {
+    'app': 800,
+    'employee_views': 800,
+    'governorate_admin_views': 900,
+    'admin_views': 900,
+    'cli': 300,
+    'api': 400,
+}
+# أول عرض لصفحة الدخول (استيراد + تهيئة قاعدة البيانات + تنفيذ app.py)
+FIRST_RENDER_BUDGET_MS = 2500
+# مكتبات ثقيلة يجب ألا تُحمّل عند الاستيراد، بل عند أول استخدام لها
+HEAVY_MODULES = ('pandas', 'numpy', 'pyarrow', 'openpyxl', 'geocoder')
+
+IMPORT_PROBE = """
+import sys, json, time
+started = time.perf_counter()
+import {module}
+elapsed = (time.perf_counter() - started) * 1000
+print(json.dumps({{'ms': elapsed, 'heavy': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+RENDER_PROBE = """
+import json, time
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("app.py", default_timeout=60)
+at.run()
+elapsed = (time.perf_counter() - started) * 1000
+print(json.dumps({'ms': elapsed, 'errors': [str(e.message) for e in at.exception]}))
+"""
+
+def run_probe(code: str, importtime: bool = False) -> Tuple[dict, str]:
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    result = subprocess.run(command, cwd=BASE_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else "فشل القياس")
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+def slowest_imports(importtime_log: str, module: str, top: int) -> List[Tuple[int, str]]:
+    """
+    أبطأ الوحدات التي تستوردها الوحدة مباشرة حسب الزمن التراكمي من مخرجات python -X importtime
+    (الوحدات الفرعية تُطبع قبل الوحدة التي استوردتها وبإزاحة أكبر)
+    """
+    children = []
+    for line in importtime_log.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 1:
+            children.append((int(cumulative), name.strip()))
+        elif depth == 0:
+            if name.strip() == module:
+                return sorted(children, reverse=True)[:top]
+            children = []
+    return []
+
+def profile_imports(repeat: int) -> Dict[str, dict]:
+    results = {}
+    for module in IMPORT_BUDGETS_MS:
+        timings, heavy, log = [], [], ""
+        for _ in range(repeat):
+            probe, log = run_probe(IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES), importtime=True)
+            timings.append(probe['ms'])
+            heavy = probe['heavy']
+        results[module] = {'ms': statistics.median(timings), 'heavy': heavy,
+                           'slowest': slowest_imports(log, module, 5)}
+    return results
+
+def profile_first_render(repeat: int) -> dict:
+    timings, errors = [], []
+    for _ in range(repeat):
+        probe, _ = run_probe(RENDER_PROBE)
+        timings.append(probe['ms'])
+        errors = probe['errors']
+    return {'ms': statistics.median(timings), 'errors': errors}
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="قياس زمن بدء تشغيل التطبيق ومقارنته بالميزانية")
+    parser.add_argument("--check", action="store_true", help="الخروج برمز 1 عند تجاوز الميزانية")
+    parser.add_argument("--scale", type=float, default=1.0, help="معامل ضرب الميزانية")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-render", action="store_true", help="تخطي قياس أول عرض (يتطلب streamlit)")
+    args = parser.parse_args(argv)
+
+    failures = []
+    print(f"{'الوحدة':<28}{'الزمن (مث)':>12}{'الميزانية':>12}")
+    for module, result in profile_imports(args.repeat).items():
+        budget = IMPORT_BUDGETS_MS[module] * args.scale
+        print(f"{module:<28}{result['ms']:>12.0f}{budget:>12.0f}")
+        for cumulative, name in result['slowest']:
+            print(f"    {name:<36}{cumulative / 1000:>8.0f} مث")
+        if result['ms'] > budget:
+            failures.append(f"استيراد {module} استغرق {result['ms']:.0f} مث (الميزانية {budget:.0f})")
+        if result['heavy']:
+            failures.append(f"استيراد {module} يحمّل مكتبات ثقيلة: {', '.join(result['heavy'])}")
+
+    if not args.skip_render:
+        render = profile_first_render(args.repeat)
+        budget = FIRST_RENDER_BUDGET_MS * args.scale
+        print(f"{'أول عرض لصفحة الدخول':<28}{render['ms']:>12.0f}{budget:>12.0f}")
+        if render['ms'] > budget:
+            failures.append(f"أول عرض استغرق {render['ms']:.0f} مث (الميزانية {budget:.0f})")
+        failures += [f"خطأ أثناء أول عرض: {error}" for error in render['errors']]
+
+    for failure in failures:
+        print(f"تجاوز: {failure}")
+    return 1 if failures and args.check else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+import os
+import sqlite3
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+from lazy_imports import LazyModule
+from database import DATABASE_PATH
+
+pd = LazyModule("pandas")
+
+REPORT_WORKERS = int(os.environ.get("REPORT_WORKERS", str(os.cpu_count() or 1)))
+
+def _read_only_connection(db_path: str) -> sqlite3.Connection:
+    """اتصال للقراءة فقط حتى لا يحجز العامل قفل كتابة على قاعدة البيانات"""
+    return sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+
+def governorate_partial(db_path: str, governorate_id: int, survey_ids: List[int]) -> Dict:
+    """
+    حساب المجاميع الجزئية لمحافظة واحدة (تُنفذ في عملية مستقلة).
+    كل القيم مجاميع قابلة للدمج (أعداد ومجاميع وحدود) وليست متوسطات.
+    """
+    placeholders = ",".join("?" * len(survey_ids))
+    # البدء من إدارات المحافظة (فهرس region_id) بدلاً من مسح جميع إجابات الاستبيان،
+    # و(+) يمنع المخطط من اختيار فهرس survey_id الأقل انتقائية هنا
+    regions = "SELECT admin_id FROM HealthAdministrations WHERE governorate_id = ?"
+    conn = _read_only_connection(db_path)
+    try:
+        responses = conn.execute(f'''
+            SELECT r.survey_id, SUM(r.response_count),
+                   SUM(CASE WHEN r.is_completed THEN r.response_count ELSE 0 END)
+            FROM DailyResponseRollups r
+            JOIN HealthAdministrations ha ON r.region_id = ha.admin_id
+            WHERE ha.governorate_id = ? AND r.survey_id IN ({placeholders})
+            GROUP BY r.survey_id
+        ''', [governorate_id] + survey_ids).fetchall()
+
+        choices = conn.execute(f'''
+            SELECT r.survey_id, sf.field_label,
+                   CASE WHEN sf.field_type = 'checkbox'
+                        THEN CASE rd.answer_bool WHEN 1 THEN 'نعم' ELSE 'لا' END
+                        ELSE rd.answer_value END AS answer,
+                   COUNT(*)
+            FROM Response_Details rd
+            JOIN Responses r ON rd.response_id = r.response_id
+            JOIN Survey_Fields sf ON rd.field_id = sf.field_id
+            WHERE r.region_id IN ({regions}) AND +r.survey_id IN ({placeholders})
+              AND (sf.field_type = 'dropdown' AND rd.answer_value != ''
+                   OR sf.field_type = 'checkbox' AND rd.answer_bool IS NOT NULL)
+            GROUP BY r.survey_id, sf.field_label, answer
+        ''', [governorate_id] + survey_ids).fetchall()
+
+        numbers = conn.execute(f'''
+            SELECT r.survey_id, sf.field_label, COUNT(rd.answer_number), SUM(rd.answer_number),
+                   MIN(rd.answer_number), MAX(rd.answer_number)
+            FROM Response_Details rd
+            JOIN Responses r ON rd.response_id = r.response_id
+            JOIN Survey_Fields sf ON rd.field_id = sf.field_id
+            WHERE r.region_id IN ({regions}) AND +r.survey_id IN ({placeholders})
+              AND sf.field_type = 'number' AND rd.answer_number IS NOT NULL
+            GROUP BY r.survey_id, sf.field_label
+        ''', [governorate_id] + survey_ids).fetchall()
+    finally:
+        conn.close()
+
+    return {
+        'governorate_id': governorate_id,
+        'responses': responses,
+        'choices': choices,
+        'numbers': numbers,
+    }
+
+def merge_partials(partials: List[Dict], governorates: Dict[int, str], surveys: Dict[int, str]) -> Dict:
+    """دمج نتائج المحافظات في جداول مقارنة (صف لكل محافظة)"""
+    def frame(key: str, columns: List[str]) -> pd.DataFrame:
+        rows = [(governorates[p['governorate_id']],) + tuple(row) for p in partials for row in p[key]]
+        df = pd.DataFrame(rows, columns=["المحافظة"] + columns)
+        df["الاستبيان"] = df["survey_id"].map(surveys)
+        return df
+
+    responses = frame('responses', ["survey_id", "total", "completed"])
+    responses["نسبة الإكمال %"] = (responses["completed"] / responses["total"] * 100).round(1)
+    summary = (responses.rename(columns={"total": "الإجابات"})
+               .pivot(index="المحافظة", columns="الاستبيان", values=["الإجابات", "نسبة الإكمال %"])
+               .reindex(sorted(governorates.values())))
+
+    choices = frame('choices', ["survey_id", "field_label", "answer", "count"])
+    distributions = {}
+    for (survey_name, label), group in choices.groupby(["الاستبيان", "field_label"]):
+        counts = group.pivot_table(index="المحافظة", columns="answer", values="count",
+                                   aggfunc="sum", fill_value=0)
+        distributions[(survey_name, label)] = (counts.div(counts.sum(axis=1), axis=0) * 100).round(1)
+
+    numbers = frame('numbers', ["survey_id", "field_label", "count", "sum", "min", "max"])
+    numbers["المتوسط"] = (numbers["sum"] / numbers["count"]).round(2)
+    numeric = numbers.pivot_table(index="المحافظة", columns=["الاستبيان", "field_label"],
+                                  values="المتوسط")
+
+    return {'summary': summary, 'distributions': distributions, 'numeric': numeric}
+
+def build_comparison_report(survey_ids: List[int], workers: Optional[int] = None,
+                            db_path: str = DATABASE_PATH) -> Dict:
+    """
+    تقرير مقارنة جميع المحافظات عبر عدة استبيانات.
+    يُوزع العمل محافظة لكل مهمة على مجمع عمليات، ثم تُدمج النتائج الجزئية.
+    """
+    conn = _read_only_connection(db_path)
+    try:
+        governorates = dict(conn.execute("SELECT governorate_id, governorate_name FROM Governorates"))
+        placeholders = ",".join("?" * len(survey_ids))
+        surveys = dict(conn.execute(
+            f"SELECT survey_id, survey_name FROM Surveys WHERE survey_id IN ({placeholders})",
+            survey_ids
+        ))
+    finally:
+        conn.close()
+
+    workers = max(1, min(workers or REPORT_WORKERS, len(governorates)))
+    if workers == 1:
+        partials = [governorate_partial(db_path, gov_id, survey_ids) for gov_id in governorates]
+    else:
+        # spawn بدلاً من fork لأن العملية الأم تحمل خيوطاً (خادم Streamlit ومجمع التصدير)
+        with ProcessPoolExecutor(max_workers=workers,
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            partials = list(pool.map(
+                governorate_partial,
+                [db_path] * len(governorates), list(governorates), [survey_ids] * len(governorates)
+            ))
+    return merge_partials(partials, governorates, surveys)
@@ -0,0 +1,231 @@
+import os
+import time
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+from lazy_imports import LazyModule
+from database import (
+    DATABASE_DIR,
+    DATABASE_PATH,
+    get_survey_data_watermark,
+    get_latest_report_artifact,
+    add_report_artifact,
+    prune_report_artifacts
+)
+from exports import build_survey_workbook
+from analytics import compute_survey_analytics
+
+pd = LazyModule("pandas")
+
+REPORTS_DIR = DATABASE_DIR / "reports"
+REPORT_KEEP_VERSIONS = int(os.environ.get("REPORT_KEEP_VERSIONS", "7"))
+# وقت التشغيل الليلي الافتراضي للخدمة (HH:MM بالتوقيت المحلي)
+REPORT_SCHEDULE_AT = os.environ.get("REPORT_SCHEDULE_AT", "02:00")
+
+# الرسالة بعد كل تقرير: (عدد المنجز، الإجمالي، رسالة)
+ReportProgress = Callable[[int, int, str], None]
+
+REPORT_TYPES = {
+    'governorate_workbook': "ملف Excel لإجابات المحافظة",
+    'completion_matrix': "مصفوفة نسب الإكمال",
+    'analytics_summary': "ملخص تحليل الإجابات",
+}
+
+def _noop_progress(done: int, total: int, message: str):
+    pass
+
+def planned_reports() -> List[Tuple[str, Optional[int], Optional[int]]]:
+    """
+    قائمة التقارير المطلوبة: (نوع التقرير، الاستبيان، المحافظة).
+    لكل استبيان مفعل ومحافظة مرتبطة به ملف إجابات وملخص تحليل،
+    ومصفوفة إكمال لكل محافظة وأخرى على مستوى الجمهورية.
+    """
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        assignments = conn.execute('''
+            SELECT sg.survey_id, sg.governorate_id
+            FROM SurveyGovernorate sg
+            JOIN Surveys s ON sg.survey_id = s.survey_id
+            WHERE s.is_active = 1
+            ORDER BY sg.governorate_id, sg.survey_id
+        ''').fetchall()
+        active_surveys = [row[0] for row in conn.execute(
+            "SELECT survey_id FROM Surveys WHERE is_active = 1 ORDER BY survey_id"
+        )]
+    finally:
+        conn.close()
+
+    plan = []
+    for survey_id, governorate_id in assignments:
+        plan.append(('governorate_workbook', survey_id, governorate_id))
+        plan.append(('analytics_summary', survey_id, governorate_id))
+    for survey_id in active_surveys:
+        plan.append(('analytics_summary', survey_id, None))
+    for governorate_id in sorted({governorate_id for _, governorate_id in assignments}):
+        plan.append(('completion_matrix', None, governorate_id))
+    plan.append(('completion_matrix', None, None))
+    return plan
+
+def report_data_version(survey_ids: List[int]) -> str:
+    """بصمة بيانات التقرير من إصدارات بيانات الاستبيانات الداخلة فيه"""
+    return ",".join(f"{survey_id}:{get_survey_data_watermark(survey_id)}" for survey_id in sorted(survey_ids))
+
+def matrix_survey_ids(governorate_id: Optional[int]) -> List[int]:
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        if governorate_id is None:
+            return [row[0] for row in conn.execute("SELECT survey_id FROM Surveys WHERE is_active = 1")]
+        return [row[0] for row in conn.execute('''
+            SELECT sg.survey_id FROM SurveyGovernorate sg
+            JOIN Surveys s ON sg.survey_id = s.survey_id
+            WHERE sg.governorate_id = ? AND s.is_active = 1
+        ''', (governorate_id,))]
+    finally:
+        conn.close()
+
+def build_completion_matrix(governorate_id: Optional[int], survey_ids: List[int], path: str) -> str:
+    """
+    مصفوفة الإكمال من جدول التجميع اليومي: صف لكل إدارة صحية في المحافظة
+    (أو لكل محافظة على مستوى الجمهورية) وعمود لكل استبيان
+    """
+    if not survey_ids:
+        pd.DataFrame().to_excel(path, sheet_name='نسب_الإكمال')
+        return path
+
+    group_expr, group_label = (("g.governorate_name", "المحافظة") if governorate_id is None
+                               else ("ha.admin_name", "الإدارة الصحية"))
+    placeholders = ",".join("?" * len(survey_ids))
+    params = list(survey_ids) + ([governorate_id] if governorate_id is not None else [])
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        df = pd.read_sql_query(f'''
+            SELECT {group_expr} AS "{group_label}", s.survey_name AS "الاستبيان",
+                   SUM(r.response_count) AS total,
+                   SUM(CASE WHEN r.is_completed THEN r.response_count ELSE 0 END) AS completed
+            FROM DailyResponseRollups r
+            JOIN Surveys s ON r.survey_id = s.survey_id
+            JOIN HealthAdministrations ha ON r.region_id = ha.admin_id
+            JOIN Governorates g ON ha.governorate_id = g.governorate_id
+            WHERE r.survey_id IN ({placeholders}){" AND ha.governorate_id = ?" if governorate_id is not None else ""}
+            GROUP BY 1, 2
+        ''', conn, params=params)
+    finally:
+        conn.close()
+
+    df["نسبة الإكمال %"] = (df["completed"] / df["total"] * 100).round(1)
+    with pd.ExcelWriter(path, engine='openpyxl') as writer:
+        df.pivot(index=group_label, columns="الاستبيان", values="نسبة الإكمال %").to_excel(
+            writer, sheet_name='نسب_الإكمال')
+        df.pivot(index=group_label, columns="الاستبيان", values="completed").to_excel(
+            writer, sheet_name='الإجابات_المكتملة')
+        df.pivot(index=group_label, columns="الاستبيان", values="total").to_excel(
+            writer, sheet_name='إجمالي_الإجابات')
+    return path
+
+def _sheet_name(prefix: str, label: str, used: set) -> str:
+    """أسماء أوراق Excel محدودة بـ 31 حرفاً ويجب ألا تتكرر"""
+    base = f"{prefix}_{label}"[:28]
+    name, counter = base, 1
+    while name in used:
+        counter += 1
+        name = f"{base[:26]}_{counter}"
+    used.add(name)
+    return name
+
+def build_analytics_summary(survey_id: int, governorate_id: Optional[int], path: str) -> str:
+    """ملف Excel بنتائج تحليل الإجابات (ورقة لكل حقل)"""
+    if governorate_id is None:
+        analytics = compute_survey_analytics(survey_id, None, 'governorate')
+    else:
+        analytics = compute_survey_analytics(survey_id, {'governorate_id': governorate_id}, 'admin')
+
+    used = set()
+    with pd.ExcelWriter(path, engine='openpyxl') as writer:
+        pd.DataFrame({"عدد الإجابات المحللة": [analytics['responses']]}).to_excel(
+            writer, sheet_name=_sheet_name("ملخص", "", used), index=False)
+        for label, table in analytics['frequencies'].items():
+            table.to_excel(writer, sheet_name=_sheet_name("تكرار", label, used))
+        for label, result in analytics['numeric'].items():
+            result['stats'].round(2).to_excel(writer, sheet_name=_sheet_name("رقمي", label, used))
+        for label, table in analytics['dates'].items():
+            table.to_excel(writer, sheet_name=_sheet_name("تاريخ", label, used))
+    return path
+
+def artifact_file_path(report_type: str, survey_id: Optional[int], governorate_id: Optional[int],
+                       version: int) -> str:
+    scope = f"gov{governorate_id}" if governorate_id is not None else "national"
+    if survey_id is not None:
+        scope += f"_survey{survey_id}"
+    directory = REPORTS_DIR / report_type
+    directory.mkdir(parents=True, exist_ok=True)
+    return str(directory / f"{scope}_v{version}.xlsx")
+
+def generate_report(report_type: str, survey_id: Optional[int], governorate_id: Optional[int],
+                    force: bool = False) -> Optional[Dict]:
+    """
+    إنشاء إصدار جديد من التقرير إذا تغيرت بياناته منذ آخر إصدار (أو عند force).
+    يرجع None إذا لم تتغير البيانات.
+    """
+    survey_ids = [survey_id] if survey_id is not None else matrix_survey_ids(governorate_id)
+    data_version = report_data_version(survey_ids)
+    latest = get_latest_report_artifact(report_type, survey_id, governorate_id)
+    if latest and not force and latest['data_version'] == data_version and os.path.exists(latest['file_path']):
+        return None
+
+    version = (latest['version'] if latest else 0) + 1
+    path = artifact_file_path(report_type, survey_id, governorate_id, version)
+    tmp_path = path[:-len(".xlsx")] + ".partial.xlsx"
+    try:
+        if report_type == 'governorate_workbook':
+            build_survey_workbook(survey_id, {'governorate_id': governorate_id}, tmp_path)
+        elif report_type == 'completion_matrix':
+            build_completion_matrix(governorate_id, survey_ids, tmp_path)
+        else:
+            build_analytics_summary(survey_id, governorate_id, tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    add_report_artifact(report_type, survey_id, governorate_id, path, os.path.getsize(path), data_version)
+    return {'report_type': report_type, 'survey_id': survey_id, 'governorate_id': governorate_id,
+            'version': version, 'file_path': path}
+
+def run_scheduled_reports(force: bool = False, progress: Optional[ReportProgress] = None) -> Dict:
+    """تشغيل جميع التقارير المخططة مرة واحدة ثم حذف الإصدارات القديمة"""
+    progress = progress or _noop_progress
+    plan = planned_reports()
+    result = {'generated': 0, 'unchanged': 0, 'failed': [], 'removed': 0}
+    for done, (report_type, survey_id, governorate_id) in enumerate(plan, start=1):
+        try:
+            if generate_report(report_type, survey_id, governorate_id, force):
+                result['generated'] += 1
+            else:
+                result['unchanged'] += 1
+        except Exception as e:  # فشل تقرير واحد لا يوقف بقية التقارير
+            result['failed'].append(f"{report_type} (استبيان {survey_id}، محافظة {governorate_id}): {e}")
+        progress(done, len(plan), f"{REPORT_TYPES[report_type]} - استبيان {survey_id or '-'} - محافظة {governorate_id or 'الكل'}")
+
+    for path in prune_report_artifacts(REPORT_KEEP_VERSIONS):
+        if os.path.exists(path):
+            os.remove(path)
+            result['removed'] += 1
+    return result
+
+def seconds_until(at: str, now: Optional[datetime] = None) -> float:
+    """عدد الثواني حتى الموعد اليومي التالي بالصيغة HH:MM"""
+    now = now or datetime.now()
+    hour, minute = (int(part) for part in at.split(":"))
+    next_run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if next_run <= now:
+        next_run += timedelta(days=1)
+    return (next_run - now).total_seconds()
+
+def run_daemon(at: str = REPORT_SCHEDULE_AT, progress: Optional[ReportProgress] = None,
+               on_finished: Optional[Callable[[Dict], None]] = None):
+    """خدمة محلية تشغل التقارير يومياً في الموعد المحدد حتى إيقافها"""
+    while True:
+        time.sleep(seconds_until(at))
+        result = run_scheduled_reports(progress=progress)
+        if on_finished:
+            on_finished(result)
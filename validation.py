@@ -0,0 +1,358 @@
+"""
+محرك جودة البيانات: قواعد لكل حقل (المدى، الخيارات المسموحة، حدود التاريخ، الاتساق مع حقل آخر،
+القيم الشاذة) تُنفذ متجهةً بـ pandas على كل إجابات الاستبيان أو على الإجابات الجديدة والمعدلة فقط،
+وتُخزن ملاحظاتها في ValidationFindings لتصفية الإجابات في صفحة عرض البيانات.
+"""
+from __future__ import annotations
+import json
+import time
+import sqlite3
+from datetime import date
+from typing import Dict, List
+from lazy_imports import LazyModule
+from database import DATABASE_PATH, SQL_VARIABLES_CHUNK, TYPED_FIELD_COLUMNS, BOOL_TEXT_VALUES
+
+np = LazyModule("numpy")
+pd = LazyModule("pandas")
+
+RULE_TYPES = {
+    'type': "نوع القيمة",
+    'range': "المدى المسموح",
+    'options': "الخيارات المسموحة",
+    'date_range': "حدود التاريخ",
+    'compare': "الاتساق مع حقل آخر",
+    'outlier': "قيمة شاذة",
+}
+# القواعد التي يضيفها المستخدم وأنواع الحقول التي تنطبق عليها
+# (قاعدة النوع وخيارات القوائم المنسدلة تُطبق تلقائياً على كل حقل)
+RULE_FIELD_TYPES = {
+    'range': ('number',),
+    'options': ('dropdown', 'text'),
+    'date_range': ('date',),
+    'compare': ('number', 'date'),
+    'outlier': ('number',),
+}
+SEVERITIES = {'error': "خطأ", 'warning': "تحذير"}
+COMPARE_OPERATORS = {'<': 'lt', '<=': 'le', '>': 'gt', '>=': 'ge', '==': 'eq', '!=': 'ne'}
+OUTLIER_METHODS = {'iqr': 1.5, 'zscore': 3.0}
+FINDING_COLUMNS = ['response_id', 'field_id', 'rule_type', 'rule_id', 'severity', 'message', 'value']
+
+ANSWERS_QUERY = '''
+    SELECT rd.response_id, rd.field_id, rd.answer_value, rd.answer_number, rd.answer_date
+    FROM Response_Details rd
+    JOIN Responses r ON rd.response_id = r.response_id
+    WHERE r.survey_id = ? AND rd.field_id IN ({fields})
+      AND (r.response_id > ? AND r.response_id <= ? OR r.response_id IN ({queued}))
+'''
+# الإجابات المعدلة بعد آخر تشغيل حتى رقم تسلسلي محدد (تُعاد إضافتها إن تغيرت أثناء التشغيل)
+QUEUED_QUERY = "SELECT response_id FROM ValidationQueue WHERE survey_id = ? AND seq <= ?"
+
+def get_survey_field_types(conn, survey_id: int) -> Dict[int, tuple]:
+    """{field_id: (العنوان، النوع، الخيارات)} لحقول الاستبيان"""
+    return {field_id: (label, field_type, options) for field_id, label, field_type, options in conn.execute(
+        "SELECT field_id, field_label, field_type, field_options FROM Survey_Fields WHERE survey_id = ?",
+        (survey_id,)
+    )}
+
+def check_rule_params(rule_type: str, field_type: str, params: Dict, fields: Dict[int, tuple]) -> Dict:
+    """التحقق من معاملات القاعدة وإرجاعها بعد التنظيف (ValueError عند الخطأ)"""
+    if rule_type not in RULE_FIELD_TYPES:
+        raise ValueError(f"نوع قاعدة غير معروف: {rule_type}")
+    if field_type not in RULE_FIELD_TYPES[rule_type]:
+        raise ValueError(f"قاعدة {RULE_TYPES[rule_type]} لا تنطبق على حقول من نوع {field_type}")
+    if rule_type == 'range':
+        bounds = {k: float(params[k]) for k in ('min', 'max') if params.get(k) not in (None, "")}
+        if not bounds or bounds.get('min', float('-inf')) > bounds.get('max', float('inf')):
+            raise ValueError("حدد حداً أدنى أو أقصى صحيحاً")
+        return bounds
+    if rule_type == 'date_range':
+        bounds = {}
+        for key in ('min', 'max'):
+            value = params.get(key)
+            if value in (None, ""):
+                continue
+            bounds[key] = value if value == 'today' else date.fromisoformat(str(value)[:10]).isoformat()
+        if not bounds:
+            raise ValueError("حدد تاريخاً أدنى أو أقصى")
+        return bounds
+    if rule_type == 'options':
+        options = [str(option) for option in params.get('options', []) if str(option).strip()]
+        if not options:
+            raise ValueError("حدد الخيارات المسموحة")
+        return {'options': options}
+    if rule_type == 'compare':
+        other = fields.get(int(params.get('other_field_id', 0)))
+        if not other or other[1] != field_type:
+            raise ValueError("الحقل المقارن يجب أن يكون من نفس نوع الحقل وفي نفس الاستبيان")
+        if params.get('op') not in COMPARE_OPERATORS:
+            raise ValueError(f"عامل مقارنة غير معروف: {params.get('op')}")
+        return {'other_field_id': int(params['other_field_id']), 'op': params['op']}
+    method = params.get('method', 'iqr')
+    if method not in OUTLIER_METHODS:
+        raise ValueError(f"طريقة غير معروفة لكشف القيم الشاذة: {method}")
+    return {'method': method, 'threshold': float(params.get('threshold') or OUTLIER_METHODS[method])}
+
+def add_validation_rule(survey_id: int, field_id: int, rule_type: str, params: Dict,
+                        severity: str = 'warning') -> int:
+    """إضافة قاعدة جودة لحقل وإرجاع معرفها"""
+    if severity not in SEVERITIES:
+        raise ValueError(f"درجة غير معروفة: {severity}")
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        fields = get_survey_field_types(conn, survey_id)
+        if field_id not in fields:
+            raise ValueError("الحقل غير موجود في الاستبيان")
+        params = check_rule_params(rule_type, fields[field_id][1], params, fields)
+        rule_id = conn.execute(
+            "INSERT INTO ValidationRules (survey_id, field_id, rule_type, params, severity) VALUES (?, ?, ?, ?, ?)",
+            (survey_id, field_id, rule_type, json.dumps(params, ensure_ascii=False), severity)
+        ).lastrowid
+        conn.commit()
+        return rule_id
+    finally:
+        conn.close()
+
+def delete_validation_rule(rule_id: int):
+    """حذف قاعدة وملاحظاتها"""
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        conn.execute("DELETE FROM ValidationFindings WHERE rule_id = ?", (rule_id,))
+        conn.execute("DELETE FROM ValidationRules WHERE rule_id = ?", (rule_id,))
+        conn.commit()
+    finally:
+        conn.close()
+
+def get_validation_rules(survey_id: int) -> List[Dict]:
+    """قواعد الاستبيان المضافة مع عناوين حقولها"""
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        rows = conn.execute('''
+            SELECT vr.rule_id, vr.field_id, sf.field_label, vr.rule_type, vr.params, vr.severity
+            FROM ValidationRules vr
+            JOIN Survey_Fields sf ON vr.field_id = sf.field_id
+            WHERE vr.survey_id = ? AND vr.is_active = 1
+            ORDER BY sf.field_order, vr.rule_id
+        ''', (survey_id,)).fetchall()
+    finally:
+        conn.close()
+    return [{'rule_id': rule_id, 'field_id': field_id, 'field_label': label, 'rule_type': rule_type,
+             'params': json.loads(params), 'severity': severity}
+            for rule_id, field_id, label, rule_type, params, severity in rows]
+
+def implicit_rules(fields: Dict[int, tuple]) -> List[Dict]:
+    """قواعد تُطبق دون إعداد: قيمة قابلة للتحويل لنوع الحقل، وقيمة من خيارات القائمة المنسدلة"""
+    rules = []
+    for field_id, (_, field_type, options) in fields.items():
+        if field_type in TYPED_FIELD_COLUMNS:
+            rules.append({'rule_id': None, 'field_id': field_id, 'rule_type': 'type',
+                          'params': {}, 'severity': 'error'})
+        elif field_type == 'dropdown' and options:
+            rules.append({'rule_id': None, 'field_id': field_id, 'rule_type': 'options',
+                          'params': {'options': json.loads(options)}, 'severity': 'error'})
+    return rules
+
+def _findings(rows, rule: Dict, message: str):
+    """إطار ملاحظات لصفوف الإجابات المخالفة لقاعدة واحدة"""
+    return pd.DataFrame({
+        'response_id': rows['response_id'].to_numpy(),
+        'field_id': rule['field_id'],
+        'rule_type': rule['rule_type'],
+        'rule_id': rule['rule_id'],
+        'severity': rule['severity'],
+        'message': message,
+        'value': rows['answer_value'].to_numpy(),
+    }, columns=FINDING_COLUMNS)
+
+def evaluate_rule(rule: Dict, answers, field_type: str, by_field: Dict, population=None):
+    """
+    تنفيذ قاعدة واحدة على إجابات حقلها دفعة واحدة وإرجاع إطار الملاحظات.
+    by_field: {field_id: إجابات الحقل} للقواعد التي تقارن بحقل آخر، population: قيم الحقل
+    الرقمية كلها لحساب حدود القيم الشاذة عند التحقق من الإجابات الجديدة فقط.
+    """
+    params = rule['params']
+    rule_type = rule['rule_type']
+    text = answers['answer_value']
+    has_text = text.notna() & (text != "")
+
+    if rule_type == 'type':
+        if field_type == 'checkbox':
+            # answer_bool غير محمل هنا: النصوص المقبولة هي مفاتيح BOOL_TEXT_VALUES
+            mask = has_text & ~text.str.strip().str.lower().isin(list(BOOL_TEXT_VALUES))
+        else:
+            mask = has_text & answers[TYPED_FIELD_COLUMNS[field_type]].isna()
+        return _findings(answers[mask], rule, f"القيمة ليست من نوع {field_type}")
+
+    if rule_type == 'options':
+        mask = has_text & ~text.isin(params['options'])
+        return _findings(answers[mask], rule, "القيمة ليست من الخيارات المسموحة")
+
+    if rule_type == 'range':
+        values = answers['answer_number']
+        mask = pd.Series(False, index=answers.index)
+        if 'min' in params:
+            mask |= values < params['min']
+        if 'max' in params:
+            mask |= values > params['max']
+        return _findings(answers[mask], rule, f"خارج المدى المسموح ({params.get('min', '-∞')} - {params.get('max', '∞')})")
+
+    if rule_type == 'date_range':
+        days = answers['answer_date']
+        bounds = {k: (date.today().isoformat() if v == 'today' else v) for k, v in params.items()}
+        mask = pd.Series(False, index=answers.index)
+        # التواريخ مخزنة بصيغة ISO فتكفي المقارنة النصية
+        if 'min' in bounds:
+            mask |= days.notna() & (days < bounds['min'])
+        if 'max' in bounds:
+            mask |= days.notna() & (days > bounds['max'])
+        return _findings(answers[mask], rule, f"خارج حدود التاريخ ({bounds.get('min', '')} - {bounds.get('max', '')})")
+
+    if rule_type == 'compare':
+        column = TYPED_FIELD_COLUMNS[field_type]
+        other = by_field.get(params['other_field_id'])
+        if other is None or other.empty:
+            return _findings(answers.iloc[0:0], rule, "")
+        joined = answers[['response_id', 'answer_value', column]].merge(
+            other[['response_id', column]].rename(columns={column: 'other'}), on='response_id')
+        joined = joined[joined[column].notna() & joined['other'].notna()]
+        holds = getattr(joined[column], COMPARE_OPERATORS[params['op']])(joined['other'])
+        return _findings(joined[~holds], rule, f"يجب أن تكون {params['op']} قيمة الحقل {params['other_field_id']}")
+
+    # القيم الشاذة: خارج Q1 - k×IQR .. Q3 + k×IQR أو أبعد من z انحرافاً معيارياً عن المتوسط
+    values = answers['answer_number']
+    population = values.dropna().to_numpy() if population is None else population
+    if len(population) < 4:
+        return _findings(answers.iloc[0:0], rule, "")
+    if params['method'] == 'iqr':
+        q1, q3 = np.percentile(population, [25, 75])
+        low, high = q1 - params['threshold'] * (q3 - q1), q3 + params['threshold'] * (q3 - q1)
+    else:
+        mean, std = population.mean(), population.std()
+        if std == 0:
+            return _findings(answers.iloc[0:0], rule, "")
+        low, high = mean - params['threshold'] * std, mean + params['threshold'] * std
+    mask = (values < low) | (values > high)
+    return _findings(answers[mask], rule, f"قيمة شاذة (المعتاد {low:g} - {high:g})")
+
+def load_answers(conn, survey_id: int, field_ids: List[int], after_response_id: int, last_response_id: int,
+                 queued_seq: int = 0):
+    """
+    إجابات الحقول المطلوبة باستعلام واحد: الإجابات في نطاق المعرفات والإجابات المعدلة في
+    ValidationQueue حتى الرقم التسلسلي queued_seq
+    """
+    answers = pd.read_sql_query(
+        ANSWERS_QUERY.format(fields=",".join("?" * len(field_ids)), queued=QUEUED_QUERY), conn,
+        params=[survey_id] + field_ids + [after_response_id, last_response_id, survey_id, queued_seq]
+    )
+    answers['answer_number'] = answers['answer_number'].astype('float64')
+    return answers
+
+def field_population(conn, field_id: int):
+    """كل القيم الرقمية لحقل (من فهرس الحقل والقيمة الرقمية) لحساب حدود القيم الشاذة"""
+    return np.array([row[0] for row in conn.execute(
+        "SELECT answer_number FROM Response_Details WHERE field_id = ? AND answer_number IS NOT NULL",
+        (field_id,)
+    )], dtype='float64')
+
+def run_validation(survey_id: int, incremental: bool = False) -> Dict:
+    """
+    تنفيذ قواعد الاستبيان على جميع إجاباته (استبدال الملاحظات السابقة) أو على الإجابات الجديدة
+    منذ آخر تشغيل والإجابات التي تغيرت تفاصيلها بعده فقط (تُستبدل ملاحظاتها)، وتخزين الملاحظات.
+    يرجع ملخص التشغيل.
+    """
+    started = time.perf_counter()
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        fields = get_survey_field_types(conn, survey_id)
+        rules = implicit_rules(fields) + [rule for rule in get_validation_rules(survey_id)]
+        run = conn.execute("SELECT last_response_id FROM ValidationRuns WHERE survey_id = ?",
+                           (survey_id,)).fetchone()
+        after = run[0] if incremental and run else 0
+        # الإجابات التي تصل أثناء التشغيل تُترك للتشغيل التالي
+        last = conn.execute("SELECT COALESCE(MAX(response_id), 0) FROM Responses WHERE survey_id = ?",
+                            (survey_id,)).fetchone()[0]
+        queued = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM ValidationQueue WHERE survey_id = ?",
+                              (survey_id,)).fetchone()[0]
+        # التشغيل الكامل يفحص كل الإجابات فلا حاجة لقائمة المعدلة (لكنها تُفرغ بعده)
+        queued_seq = queued if after else 0
+
+        field_ids = sorted({rule['field_id'] for rule in rules}
+                           | {rule['params']['other_field_id'] for rule in rules if rule['rule_type'] == 'compare'})
+        answers = (load_answers(conn, survey_id, field_ids, after, last, queued_seq)
+                   if field_ids and (last > after or queued_seq) else None)
+        frames = []
+        if answers is not None and not answers.empty:
+            by_field = {field_id: answers.iloc[positions]
+                        for field_id, positions in answers.groupby('field_id', sort=False).indices.items()}
+            for rule in rules:
+                field_answers = by_field.get(rule['field_id'])
+                if field_answers is None:
+                    continue
+                population = (field_population(conn, rule['field_id'])
+                              if rule['rule_type'] == 'outlier' and after else None)
+                frames.append(evaluate_rule(rule, field_answers, fields[rule['field_id']][1], by_field, population))
+        findings = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=FINDING_COLUMNS)
+
+        with conn:
+            conn.execute(f'''
+                DELETE FROM ValidationFindings
+                WHERE survey_id = ? AND (response_id > ? OR response_id IN ({QUEUED_QUERY}))
+            ''', (survey_id, after, survey_id, queued_seq))
+            conn.execute("DELETE FROM ValidationQueue WHERE survey_id = ? AND seq <= ?", (survey_id, queued))
+            records = findings.astype(object).where(findings.notna(), None).itertuples(index=False, name=None)
+            conn.executemany(
+                """INSERT INTO ValidationFindings
+                   (survey_id, response_id, field_id, rule_type, rule_id, severity, message, value)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                ((survey_id,) + record for record in records)
+            )
+            checked = 0 if answers is None else len(answers)
+            conn.execute('''
+                INSERT INTO ValidationRuns (survey_id, last_response_id, answers_checked, findings)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(survey_id) DO UPDATE SET last_response_id = excluded.last_response_id,
+                    answers_checked = excluded.answers_checked, findings = excluded.findings,
+                    run_at = CURRENT_TIMESTAMP
+            ''', (survey_id, last, checked, len(findings)))
+        return {'answers': checked, 'findings': len(findings), 'incremental': bool(after),
+                'seconds': time.perf_counter() - started}
+    finally:
+        conn.close()
+
+def get_validation_summary(survey_id: int) -> Dict:
+    """آخر تشغيل للتحقق وعدد الملاحظات لكل حقل ونوع قاعدة ودرجة"""
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        run = conn.execute(
+            "SELECT run_at, answers_checked, last_response_id FROM ValidationRuns WHERE survey_id = ?",
+            (survey_id,)
+        ).fetchone()
+        counts = conn.execute('''
+            SELECT sf.field_label, vf.rule_type, vf.severity, COUNT(*), COUNT(DISTINCT vf.response_id)
+            FROM ValidationFindings vf
+            JOIN Survey_Fields sf ON vf.field_id = sf.field_id
+            WHERE vf.survey_id = ?
+            GROUP BY sf.field_order, sf.field_label, vf.rule_type, vf.severity
+            ORDER BY sf.field_order
+        ''', (survey_id,)).fetchall()
+    finally:
+        conn.close()
+    return {'run': run, 'counts': counts}
+
+def get_response_findings(response_ids: List[int]) -> Dict[int, List[tuple]]:
+    """ملاحظات عدة إجابات: {response_id: [(عنوان الحقل، نوع القاعدة، الدرجة، الرسالة، القيمة)]}"""
+    result = {}
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        for start in range(0, len(response_ids), SQL_VARIABLES_CHUNK):
+            chunk = response_ids[start:start + SQL_VARIABLES_CHUNK]
+            for response_id, *finding in conn.execute(f'''
+                SELECT vf.response_id, sf.field_label, vf.rule_type, vf.severity, vf.message, vf.value
+                FROM ValidationFindings vf
+                JOIN Survey_Fields sf ON vf.field_id = sf.field_id
+                WHERE vf.response_id IN ({",".join("?" * len(chunk))})
+                ORDER BY sf.field_order
+            ''', chunk):
+                result.setdefault(response_id, []).append(tuple(finding))
+        return result
+    finally:
+        conn.close()